@@ -0,0 +1,180 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from database import DB_CONFIG, DB_POOL_CONFIG, EXPLAIN_SAVEPOINT, serialize_row, serialize_rows
+from query_stats import record_query, log_slow_query, QUERY_EXPLAIN_SLOW
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_async_pool: Optional[AsyncConnectionPool] = None
+
+
+def _conninfo() -> str:
+    """Build a libpq connection string from DB_CONFIG"""
+    return make_conninfo(
+        host=DB_CONFIG['host'],
+        port=DB_CONFIG['port'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        dbname=DB_CONFIG['database']
+    )
+
+
+async def init_async_pool() -> AsyncConnectionPool:
+    """Open the process-wide async connection pool"""
+    global _async_pool
+    if _async_pool is None:
+        pool = AsyncConnectionPool(
+            _conninfo(),
+            min_size=DB_POOL_CONFIG['min_size'],
+            max_size=DB_POOL_CONFIG['max_size'],
+            timeout=DB_POOL_CONFIG['timeout'],
+            max_lifetime=DB_POOL_CONFIG['max_lifetime'],
+            check=AsyncConnectionPool.check_connection,
+            kwargs={'row_factory': dict_row, 'autocommit': False},
+            open=False,
+            name="rail_sathi_async"
+        )
+        await pool.open()
+        _async_pool = pool
+        logger.info("Async database pool opened")
+    return _async_pool
+
+
+async def close_async_pool():
+    """Close the async connection pool"""
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+        logger.info("Async database pool closed")
+
+
+def get_async_pool_stats() -> Dict:
+    """Get async pool metrics"""
+    if _async_pool is None:
+        return {}
+    return _async_pool.get_stats()
+
+
+@asynccontextmanager
+async def get_async_db_connection():
+    """Borrow a connection; commits on success and rolls back on error"""
+    pool = await init_async_pool()
+    async with pool.connection() as connection:
+        yield connection
+
+
+async def explain_query(connection, query: str, params: Tuple = None) -> str:
+    """Plain EXPLAIN of a statement on the caller's connection (does not run it)"""
+    async with connection.cursor() as cursor:
+        try:
+            await cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            await cursor.execute("EXPLAIN " + query, params)
+            plan = "\n".join(next(iter(row.values())) for row in await cursor.fetchall())
+            await cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            return plan
+        except Exception as e:
+            await cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            return f"EXPLAIN failed: {str(e)}"
+
+
+async def _observe(connection, query: str, params, started: float, rows: Optional[int]):
+    """Record a finished statement; log it (and its plan) if it was slow"""
+    elapsed = time.perf_counter() - started
+    if record_query(query, elapsed, rows):
+        plan = await explain_query(connection, query, params) if QUERY_EXPLAIN_SLOW else None
+        log_slow_query(query, params, elapsed, rows, plan)
+
+
+def _log_failure(kind: str, query: str, params, started: float, error: Exception):
+    record_query(query, time.perf_counter() - started, failed=True)
+    logger.error(f"{kind} execution failed: {str(error)}")
+    logger.error(f"Query: {query}")
+    logger.error(f"Params: {params}")
+
+
+async def execute_query(connection, query: str, params: Tuple = None, serialize: bool = True) -> List[Dict]:
+    """Execute a SELECT query and return results
+
+    serialize=False keeps dates/datetimes as Python objects, for callers
+    that encode the rows themselves.
+    """
+    started = time.perf_counter()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            results = await cursor.fetchall()
+    except Exception as e:
+        _log_failure("Query", query, params, started, e)
+        raise
+    await _observe(connection, query, params, started, len(results))
+    return serialize_rows(results) if serialize else results
+
+
+async def execute_query_one(connection, query: str, params: Tuple = None, serialize: bool = True) -> Optional[Dict]:
+    """Execute a SELECT query and return single result (see execute_query)"""
+    started = time.perf_counter()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            result = await cursor.fetchone()
+    except Exception as e:
+        _log_failure("Query", query, params, started, e)
+        raise
+    await _observe(connection, query, params, started, 1 if result else 0)
+    return serialize_row(result) if serialize else result
+
+
+async def execute_insert(connection, query: str, params: Tuple = None) -> int:
+    """Execute an INSERT query and return last insert ID"""
+    started = time.perf_counter()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            # This assumes the query includes RETURNING id or similar
+            if 'RETURNING' in query.upper():
+                result = await cursor.fetchone()
+                inserted = next(iter(result.values())) if result else None
+            else:
+                inserted = cursor.rowcount
+            rows = cursor.rowcount
+    except Exception as e:
+        _log_failure("Insert", query, params, started, e)
+        raise
+    await _observe(connection, query, params, started, rows)
+    return inserted
+
+
+async def execute_update(connection, query: str, params: Tuple = None) -> int:
+    """Execute an UPDATE query and return affected rows"""
+    started = time.perf_counter()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            rows = cursor.rowcount
+    except Exception as e:
+        _log_failure("Update", query, params, started, e)
+        raise
+    await _observe(connection, query, params, started, rows)
+    return rows
+
+
+async def execute_delete(connection, query: str, params: Tuple = None) -> int:
+    """Execute a DELETE query and return affected rows"""
+    started = time.perf_counter()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            rows = cursor.rowcount
+    except Exception as e:
+        _log_failure("Delete", query, params, started, e)
+        raise
+    await _observe(connection, query, params, started, rows)
+    return rows
@@ -0,0 +1,498 @@
+"""End-to-end HTTP load benchmark of the complaint API
+
+Starts the app under uvicorn against the Postgres named by POSTGRES_* (the
+same variables the app reads), with local filesystem storage in place of GCS
+and an in-process SMTP sink in place of the mail server. Replays a weighted
+mix of complaint/add (text only, with an image, with a video), complaint/get,
+complaint/get/date and train_details from a fixed number of concurrent
+clients, then reports RPS, p50/p95/p99 latency and peak RSS of the server and
+its child processes (uvicorn workers, transcoder pool, ffmpeg).
+
+Results are written as JSON; pass a previous result with --compare to flag
+throughput, latency or memory regressions (exit status 1).
+
+The run writes real complaints (and media rows) into the database: point it
+at a scratch database, seeded for example with benchmarks/seed_dataset.py.
+
+Usage: python benchmarks/bench_load.py [--profile mixed] [--duration 30] [--concurrency 16]
+           [--workers 1] [--output benchmarks/results] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, date
+from typing import Dict, List, Optional, Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import psycopg2
+import imageio_ffmpeg
+from PIL import Image
+from database import DB_CONFIG
+from smtp_sink import SMTPSink
+
+# The app modules configure INFO logging; one line per request drowns the report
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+API = '/rs_microservice'
+
+# Relative weights of each scenario; scenarios whose fixtures cannot be
+# built (e.g. no ffmpeg for the video) are dropped from the mix
+PROFILES = {
+    'mixed': {'add': 10, 'add_image': 5, 'add_video': 1, 'get': 40, 'get_date': 20, 'train_details': 24},
+    'read_heavy': {'add': 3, 'add_image': 1, 'get': 50, 'get_date': 25, 'train_details': 21},
+    'write_heavy': {'add': 50, 'add_image': 30, 'add_video': 5, 'get': 10, 'get_date': 5},
+    'media': {'add_image': 80, 'add_video': 20},
+}
+
+# Relative change beyond which --compare reports a regression
+DEFAULT_TOLERANCE = 0.10
+# Scenarios with fewer measured requests than this in either run are too noisy to compare
+MIN_COMPARE_REQUESTS = 100
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_samples(limit: int = 1000) -> Dict[str, list]:
+    """Existing ids, (date, mobile) pairs and train numbers to read back"""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT complain_id FROM rail_sathi_railsathicomplain ORDER BY complain_id DESC LIMIT %s",
+                       (limit,))
+        complaint_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT complain_date, mobile_number FROM rail_sathi_railsathicomplain
+            WHERE complain_date IS NOT NULL AND mobile_number IS NOT NULL
+            ORDER BY complain_id DESC LIMIT %s
+        """, (limit,))
+        date_mobiles = [(row[0].isoformat(), row[1]) for row in cursor.fetchall()]
+        cursor.execute("SELECT train_no FROM trains_traindetails WHERE train_no IS NOT NULL LIMIT %s", (limit,))
+        train_numbers = [str(row[0]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return {'complaint_ids': complaint_ids, 'date_mobiles': date_mobiles, 'train_numbers': train_numbers}
+
+
+def make_image(path: str, width: int = 1600, height: int = 1200):
+    """A photo-sized JPEG with enough detail that it does not compress to nothing"""
+    image = Image.effect_noise((width // 4, height // 4), 64).convert('RGB').resize((width, height))
+    image.save(path, 'JPEG', quality=90)
+
+
+def make_video(path: str, seconds: int = 4) -> bool:
+    """A short 720p H.264 clip; returns False if ffmpeg cannot produce one"""
+    result = subprocess.run([
+        imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-b:v', '4M', path,
+    ], capture_output=True, text=True)
+    return result.returncode == 0 and os.path.exists(path)
+
+
+class ProcessTreeMonitor:
+    """Samples the summed RSS of a process and its descendants from /proc"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_server = 0
+        self.peak_total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-monitor', daemon=True)
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f'/proc/{pid}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def _descendants(self) -> List[int]:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    # The command name may contain spaces; ppid follows its closing paren
+                    ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        found, stack = [], [self.pid]
+        while stack:
+            for child in children.get(stack.pop(), []):
+                found.append(child)
+                stack.append(child)
+        return found
+
+    def _run(self):
+        while not self._stop.is_set():
+            server = self._rss(self.pid)
+            total = server + sum(self._rss(pid) for pid in self._descendants())
+            self.peak_server = max(self.peak_server, server)
+            self.peak_total = max(self.peak_total, total)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if os.path.isdir('/proc'):
+            self._thread.start()
+
+    def stop(self) -> Dict[str, Optional[int]]:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            return {'server': self.peak_server, 'total': self.peak_total}
+        return {'server': None, 'total': None}
+
+
+class AppServer:
+    """The app under uvicorn in a subprocess, with benchmark stand-ins configured"""
+
+    def __init__(self, port: int, smtp_port: int, workdir: str, workers: int = 1):
+        self.port = port
+        self.workers = workers
+        self.log_path = os.path.join(workdir, 'server.log')
+        self.env = dict(
+            os.environ,
+            STORAGE_BACKEND='local',
+            LOCAL_STORAGE_DIR=os.path.join(workdir, 'storage'),
+            MEDIA_SPOOL_DIR=os.path.join(workdir, 'spool'),
+            MAIL_SERVER='127.0.0.1',
+            MAIL_PORT=str(smtp_port),
+            MAIL_STARTTLS='false',
+            MAIL_SSL_TLS='false',
+            USE_CREDENTIALS='false',
+            VALIDATE_CERTS='false',
+            MAIL_USERNAME=os.getenv('MAIL_USERNAME', 'bench'),
+            MAIL_PASSWORD=os.getenv('MAIL_PASSWORD', 'bench'),
+            MAIL_FROM=os.getenv('MAIL_FROM', 'bench@example.com'),
+        )
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60):
+        self._log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--workers', str(self.workers), '--log-level', 'warning'],
+            cwd=ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.process.returncode}, see {self.log_path}")
+            try:
+                if httpx.get(f'http://127.0.0.1:{self.port}/health', timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"Server did not become healthy within {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if getattr(self, '_log', None):
+            self._log.close()
+
+
+class Scenarios:
+    """Builds one request per scenario name"""
+
+    def __init__(self, samples: Dict[str, list], image: Optional[bytes], video: Optional[bytes], seed: int):
+        self.samples = samples
+        self.image = image
+        self.video = video
+        self.random = random.Random(seed)
+        self.train_numbers = samples['train_numbers'] or ['12345']
+
+    def available(self, name: str) -> bool:
+        if name == 'add_image':
+            return self.image is not None
+        if name == 'add_video':
+            return self.video is not None
+        if name in ('get', 'get_date'):
+            # Fed by complaints created during warm-up if the table starts empty
+            return True
+        return name in ('add', 'train_details')
+
+    def _form(self) -> Dict[str, str]:
+        n = self.random.randrange(10 ** 6)
+        return {
+            'name': f'Bench {n}',
+            'mobile_number': f'9{n:09d}',
+            'pnr_number': f'{n:010d}',
+            'complain_type': self.random.choice(['cleanliness', 'water', 'electrical', 'catering']),
+            'complain_description': 'Coach not cleaned since departure. ' * 4,
+            'complain_date': date.today().isoformat(),
+            'date_of_journey': date.today().isoformat(),
+            'train_number': self.random.choice(self.train_numbers),
+            'coach': f'S{self.random.randint(1, 12)}',
+            'berth_no': str(self.random.randint(1, 72)),
+        }
+
+    def build(self, name: str) -> Dict[str, Any]:
+        if name == 'add':
+            return {'method': 'POST', 'url': f'{API}/complaint/add', 'data': self._form()}
+        if name == 'add_image':
+            return {'method': 'POST', 'url': f'{API}/complaint/add', 'data': self._form(),
+                    'files': [('rail_sathi_complain_media_files', ('photo.jpg', self.image, 'image/jpeg'))]}
+        if name == 'add_video':
+            return {'method': 'POST', 'url': f'{API}/complaint/add', 'data': self._form(),
+                    'files': [('rail_sathi_complain_media_files', ('clip.mp4', self.video, 'video/mp4'))]}
+        if name == 'get':
+            complaint_id = self.random.choice(self.samples['complaint_ids'] or [1])
+            return {'method': 'GET', 'url': f'{API}/complaint/get/{complaint_id}'}
+        if name == 'get_date':
+            complain_date, mobile = self.random.choice(self.samples['date_mobiles'] or [(date.today().isoformat(), '9000000000')])
+            return {'method': 'GET', 'url': f'{API}/complaint/get/date/{complain_date}',
+                    'params': {'mobile_number': mobile}}
+        if name == 'train_details':
+            return {'method': 'GET', 'url': f'{API}/train_details/{self.random.choice(self.train_numbers)}'}
+        raise ValueError(f"Unknown scenario: {name}")
+
+    def remember(self, name: str, request: Dict[str, Any], response: httpx.Response):
+        """Feed created complaints back into the read scenarios"""
+        if name.startswith('add') and response.status_code == 200:
+            complaint = response.json().get('data') or {}
+            if complaint.get('complain_id'):
+                self.samples['complaint_ids'].append(complaint['complain_id'])
+                self.samples['date_mobiles'].append((request['data']['complain_date'], request['data']['mobile_number']))
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Counts, throughput and nearest-rank percentiles in milliseconds"""
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000, 2)
+
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': round(len(ordered) / elapsed, 2) if elapsed else 0,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else None,
+    }
+
+
+async def run_load(base_url: str, scenarios: Scenarios, mix: Dict[str, int], duration: float,
+                   warmup: float, concurrency: int, timeout: float) -> Dict[str, Any]:
+    """Closed-loop load: each client sends its next request when the last one returns"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = {name: {'latencies': [], 'errors': 0, 'statuses': {}} for name in names}
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def client(http: httpx.AsyncClient):
+        while True:
+            now = loop.time()
+            if now >= stop_at:
+                return
+            name = scenarios.random.choices(names, weights)[0]
+            request = scenarios.build(name)
+            sent = time.perf_counter()
+            try:
+                response = await http.request(**request)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            latency = time.perf_counter() - sent
+            if response is not None:
+                scenarios.remember(name, request, response)
+            if now < measure_from:
+                continue
+            result = results[name]
+            result['statuses'][str(status)] = result['statuses'].get(str(status), 0) + 1
+            if response is not None and status < 400:
+                result['latencies'].append(latency)
+            else:
+                result['errors'] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    # Requests in flight at stop_at finish late; count them against the real window
+    elapsed = loop.time() - measure_from
+
+    summary = {}
+    for name, result in results.items():
+        summary[name] = summarize(result['latencies'], result['errors'], elapsed)
+        summary[name]['statuses'] = result['statuses']
+    all_latencies = [latency for result in results.values() for latency in result['latencies']]
+    overall = summarize(all_latencies, sum(result['errors'] for result in results.values()), elapsed)
+    return {'overall': overall, 'scenarios': summary, 'elapsed': round(elapsed, 3)}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of current against baseline beyond the relative tolerance"""
+    regressions = []
+
+    def check(label: str, metric: str, now, before, higher_is_worse: bool):
+        if not now or not before:
+            return
+        change = (now - before) / before
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        marker = 'REGRESSION' if worse else ''
+        print(f"  {label:<16} {metric:<10} {before:>12} -> {now:>12} ({change:+.1%}) {marker}")
+        if worse:
+            regressions.append(f"{label} {metric} {change:+.1%}")
+
+    print(f"Compared with {baseline.get('git_commit')} at {baseline.get('timestamp')}:")
+    pairs = [('overall', current['overall'], baseline.get('overall', {}))]
+    pairs += [(name, stats, baseline.get('scenarios', {}).get(name, {}))
+              for name, stats in current['scenarios'].items()]
+    for label, now, before in pairs:
+        if min(now.get('requests') or 0, before.get('requests') or 0) < MIN_COMPARE_REQUESTS:
+            print(f"  {label:<16} skipped, fewer than {MIN_COMPARE_REQUESTS} requests")
+            continue
+        check(label, 'rps', now.get('rps'), before.get('rps'), higher_is_worse=False)
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(label, metric, now.get(metric), before.get(metric), higher_is_worse=True)
+    for key in ('server', 'total'):
+        check('peak_rss', key, current['peak_rss_bytes'].get(key),
+              baseline.get('peak_rss_bytes', {}).get(key), higher_is_worse=True)
+    return regressions
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\n{'scenario':<16}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(result['scenarios'].items()) + [('overall', result['overall'])]
+    for name, stats in rows:
+        print(f"{name:<16}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10}"
+              f"{stats['p50_ms'] or '-':>10}{stats['p95_ms'] or '-':>10}{stats['p99_ms'] or '-':>10}")
+    rss = result['peak_rss_bytes']
+    if rss['server'] is not None:
+        print(f"\nPeak RSS: server {rss['server'] / 2 ** 20:.1f} MiB, "
+              f"with children {rss['total'] / 2 ** 20:.1f} MiB")
+    print(f"Emails accepted by the SMTP sink: {result['emails_sent']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='mixed')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before the run')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results'),
+                        help='directory for the JSON result')
+    parser.add_argument('--compare', help='previous result JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='relative change reported as a regression')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='rail_sathi_bench_')
+    image = video = None
+    image_path = os.path.join(workdir, 'photo.jpg')
+    make_image(image_path)
+    with open(image_path, 'rb') as f:
+        image = f.read()
+    video_path = os.path.join(workdir, 'clip.mp4')
+    if make_video(video_path):
+        with open(video_path, 'rb') as f:
+            video = f.read()
+    else:
+        print("Could not generate a test video; skipping the add_video scenario")
+
+    scenarios = Scenarios(load_samples(), image, video, args.seed)
+    mix = {name: weight for name, weight in PROFILES[args.profile].items() if scenarios.available(name)}
+
+    sink = SMTPSink()
+    smtp_port = sink.start()
+    server = AppServer(free_port(), smtp_port, workdir, args.workers)
+    print(f"Starting server on port {server.port} (logs: {server.log_path})")
+    server.start()
+    monitor = ProcessTreeMonitor(server.process.pid)
+    monitor.start()
+    try:
+        print(f"Running {args.profile} for {args.warmup:g}s warm-up + {args.duration:g}s "
+              f"with {args.concurrency} clients: {mix}")
+        load = asyncio.run(run_load(f'http://127.0.0.1:{server.port}', scenarios, mix, args.duration,
+                                    args.warmup, args.concurrency, args.timeout))
+    finally:
+        peak_rss = monitor.stop()
+        server.stop()
+        sink.stop()
+
+    result = {
+        'benchmark': 'bench_load',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'profile': args.profile, 'mix': mix, 'duration': args.duration, 'warmup': args.warmup,
+                   'concurrency': args.concurrency, 'workers': args.workers, 'seed': args.seed,
+                   'image_bytes': len(image) if image else None, 'video_bytes': len(video) if video else None},
+        **load,
+        'peak_rss_bytes': peak_rss,
+        'emails_sent': sink.messages,
+    }
+    print_report(result)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_path = os.path.join(
+        args.output, f"load-{args.profile}-{datetime.now():%Y%m%d-%H%M%S}-{result['git_commit'] or 'unknown'}.json"
+    )
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('profile') != args.profile:
+            print(f"Warning: baseline used profile {baseline.get('config', {}).get('profile')}")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compare the legacy and fast JSON paths of the complaint list endpoints
+
+Legacy: serialize_row (datetimes to ISO strings) -> RailSathiComplainResponse
+(parses them back) -> jsonable_encoder -> json.dumps, as FastAPI did it.
+Fast: native rows -> ResponseEncoder (validate + pydantic-core JSON).
+
+Usage: python benchmarks/bench_serialization.py [--complaints 200] [--media 3] [--rounds 50]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, date, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from database import serialize_rows
+from fast_json import ResponseEncoder
+from main import RailSathiComplainResponse
+
+
+def make_rows(complaints: int, media: int) -> List[dict]:
+    """Rows shaped like COMPLAINT_SELECT_QUERY results with native types"""
+    now = datetime.now()
+    rows = []
+    for i in range(complaints):
+        created = now - timedelta(minutes=i)
+        rows.append({
+            'complain_id': i + 1, 'pnr_number': '8524109637', 'is_pnr_validated': 'not-attempted',
+            'name': f'Passenger {i}', 'mobile_number': '9876543210', 'complain_type': 'cleanliness',
+            'complain_description': 'Coach not cleaned since departure. ' * 3,
+            'complain_date': date.today(), 'complain_status': 'pending', 'train_id': 7,
+            'train_number': '12565', 'train_name': 'Bihar Sampark Kranti', 'coach': 'S4', 'berth_no': 42,
+            'created_at': created, 'created_by': f'Passenger {i}', 'updated_at': created, 'updated_by': None,
+            'train_no': '12565', 'train_depot': 'DBG',
+            # json_build_object output arrives as already-decoded JSON
+            'rail_sathi_complain_media_files': [{
+                'id': i * media + j, 'media_type': 'image',
+                'media_url': f'https://storage.googleapis.com/bucket/rail_sathi_complain_images/{i}_{j}.jpg',
+                'variants': {'thumbnail': {'url': f'https://storage.googleapis.com/bucket/{i}_{j}_thumbnail.jpg',
+                                           'width': 320, 'height': 240}},
+                'created_at': created.isoformat(), 'updated_at': created.isoformat(),
+                'created_by': f'Passenger {i}', 'updated_by': None,
+            } for j in range(media)],
+        })
+    return rows
+
+
+def legacy_path(rows):
+    models = [RailSathiComplainResponse(message="Complaint retrieved successfully", data=row)
+              for row in serialize_rows(rows)]
+    return json.dumps(jsonable_encoder(models), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+list_encoder = ResponseEncoder(List[RailSathiComplainResponse])
+
+
+def fast_path(rows):
+    return list_encoder.encode([{"message": "Complaint retrieved successfully", "data": row} for row in rows])
+
+
+def measure(func, rows, rounds):
+    func(rows)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(rows)
+    elapsed = (time.perf_counter() - started) / rounds
+
+    # Peak Python heap used while building one response
+    tracemalloc.start()
+    func(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'us_per_complaint': round(elapsed * 1e6 / len(rows), 2),
+        'ms_per_response': round(elapsed * 1e3, 3),
+        'peak_alloc_bytes': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--complaints', type=int, default=200)
+    parser.add_argument('--media', type=int, default=3, help="media files per complaint")
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.complaints, args.media)
+    if json.loads(legacy_path(rows)) != json.loads(fast_path(rows)):
+        sys.exit("Fast path output differs from the legacy path")
+
+    results = {
+        'complaints': args.complaints,
+        'media_per_complaint': args.media,
+        'legacy': measure(legacy_path, rows, args.rounds),
+        'fast': measure(fast_path, rows, args.rounds),
+    }
+    results['speedup'] = round(results['legacy']['us_per_complaint'] / results['fast']['us_per_complaint'], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
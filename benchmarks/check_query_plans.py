@@ -0,0 +1,383 @@
+"""Query-plan regression checks for the service's SQL
+
+Runs EXPLAIN (ANALYZE, BUFFERS) on every statement the API issues, with
+parameters taken from the data (seed it first with seed_dataset.py), and
+flags:
+
+- sequential scans reading more than --seq-scan-rows rows, unless the
+  statement is expected to read the whole table
+- with --baseline, planner cost or buffer usage grown by more than
+  --tolerance since that run, and plans whose shape changed
+
+Writes never persist: each statement runs in a transaction that is rolled
+back. The statement catalogue mirrors services.py and the modules its
+endpoints and email notifications call into (complaint_search.py,
+recipient_cache.py, train_cache.py); string literals in those files that
+look like SQL but match no catalogued statement are reported, so a new
+query cannot slip past unchecked.
+
+Exit status is 1 if anything was flagged.
+
+Usage: python benchmarks/check_query_plans.py [--baseline previous.json] [--seq-scan-rows 10000]
+           [--tolerance 0.25] [--only complaint_by_id] [--output benchmarks/results]
+"""
+import os
+import re
+import ast
+import sys
+import json
+import argparse
+import subprocess
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, NamedTuple, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, Json
+from database import DB_CONFIG
+from query_stats import fingerprint
+from services import COMPLAINT_SELECT_QUERY, COMPLAINT_INSERT_COLUMNS, complaint_write_query
+from complaint_search import build_search_query, SEARCH_MEDIA_QUERY
+from recipient_cache import ROLE_USERS_QUERY, TRAIN_ACCESS_QUERY, RECIPIENT_ROLES
+from train_cache import DEPOT_HIERARCHY_QUERY, TRAIN_CACHE_MAX_SIZE
+
+# Files whose SQL literals must all be covered by the catalogue. main.py and
+# utils/email_utils.py run their queries through services.py and
+# recipient_cache.py; they are scanned so a query added back there is caught.
+CHECKED_MODULES = [
+    'services.py', 'main.py', 'utils/email_utils.py', 'recipient_cache.py',
+    'train_cache.py', 'complaint_search.py',
+]
+
+DEFAULT_SEQ_SCAN_ROWS = 10000
+DEFAULT_TOLERANCE = 0.25
+
+_SQL_LITERAL_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\s')
+# str.format fields ({source}) and f-string expressions; a literal '{}' in SQL is left alone
+_PLACEHOLDER_RE = re.compile(r'\{[A-Za-z_]\w*\}|\x00')
+
+
+class Statement(NamedTuple):
+    name: str
+    source: str
+    query: str
+    params: Tuple
+    # Tables this statement is expected to read in full (e.g. cache loads)
+    full_scans: Tuple[str, ...] = ()
+
+
+def load_samples(conn) -> Dict[str, Any]:
+    """Parameter values that exist in the data, preferring busy trains"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("""
+        SELECT id AS media_id, complain_id, content_hash, media_type
+        FROM rail_sathi_railsathicomplainmedia ORDER BY id DESC LIMIT 1
+    """)
+    media = cursor.fetchone() or {}
+    cursor.execute("""
+        SELECT c.complain_id, c.complain_date, c.mobile_number, c.train_number, c.train_id, c.created_at,
+               t."Depot" AS depot
+        FROM rail_sathi_railsathicomplain c
+        LEFT JOIN trains_traindetails t ON t.id = c.train_id
+        WHERE c.complain_id = coalesce(%s, (SELECT max(complain_id) FROM rail_sathi_railsathicomplain))
+    """, (media.get('complain_id'),))
+    complaint = cursor.fetchone()
+    if not complaint:
+        raise SystemExit("No complaints found; seed the database with benchmarks/seed_dataset.py first")
+    cursor.execute("SELECT max(created_at) AS newest FROM rail_sathi_railsathicomplain")
+    newest = cursor.fetchone()['newest']
+    conn.rollback()
+    return {**complaint, **media, 'newest': newest}
+
+
+def catalogue(samples: Dict[str, Any]) -> List[Statement]:
+    """Every statement with representative parameters"""
+    complain_id = samples['complain_id']
+    now = datetime.now()
+    insert_values = {
+        'pnr_number': '1234567890', 'is_pnr_validated': 'not-attempted', 'name': 'Plan Check',
+        'mobile_number': samples['mobile_number'], 'complain_type': 'cleanliness',
+        'complain_description': 'Plan check', 'complain_date': samples['complain_date'],
+        'complain_status': 'pending', 'train_id': samples['train_id'], 'train_number': samples['train_number'],
+        'train_name': None, 'coach': 'S1', 'berth_no': 1, 'created_by': 'Plan Check',
+        'created_at': now, 'updated_at': now,
+    }
+    insert_query = f"""
+            INSERT INTO rail_sathi_railsathicomplain
+            ({', '.join(COMPLAINT_INSERT_COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(COMPLAINT_INSERT_COLUMNS))})
+            RETURNING *
+        """
+    update_query = """
+            UPDATE rail_sathi_railsathicomplain
+            SET complain_status = %s, updated_at = %s
+            WHERE complain_id = %s
+            RETURNING *
+        """
+    date_from = (samples['newest'] - timedelta(days=30)).date()
+    older_page = (samples['created_at'], complain_id)
+
+    statements = [
+        # services.py
+        Statement('complaint_by_id', 'services.py', COMPLAINT_SELECT_QUERY + " WHERE c.complain_id = %s",
+                  (complain_id,)),
+        Statement('complaints_by_date', 'services.py',
+                  COMPLAINT_SELECT_QUERY + " WHERE c.complain_date = %s AND c.mobile_number = %s",
+                  (samples['complain_date'], samples['mobile_number'])),
+        Statement('complaint_insert', 'services.py', complaint_write_query(insert_query),
+                  tuple(insert_values[column] for column in COMPLAINT_INSERT_COLUMNS)),
+        Statement('complaint_update', 'services.py', complaint_write_query(update_query),
+                  ('in_progress', now, complain_id)),
+        Statement('complaint_access', 'services.py', """
+            SELECT created_by, mobile_number, complain_status
+            FROM rail_sathi_railsathicomplain
+            WHERE complain_id = %s
+            FOR UPDATE
+        """, (complain_id,)),
+        Statement('media_insert', 'services.py', """
+            INSERT INTO rail_sathi_railsathicomplainmedia
+            (complain_id, media_type, media_url, variants, content_hash, created_by, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (complain_id, 'image', 'https://example.com/plan.jpg', Json({}), None, 'Plan Check', now, now)),
+        # Upload helpers that record media without variants
+        Statement('media_insert_plain', 'services.py', """
+                    INSERT INTO rail_sathi_railsathicomplainmedia
+                    (complain_id, media_type, media_url, created_by, created_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (complain_id, 'image', 'https://example.com/plan.jpg', 'Plan Check', now, now)),
+        Statement('media_by_content_hash', 'services.py', """
+            SELECT id, complain_id, media_url, variants
+            FROM rail_sathi_railsathicomplainmedia
+            WHERE content_hash = %s AND media_type = %s AND media_url IS NOT NULL
+            ORDER BY (complain_id = %s) DESC, id
+            LIMIT 1
+        """, (samples.get('content_hash') or '', samples.get('media_type') or 'image', complain_id)),
+        Statement('media_delete_by_ids', 'services.py', """
+            DELETE FROM rail_sathi_railsathicomplainmedia
+            WHERE complain_id = %s AND id = ANY(%s)
+        """, (complain_id, [samples.get('media_id') or 0])),
+        Statement('media_delete_by_complaint', 'services.py',
+                  "DELETE FROM rail_sathi_railsathicomplainmedia WHERE complain_id = %s", (complain_id,)),
+        Statement('complaint_delete', 'services.py',
+                  "DELETE FROM rail_sathi_railsathicomplain WHERE complain_id = %s", (complain_id,)),
+
+        # complaint_search.py (GET complaint/search)
+        Statement('search_latest', 'complaint_search.py', *build_search_query(limit=51)),
+        Statement('search_train_number', 'complaint_search.py',
+                  *build_search_query(train_number=samples['train_number'], limit=51)),
+        Statement('search_depot', 'complaint_search.py', *build_search_query(depot=samples['depot'], limit=51)),
+        Statement('search_status_since', 'complaint_search.py',
+                  *build_search_query(status='pending', date_from=date_from, limit=51)),
+        Statement('search_next_page', 'complaint_search.py',
+                  *build_search_query(train_number=samples['train_number'], after=older_page, limit=51)),
+        Statement('search_media', 'complaint_search.py', SEARCH_MEDIA_QUERY,
+                  (list(range(complain_id, complain_id - 50, -1)),)),
+
+        # recipient_cache.py (email recipients, loaded once per TTL)
+        Statement('recipient_role_users', 'recipient_cache.py', ROLE_USERS_QUERY, (RECIPIENT_ROLES,),
+                  full_scans=('user_onboarding_user', 'user_onboarding_roles')),
+        Statement('recipient_train_access', 'recipient_cache.py', TRAIN_ACCESS_QUERY, (),
+                  full_scans=('user_onboarding_user', 'trains_trainaccess')),
+
+        # train_cache.py
+        Statement('train_by_number', 'train_cache.py',
+                  "SELECT * FROM trains_traindetails WHERE train_no = %s", (samples['train_number'],)),
+        Statement('train_by_id', 'train_cache.py',
+                  "SELECT * FROM trains_traindetails WHERE id = %s", (samples['train_id'],)),
+        Statement('depot_hierarchy_by_code', 'train_cache.py',
+                  DEPOT_HIERARCHY_QUERY + " WHERE d.depot_code = %s LIMIT 1", (samples['depot'],),
+                  full_scans=('station_division', 'station_zone')),
+        Statement('depot_hierarchy_all', 'train_cache.py', DEPOT_HIERARCHY_QUERY, (),
+                  full_scans=('station_depot', 'station_division', 'station_zone')),
+        Statement('train_cache_warm', 'train_cache.py',
+                  "SELECT * FROM trains_traindetails ORDER BY id LIMIT %s", (TRAIN_CACHE_MAX_SIZE,),
+                  full_scans=('trains_traindetails',)),
+    ]
+    return statements
+
+
+def explain(conn, statement: Statement) -> Dict[str, Any]:
+    """EXPLAIN (ANALYZE, BUFFERS) in a transaction that is always rolled back"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement.query, statement.params or None)
+        return cursor.fetchone()[0][0]
+    finally:
+        conn.rollback()
+
+
+def walk(node: Dict[str, Any], depth: int = 0):
+    yield node, depth
+    for child in node.get('Plans', []):
+        yield from walk(child, depth + 1)
+
+
+def summarize(plan: Dict[str, Any]) -> Dict[str, Any]:
+    root = plan['Plan']
+    seq_scans = []
+    for node, _ in walk(root):
+        if node['Node Type'] == 'Seq Scan':
+            loops = node.get('Actual Loops', 1)
+            rows_read = (node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)) * loops
+            seq_scans.append({'relation': node.get('Relation Name'), 'rows_read': int(rows_read), 'loops': loops})
+    return {
+        'total_cost': root['Total Cost'],
+        'shared_blocks': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'execution_ms': round(plan.get('Execution Time', 0), 3),
+        'planning_ms': round(plan.get('Planning Time', 0), 3),
+        'rows': root.get('Actual Rows'),
+        'shape': [f"{node['Node Type']}:{node.get('Index Name') or node.get('Relation Name') or ''}"
+                  for node, _ in walk(root)],
+        'seq_scans': seq_scans,
+    }
+
+
+def render(plan: Dict[str, Any]) -> str:
+    """Compact indented tree of a JSON plan"""
+    lines = []
+    for node, depth in walk(plan['Plan']):
+        target = node.get('Index Name') or node.get('Relation Name') or ''
+        lines.append(
+            f"{'  ' * depth}-> {node['Node Type']} {target}".rstrip()
+            + f"  (rows={node.get('Actual Rows')} loops={node.get('Actual Loops')}"
+            + f" removed={node.get('Rows Removed by Filter', 0)} time={node.get('Actual Total Time')}ms)"
+        )
+    return '\n'.join(lines)
+
+
+def sql_literals(path: str):
+    """(line, text) of string literals and f-strings in a module that look like SQL
+
+    f-string expressions become a NUL placeholder so each literal part can be matched.
+    """
+    with open(os.path.join(ROOT, path)) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            text = node.value
+        elif isinstance(node, ast.JoinedStr):
+            text = ''.join(part.value if isinstance(part, ast.Constant) else '\x00' for part in node.values)
+        else:
+            continue
+        if _SQL_LITERAL_RE.match(text):
+            yield node.lineno, text
+
+
+def uncovered_literals(statements: List[Statement]) -> List[str]:
+    fingerprints = [fingerprint(statement.query) for statement in statements]
+    uncovered = []
+    for path in CHECKED_MODULES:
+        for lineno, text in sql_literals(path):
+            pieces = [fingerprint(piece) for piece in _PLACEHOLDER_RE.split(text) if piece.strip()]
+            if not any(all(piece in known for piece in pieces) for known in fingerprints):
+                uncovered.append(f"{path}:{lineno}: {fingerprint(text)[:100]}")
+    return uncovered
+
+
+def compare(name: str, current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    findings = []
+    for metric in ('total_cost', 'shared_blocks'):
+        before, now = baseline.get(metric), current[metric]
+        if before and now > before * (1 + tolerance):
+            findings.append(f"{name}: {metric} {before} -> {now} (+{(now - before) / before:.0%})")
+    if baseline.get('shape') and baseline['shape'] != current['shape']:
+        findings.append(f"{name}: plan changed\n      was: {' / '.join(baseline['shape'])}"
+                        f"\n      now: {' / '.join(current['shape'])}")
+    return findings
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seq-scan-rows', type=int, default=DEFAULT_SEQ_SCAN_ROWS,
+                        help='flag sequential scans reading at least this many rows')
+    parser.add_argument('--baseline', help='previous result JSON to compare costs and plans with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='relative cost or buffer growth reported as a regression')
+    parser.add_argument('--only', action='append', help='check only these statements (repeatable)')
+    parser.add_argument('--verbose', action='store_true', help='print every plan, not only flagged ones')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results'),
+                        help='directory for the JSON result')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('statements', {})
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        statements = catalogue(load_samples(conn))
+        if args.only:
+            statements = [statement for statement in statements if statement.name in args.only]
+
+        results = {}
+        findings = []
+        print(f"{'statement':<28}{'exec ms':>10}{'cost':>12}{'buffers':>10}  seq scans")
+        for statement in statements:
+            plan = explain(conn, statement)
+            summary = summarize(plan)
+            summary['source'] = statement.source
+            results[statement.name] = summary
+
+            flagged = [scan for scan in summary['seq_scans']
+                       if scan['rows_read'] >= args.seq_scan_rows and scan['relation'] not in statement.full_scans]
+            statement_findings = [
+                f"{statement.name}: sequential scan of {scan['relation']} read {scan['rows_read']} rows"
+                f" in {scan['loops']} loop(s)" for scan in flagged
+            ]
+            if statement.name in baseline:
+                statement_findings += compare(statement.name, summary, baseline[statement.name], args.tolerance)
+            findings += statement_findings
+
+            scans = ', '.join(f"{scan['relation']}({scan['rows_read']})" for scan in summary['seq_scans']) or '-'
+            print(f"{statement.name:<28}{summary['execution_ms']:>10}{summary['total_cost']:>12}"
+                  f"{summary['shared_blocks']:>10}  {scans}{'  FLAGGED' if statement_findings else ''}")
+            if statement_findings or args.verbose:
+                print(render(plan))
+    finally:
+        conn.close()
+
+    uncovered = uncovered_literals(statements) if not args.only else []
+
+    result = {
+        'benchmark': 'check_query_plans',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'database': DB_CONFIG['database'],
+        'seq_scan_rows': args.seq_scan_rows,
+        'statements': results,
+        'findings': findings,
+        'uncovered': uncovered,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    output_path = os.path.join(args.output, f"plans-{datetime.now():%Y%m%d-%H%M%S}-{result['git_commit'] or 'unknown'}.json")
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"\nWrote {output_path}")
+
+    if uncovered:
+        print(f"\n{len(uncovered)} SQL literal(s) not in the catalogue:")
+        for line in uncovered:
+            print(f"  {line}")
+    if findings:
+        print(f"\n{len(findings)} finding(s):")
+        for finding in findings:
+            print(f"  {finding}")
+    if findings or uncovered:
+        sys.exit(1)
+    print("\nNo sequential scans or regressions flagged")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+"""Seed a scratch Postgres with a synthetic dataset at production-like scale
+
+Creates the tables this service reads but does not own (trains, the
+zone/division/depot hierarchy, users, roles, train access) if they are
+missing, applies schema.py, then fills:
+
+- zones, divisions and depots, and trains spread over the depots
+- users with roles, and trains_trainaccess rows whose train_details JSON
+  assigns each user to many trains over several periods
+- complaints spread over --days, skewed towards busy trains, with
+  passengers (mobile numbers) filing more than one complaint
+- media rows attached to random complaints, images with variants
+
+Rows are generated inside Postgres (generate_series) in batches, so
+millions of complaints load in minutes without passing through Python.
+The reference data is only generated when trains_traindetails is empty
+(or with --truncate); otherwise complaints and media are appended using
+the existing trains.
+
+Connects with the POSTGRES_* variables the app uses.
+
+Usage: python benchmarks/seed_dataset.py [--complaints 2000000] [--media 300000] [--trains 5000]
+           [--users 20000] [--truncate]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2
+from psycopg2.extras import execute_values, Json
+from database import DB_CONFIG
+from schema import ensure_schema, ensure_indexes
+from recipient_cache import RECIPIENT_ROLES
+
+# Tables owned by the main application; created here only for a scratch database
+BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS station_zone (
+        zone_id SERIAL PRIMARY KEY,
+        zone_code TEXT,
+        zone_name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS station_division (
+        division_id SERIAL PRIMARY KEY,
+        division_code TEXT,
+        zone_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS station_depot (
+        id SERIAL PRIMARY KEY,
+        depot_code TEXT,
+        division_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS trains_traindetails (
+        id SERIAL PRIMARY KEY,
+        train_no TEXT,
+        train_name TEXT,
+        "Depot" TEXT,
+        created_at TIMESTAMP DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS user_onboarding_roles (
+        id SERIAL PRIMARY KEY,
+        name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS user_onboarding_user (
+        id SERIAL PRIMARY KEY,
+        email TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        depo TEXT,
+        user_type_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS trains_trainaccess (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER,
+        train_details JSONB
+    );
+    CREATE TABLE IF NOT EXISTS rail_sathi_railsathicomplain (
+        complain_id SERIAL PRIMARY KEY,
+        pnr_number TEXT,
+        is_pnr_validated TEXT,
+        name TEXT,
+        mobile_number TEXT,
+        complain_type TEXT,
+        complain_description TEXT,
+        complain_date DATE,
+        complain_status TEXT,
+        train_id INTEGER,
+        train_number TEXT,
+        train_name TEXT,
+        coach TEXT,
+        berth_no INTEGER,
+        created_at TIMESTAMP,
+        created_by TEXT,
+        updated_at TIMESTAMP,
+        updated_by TEXT
+    );
+    CREATE TABLE IF NOT EXISTS rail_sathi_railsathicomplainmedia (
+        id SERIAL PRIMARY KEY,
+        complain_id INTEGER,
+        media_type TEXT,
+        media_url TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        created_by TEXT,
+        updated_by TEXT
+    );
+"""
+
+SEEDED_TABLES = [
+    'rail_sathi_railsathicomplainmedia', 'rail_sathi_railsathicomplain', 'rail_sathi_media_job',
+    'rail_sathi_notification_outbox', 'trains_trainaccess', 'user_onboarding_user', 'user_onboarding_roles',
+    'trains_traindetails', 'station_depot', 'station_division', 'station_zone',
+]
+
+ZONES = [
+    ('CR', 'Central'), ('ER', 'Eastern'), ('ECR', 'East Central'), ('ECoR', 'East Coast'),
+    ('NR', 'Northern'), ('NCR', 'North Central'), ('NER', 'North Eastern'), ('NFR', 'Northeast Frontier'),
+    ('NWR', 'North Western'), ('SR', 'Southern'), ('SCR', 'South Central'), ('SER', 'South Eastern'),
+    ('SECR', 'South East Central'), ('SWR', 'South Western'), ('WR', 'Western'), ('WCR', 'West Central'),
+    ('KR', 'Konkan'),
+]
+OTHER_ROLES = ['passenger', 'tte', 'coach attendant', 'obhs supervisor', 'contractor']
+COMPLAINT_TYPES = ['cleanliness', 'water', 'electrical', 'catering', 'bedroll', 'security', 'medical', 'other']
+
+COMPLAINT_BATCH_QUERY = """
+    INSERT INTO rail_sathi_railsathicomplain (
+        pnr_number, is_pnr_validated, name, mobile_number, complain_type, complain_description,
+        complain_date, complain_status, train_id, train_number, train_name, coach, berth_no,
+        created_at, created_by, updated_at, updated_by
+    )
+    SELECT lpad(floor(random() * 1e10)::bigint::text, 10, '0'),
+           (ARRAY['not-attempted', 'validated', 'invalid'])[1 + floor(random() * 3)::int],
+           'Passenger ' || s.passenger,
+           '9' || lpad(s.passenger::text, 9, '0'),
+           (%(types)s::text[])[1 + floor(power(random(), 2) * %(type_count)s)::int],
+           repeat('Coach not cleaned since departure. ', 1 + floor(random() * 6)::int),
+           s.created_at::date,
+           CASE WHEN s.roll < 0.5 THEN 'pending' WHEN s.roll < 0.7 THEN 'in_progress'
+                WHEN s.roll < 0.95 THEN 'resolved' ELSE 'completed' END,
+           t.id, t.train_no, t.train_name,
+           (ARRAY['S', 'B', 'A', 'H', 'D'])[1 + floor(random() * 5)::int] || (1 + floor(random() * 12)::int),
+           1 + floor(random() * 72)::int,
+           s.created_at,
+           'Passenger ' || s.passenger,
+           CASE WHEN s.roll < 0.5 THEN s.created_at ELSE s.created_at + random() * interval '3 days' END,
+           CASE WHEN s.roll < 0.5 THEN NULL ELSE 'railway admin' END
+    FROM (
+        SELECT floor(random() * %(passengers)s)::int AS passenger,
+               %(now)s - random() * %(days)s * interval '1 day' AS created_at,
+               -- Busy trains get most complaints
+               (%(train_ids)s::int[])[1 + floor(power(random(), 2) * %(train_count)s)::int] AS train_id,
+               random() AS roll
+        FROM generate_series(1, %(batch)s)
+    ) s
+    JOIN trains_traindetails t ON t.id = s.train_id
+"""
+
+MEDIA_BATCH_QUERY = """
+    INSERT INTO rail_sathi_railsathicomplainmedia (
+        complain_id, media_type, media_url, variants, content_hash,
+        created_at, updated_at, created_by, updated_by
+    )
+    SELECT c.complain_id, m.media_type,
+           %(base_url)s || CASE WHEN m.media_type = 'image'
+               THEN 'rail_sathi_complain_images/' || m.token || '.jpg'
+               ELSE 'rail_sathi_complain_videos/' || m.token || '.mp4' END,
+           CASE WHEN m.media_type = 'image' THEN jsonb_build_object(
+               'thumbnail', jsonb_build_object('url', %(base_url)s || 'rail_sathi_complain_images/' || m.token || '_thumbnail.jpg',
+                                               'width', 320, 'height', 240),
+               'medium', jsonb_build_object('url', %(base_url)s || 'rail_sathi_complain_images/' || m.token || '_medium.jpg',
+                                            'width', 1280, 'height', 960)
+           ) END,
+           encode(sha256(m.token::bytea), 'hex'),
+           c.created_at, c.created_at, c.created_by, NULL
+    FROM (
+        SELECT %(low)s + floor(random() * %(span)s)::int AS complain_id,
+               CASE WHEN random() < 0.85 THEN 'image' ELSE 'video' END AS media_type,
+               md5(random()::text) AS token
+        FROM generate_series(1, %(batch)s)
+    ) m
+    JOIN rail_sathi_railsathicomplain c ON c.complain_id = m.complain_id
+"""
+
+
+def log(message: str):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def truncate(conn):
+    cursor = conn.cursor()
+    existing = [table for table in SEEDED_TABLES if _table_exists(cursor, table)]
+    cursor.execute(f"TRUNCATE {', '.join(existing)} RESTART IDENTITY")
+    conn.commit()
+    log(f"Truncated {len(existing)} tables")
+
+
+def _table_exists(cursor, table: str) -> bool:
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cursor.fetchone()[0]
+
+
+def seed_reference_data(conn, rng: random.Random, args):
+    """Zones, divisions, depots, trains, roles, users and train access"""
+    cursor = conn.cursor()
+    execute_values(cursor, "INSERT INTO station_zone (zone_code, zone_name) VALUES %s", ZONES)
+    cursor.execute("SELECT zone_id, zone_code FROM station_zone ORDER BY zone_id")
+    zones = cursor.fetchall()
+
+    divisions = [(f"{code}-DV{i + 1}", zone_id) for zone_id, code in zones for i in range(args.divisions_per_zone)]
+    rows = execute_values(cursor, "INSERT INTO station_division (division_code, zone_id) VALUES %s RETURNING division_id",
+                          divisions, fetch=True)
+    division_ids = [row[0] for row in rows]
+
+    depots = [(f"D{len(division_ids) * k + i:04d}", division_id)
+              for k in range(args.depots_per_division) for i, division_id in enumerate(division_ids)]
+    execute_values(cursor, "INSERT INTO station_depot (depot_code, division_id) VALUES %s", depots)
+    depot_codes = [code for code, _ in depots]
+    log(f"Seeded {len(zones)} zones, {len(division_ids)} divisions, {len(depot_codes)} depots")
+
+    # Large depots own many trains
+    depot_weights = [1 / (rank + 1) for rank in range(len(depot_codes))]
+    train_nos = [str(10001 + i) for i in range(args.trains)]
+    trains = [(train_no, f"{rng.choice(['Express', 'Mail', 'Superfast', 'Rajdhani', 'Shatabdi'])} {train_no}",
+               depot) for train_no, depot in zip(train_nos, rng.choices(depot_codes, depot_weights, k=args.trains))]
+    execute_values(cursor, 'INSERT INTO trains_traindetails (train_no, train_name, "Depot") VALUES %s', trains,
+                   page_size=1000)
+    log(f"Seeded {args.trains} trains")
+
+    roles = RECIPIENT_ROLES + OTHER_ROLES
+    rows = execute_values(cursor, "INSERT INTO user_onboarding_roles (name) VALUES %s RETURNING id, name",
+                          [(role,) for role in roles], fetch=True)
+    role_ids = {name: role_id for role_id, name in rows}
+    # A few per cent of users receive complaint notifications
+    role_weights = [1 if role in RECIPIENT_ROLES else 30 for role in roles]
+    users = [(f"user{i}@example.com", f"First{i}", f"Last{i}", rng.choice(depot_codes),
+              role_ids[role]) for i, role in enumerate(rng.choices(roles, role_weights, k=args.users))]
+    rows = execute_values(cursor, """
+        INSERT INTO user_onboarding_user (email, first_name, last_name, depo, user_type_id)
+        VALUES %s RETURNING id
+    """, users, page_size=1000, fetch=True)
+    user_ids = [row[0] for row in rows]
+    log(f"Seeded {len(user_ids)} users")
+
+    access_rows = []
+    today = date.today()
+    for user_id in rng.sample(user_ids, min(args.access_users, len(user_ids))):
+        train_details = {}
+        for train_no in rng.sample(train_nos, min(args.access_trains, len(train_nos))):
+            periods = []
+            start = today - timedelta(days=rng.randint(30, args.days))
+            for _ in range(rng.randint(1, 3)):
+                end = start + timedelta(days=rng.randint(7, 120))
+                periods.append({
+                    'origin_date': start.isoformat(),
+                    'end_date': '' if end > today else end.isoformat(),
+                })
+                start = end + timedelta(days=rng.randint(1, 60))
+            train_details[train_no] = periods
+        access_rows.append((user_id, Json(train_details)))
+    execute_values(cursor, "INSERT INTO trains_trainaccess (user_id, train_details) VALUES %s", access_rows,
+                   page_size=200)
+    conn.commit()
+    log(f"Seeded train access for {len(access_rows)} users, {args.access_trains} trains each")
+
+
+def seed_complaints(conn, args):
+    cursor = conn.cursor()
+    cursor.execute("SELECT array_agg(id ORDER BY id) FROM trains_traindetails")
+    train_ids = cursor.fetchone()[0]
+    cursor.execute("SELECT now()")
+    now = cursor.fetchone()[0]
+    params = {
+        'types': COMPLAINT_TYPES, 'type_count': len(COMPLAINT_TYPES),
+        'passengers': max(1, args.complaints // args.complaints_per_passenger),
+        'now': now, 'days': args.days, 'train_ids': train_ids, 'train_count': len(train_ids),
+    }
+    cursor.execute("SELECT coalesce(max(complain_id), 0) FROM rail_sathi_railsathicomplain")
+    low = cursor.fetchone()[0] + 1
+
+    done = 0
+    started = time.monotonic()
+    while done < args.complaints:
+        batch = min(args.batch_size, args.complaints - done)
+        cursor.execute(COMPLAINT_BATCH_QUERY, dict(params, batch=batch))
+        conn.commit()
+        done += batch
+        log(f"Complaints: {done}/{args.complaints} ({done / (time.monotonic() - started):.0f} rows/s)")
+
+    cursor.execute("SELECT coalesce(max(complain_id), 0) FROM rail_sathi_railsathicomplain")
+    high = cursor.fetchone()[0]
+    done = 0
+    while done < args.media and high >= low:
+        batch = min(args.batch_size, args.media - done)
+        cursor.execute(MEDIA_BATCH_QUERY, {
+            'base_url': args.media_base_url, 'low': low, 'span': high - low + 1, 'batch': batch,
+        })
+        conn.commit()
+        done += batch
+        log(f"Media: {done}/{args.media}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--complaints', type=int, default=2_000_000)
+    parser.add_argument('--media', type=int, default=300_000)
+    parser.add_argument('--trains', type=int, default=5000)
+    parser.add_argument('--divisions-per-zone', type=int, default=4)
+    parser.add_argument('--depots-per-division', type=int, default=5)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--access-users', type=int, default=5000, help='users with a trains_trainaccess row')
+    parser.add_argument('--access-trains', type=int, default=40, help='trains in each train_details JSON')
+    parser.add_argument('--complaints-per-passenger', type=int, default=4)
+    parser.add_argument('--days', type=int, default=730, help='complaints are spread over this many days')
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    parser.add_argument('--media-base-url', default='https://storage.googleapis.com/rail-sathi-bench/')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--truncate', action='store_true',
+                        help='empty every seeded table first (destroys their data)')
+    args = parser.parse_args()
+
+    log(f"Seeding {DB_CONFIG['database']} on {DB_CONFIG['host']}")
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(BASE_SCHEMA)
+        conn.commit()
+        ensure_schema()
+        if args.truncate:
+            truncate(conn)
+
+        # Same seed, same dataset: Python picks the reference data, setseed
+        # drives random() in the generated rows
+        rng = random.Random(args.seed)
+        cursor.execute("SELECT setseed(%s)", (rng.random() * 2 - 1,))
+        cursor.execute("SELECT count(*) FROM trains_traindetails")
+        if cursor.fetchone()[0] == 0:
+            seed_reference_data(conn, rng, args)
+        else:
+            log("Reusing existing trains, users and train access")
+
+        seed_complaints(conn, args)
+
+        # After the bulk insert, as the service builds them in the background
+        log("Building complaint search indexes")
+        ensure_indexes()
+
+        log("Analyzing")
+        conn.autocommit = True
+        for table in SEEDED_TABLES:
+            if _table_exists(cursor, table):
+                cursor.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+    log("Done")
+
+
+if __name__ == '__main__':
+    main()
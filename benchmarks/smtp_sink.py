@@ -0,0 +1,89 @@
+"""Minimal SMTP server that accepts and discards every message
+
+Stands in for the real mail server in load benchmarks so notification
+sending is exercised without delivering anything.
+
+Usage: python benchmarks/smtp_sink.py [--port 2525]
+"""
+import asyncio
+import argparse
+import threading
+from typing import Optional
+
+
+class SMTPSink:
+    """Plain-text SMTP (no TLS, no auth) on 127.0.0.1, counting messages"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.messages = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._started = threading.Event()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b"220 smtp-sink ready\r\n")
+        await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('latin-1').strip().upper()
+                if command.startswith(('EHLO', 'HELO')):
+                    writer.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+                elif command.startswith('DATA'):
+                    writer.write(b"354 end data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    while await reader.readline() not in (b".\r\n", b""):
+                        pass
+                    self.messages += 1
+                    writer.write(b"250 ok\r\n")
+                elif command.startswith('QUIT'):
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = asyncio.get_running_loop()
+        self._started.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        except asyncio.CancelledError:
+            # stop() closed the server
+            pass
+
+    def start(self) -> int:
+        """Serve from a daemon thread; returns the bound port"""
+        threading.Thread(target=lambda: asyncio.run(self.serve()), name='smtp-sink', daemon=True).start()
+        self._started.wait(10)
+        return self.port
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=2525)
+    args = parser.parse_args()
+    sink = SMTPSink(port=args.port)
+    print(f"SMTP sink listening on 127.0.0.1:{args.port}")
+    try:
+        asyncio.run(sink.serve())
+    except KeyboardInterrupt:
+        print(f"{sink.messages} messages over {sink.connections} connections")
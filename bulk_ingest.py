@@ -0,0 +1,164 @@
+import os
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Any, Tuple
+import orjson
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from psycopg2.extras import execute_values
+from database import UnitOfWork, unit_of_work
+from train_cache import get_train_by_id, get_train_by_number
+from services import prepare_complaint, complaint_notification_details, COMPLAINT_INSERT_COLUMNS
+from notification_outbox import enqueue_notifications, notification_dispatcher, EVENT_COMPLAINT_CREATED
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Most complaints accepted in one bulk request
+BULK_INGEST_MAX_ITEMS = int(os.getenv('BULK_INGEST_MAX_ITEMS', 1000))
+# Rows per INSERT statement
+BULK_INGEST_PAGE_SIZE = int(os.getenv('BULK_INGEST_PAGE_SIZE', 500))
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Items are checked against these up front: one row the database rejects
+# would fail the multi-row INSERT for the whole batch
+INT4_MAX = 2147483647
+SHORT_TEXT_MAX_LENGTH = 255
+DESCRIPTION_MAX_LENGTH = 5000
+
+BULK_INSERT_QUERY = f"""
+    INSERT INTO rail_sathi_railsathicomplain ({', '.join(COMPLAINT_INSERT_COLUMNS)})
+    VALUES %s
+    RETURNING complain_id
+"""
+
+
+class BulkIngestError(ValueError):
+    """Raised when a bulk body, or one NDJSON line of it, cannot be accepted"""
+
+
+class BulkComplaintItem(BaseModel):
+    """One complaint of a bulk request; same fields as the add endpoint"""
+    model_config = ConfigDict(extra='ignore')
+
+    # Echoed back in the item's result so the sender can match it up
+    client_ref: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    pnr_number: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    is_pnr_validated: Optional[str] = Field("not-attempted", max_length=SHORT_TEXT_MAX_LENGTH)
+    name: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    mobile_number: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    complain_type: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    date_of_journey: Optional[date] = None
+    complain_description: Optional[str] = Field(None, max_length=DESCRIPTION_MAX_LENGTH)
+    complain_date: Optional[date] = None
+    complain_status: str = Field("pending", max_length=SHORT_TEXT_MAX_LENGTH)
+    train_id: Optional[int] = Field(None, ge=1, le=INT4_MAX)
+    train_number: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    train_name: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    coach: Optional[str] = Field(None, max_length=SHORT_TEXT_MAX_LENGTH)
+    berth_no: Optional[int] = Field(None, ge=0, le=INT4_MAX)
+
+def parse_bulk_body(body: bytes, content_type: Optional[str] = None) -> List[Tuple[int, Any]]:
+    """Split a JSON array or NDJSON body into (index, item) pairs
+
+    A malformed NDJSON line becomes an (index, BulkIngestError) pair so the
+    other lines still go through; a malformed JSON array fails as a whole.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    stripped = body.lstrip()
+    if content_type not in NDJSON_CONTENT_TYPES and stripped.startswith(b'['):
+        try:
+            items = orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise BulkIngestError(f"Invalid JSON: {e}")
+        return list(enumerate(items))
+
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append((len(items), orjson.loads(line)))
+        except orjson.JSONDecodeError as e:
+            items.append((len(items), BulkIngestError(f"Invalid JSON: {e}")))
+    return items
+
+
+def _error_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in e['loc']) or 'item'}: {e['msg']}" for e in error.errors()]
+
+
+def _unknown_train_errors(item: BulkComplaintItem, conn) -> List[str]:
+    """Errors for a train_id/train_number that is not in the train table"""
+    if item.train_id:
+        if not get_train_by_id(item.train_id, conn):
+            return [f"train_id: Train {item.train_id} not found"]
+    elif item.train_number:
+        if not get_train_by_number(item.train_number, conn):
+            return [f"train_number: Train {item.train_number} not found"]
+    return []
+
+
+def ingest_complaints(items: List[Tuple[int, Any]], uow: Optional[UnitOfWork] = None) -> Dict[str, Any]:
+    """Validate and insert a batch of complaints
+
+    Valid items are inserted with multi-row INSERTs and their notifications
+    queued in one statement, all in the unit of work's transaction. Invalid
+    items are reported and skipped. Returns per-item results in input order.
+    """
+    if len(items) > BULK_INGEST_MAX_ITEMS:
+        raise BulkIngestError(f"At most {BULK_INGEST_MAX_ITEMS} complaints per request")
+
+    results = []
+    accepted = []
+    with unit_of_work(uow) as uow:
+        conn = uow.connection
+        for index, raw in items:
+            result = {'index': index, 'client_ref': raw.get('client_ref') if isinstance(raw, dict) else None}
+            results.append(result)
+            if isinstance(raw, BulkIngestError):
+                result.update(status='invalid', errors=[str(raw)])
+                continue
+            try:
+                item = BulkComplaintItem.model_validate(raw)
+            except ValidationError as e:
+                result.update(status='invalid', errors=_error_messages(e))
+                continue
+            errors = _unknown_train_errors(item, conn)
+            if errors:
+                result.update(status='invalid', errors=errors)
+                continue
+
+            complaint_data = item.model_dump(exclude={'client_ref'})
+            if item.date_of_journey:
+                complaint_data['date_of_journey'] = item.date_of_journey.isoformat()
+            complaint_data['created_by'] = item.name
+            # Train lookups hit the shared train cache; misses load on this connection
+            complaint_data, values, date_of_journey = prepare_complaint(complaint_data, conn)
+            accepted.append((result, complaint_data, values, date_of_journey))
+
+        if accepted:
+            cursor = conn.cursor()
+            # RETURNING rows come back in VALUES order
+            rows = execute_values(cursor, BULK_INSERT_QUERY, [values for _, _, values, _ in accepted],
+                                  page_size=BULK_INGEST_PAGE_SIZE, fetch=True)
+
+            notifications = []
+            for (result, complaint_data, _, date_of_journey), (complain_id,) in zip(accepted, rows):
+                result.update(status='created', complain_id=complain_id)
+                # Same depot the single add endpoint gets by joining on train_id
+                train = get_train_by_id(complaint_data.get('train_id'), conn) or {}
+                depot = train.get('Depot') or ''
+                notifications.append({
+                    'complain_id': complain_id,
+                    'payload': complaint_notification_details(complaint_data, complain_id, depot, date_of_journey),
+                    'train_no': complaint_data.get('train_number'),
+                    'depot': depot,
+                })
+            enqueue_notifications(cursor, EVENT_COMPLAINT_CREATED, notifications)
+            uow.after_commit(notification_dispatcher.wake)
+
+    created = sum(1 for r in results if r['status'] == 'created')
+    logger.info(f"Bulk ingest: {created} created, {len(results) - created} invalid")
+    return {'created': created, 'invalid': len(results) - created, 'results': results}
@@ -0,0 +1,97 @@
+import io
+import os
+import csv
+import uuid
+import logging
+from datetime import date
+from typing import Iterator, Optional
+from psycopg2.extras import RealDictCursor
+from database import get_db_connection
+from services import COMPLAINT_SELECT_QUERY
+from complaint_search import search_conditions
+from fast_json import dumps
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor per round trip; also the rows
+# encoded into each chunk of the response
+COMPLAINT_EXPORT_ITERSIZE = int(os.getenv('COMPLAINT_EXPORT_ITERSIZE', 2000))
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_COLUMNS = [
+    'complain_id', 'complain_date', 'complain_status', 'complain_type', 'complain_description',
+    'pnr_number', 'is_pnr_validated', 'name', 'mobile_number', 'train_id', 'train_number',
+    'train_name', 'train_depot', 'coach', 'berth_no', 'created_at', 'created_by',
+    'updated_at', 'updated_by', 'media_urls',
+]
+
+
+def build_export_query(train_number: Optional[str] = None, depot: Optional[str] = None,
+                       status: Optional[str] = None, complain_type: Optional[str] = None,
+                       date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Complaints with their media in submission order, same filters as search"""
+    conditions, params = search_conditions(train_number, status, complain_type, date_from, date_to)
+    if depot:
+        conditions.append('t."Depot" = %s')
+        params.append(depot)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return COMPLAINT_SELECT_QUERY + where + " ORDER BY c.created_at, c.complain_id", tuple(params)
+
+
+def _encode_ndjson(rows) -> bytes:
+    return b''.join(dumps(row) + b'\n' for row in rows)
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        media_urls = ' '.join(m['media_url'] for m in row['rail_sathi_complain_media_files'] if m.get('media_url'))
+        writer.writerow([media_urls if column == 'media_urls' else row.get(column) for column in CSV_COLUMNS])
+    return buffer.getvalue().encode('utf-8')
+
+
+def stream_complaints(export_format: str = 'ndjson', itersize: int = COMPLAINT_EXPORT_ITERSIZE,
+                      **filters) -> Iterator[bytes]:
+    """Yield the export as encoded chunks of at most `itersize` rows
+
+    Rows come from a named (server-side) cursor, so only one batch is held
+    in memory at a time whatever the size of the result. The connection is
+    held for as long as the export is being read.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    query, params = build_export_query(**filters)
+    encode = _encode_csv if export_format == 'csv' else _encode_ndjson
+
+    # Header first, so the client gets bytes before the query has run
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(CSV_COLUMNS)
+        yield buffer.getvalue().encode('utf-8')
+
+    conn = get_db_connection()
+    exported = 0
+    try:
+        cursor = conn.cursor(name=f"rail_sathi_export_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            exported += len(rows)
+            yield encode(rows)
+        cursor.close()
+    finally:
+        # Also reached when the client disconnects and the generator is closed
+        try:
+            conn.rollback()
+        finally:
+            conn.close()
+        logger.info(f"Exported {exported} complaints as {export_format}")
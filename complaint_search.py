@@ -0,0 +1,149 @@
+import os
+import json
+import base64
+from datetime import datetime, date, time, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+import async_database
+
+COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE = int(os.getenv('COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE', 50))
+COMPLAINT_SEARCH_MAX_PAGE_SIZE = int(os.getenv('COMPLAINT_SEARCH_MAX_PAGE_SIZE', 200))
+
+# Newest first; (created_at, complain_id) is unique and matches the
+# rail_sathi_complain_*_created_idx indexes in schema.py
+SEARCH_ORDER = "ORDER BY c.created_at DESC, c.complain_id DESC"
+
+SEARCH_MEDIA_QUERY = """
+    SELECT id, complain_id, media_type, media_url, variants,
+           created_at, updated_at, created_by, updated_by
+    FROM rail_sathi_railsathicomplainmedia
+    WHERE complain_id = ANY(%s)
+    ORDER BY complain_id, id
+"""
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after `row`"""
+    key = [row['created_at'].isoformat(), row['complain_id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, complain_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(complain_id)
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
+
+
+def search_conditions(train_number: Optional[str] = None, status: Optional[str] = None,
+                      complain_type: Optional[str] = None, date_from: Optional[date] = None,
+                      date_to: Optional[date] = None) -> Tuple[List[str], List[Any]]:
+    """WHERE conditions on complaint alias `c` and their parameters"""
+    conditions = []
+    params = []
+    if train_number:
+        conditions.append("c.train_number = %s")
+        params.append(train_number)
+    if status:
+        conditions.append("c.complain_status = %s")
+        params.append(status)
+    if complain_type:
+        conditions.append("c.complain_type = %s")
+        params.append(complain_type)
+    # The date range is on submission time so it stays within the index order
+    if date_from:
+        conditions.append("c.created_at >= %s")
+        params.append(datetime.combine(date_from, time.min))
+    if date_to:
+        conditions.append("c.created_at < %s")
+        params.append(datetime.combine(date_to + timedelta(days=1), time.min))
+    return conditions, params
+
+
+def build_search_query(train_number: Optional[str] = None, depot: Optional[str] = None,
+                       status: Optional[str] = None, complain_type: Optional[str] = None,
+                       date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       after: Optional[Tuple[datetime, int]] = None, limit: int = COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE):
+    """Build the keyset page query and its parameters
+
+    Every filter is an equality or a range on created_at, so each page is an
+    ordered index scan that stops after `limit` rows. A depot covers several
+    trains: each train is scanned through its own (train_id, created_at)
+    index range and the per-train pages are merged.
+    """
+    conditions, params = search_conditions(train_number, status, complain_type, date_from, date_to)
+    if after:
+        conditions.append("(c.created_at, c.complain_id) < (%s, %s)")
+        params.extend(after)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if depot:
+        source = f"""(
+            SELECT page.*
+            FROM trains_traindetails dt
+            CROSS JOIN LATERAL (
+                SELECT c.* FROM rail_sathi_railsathicomplain c
+                {where + ' AND' if where else 'WHERE'} c.train_id = dt.id
+                {SEARCH_ORDER}
+                LIMIT %s
+            ) page
+            WHERE dt."Depot" = %s
+        )"""
+        params.extend([limit, depot])
+        where = ""
+    else:
+        source = "rail_sathi_railsathicomplain"
+
+    query = f"""
+        SELECT c.*, t.train_no, t.train_name, t."Depot" as train_depot
+        FROM {source} c
+        LEFT JOIN trains_traindetails t ON c.train_id = t.id
+        {where}
+        {SEARCH_ORDER}
+        LIMIT %s
+    """
+    params.append(limit)
+    return query, tuple(params)
+
+
+async def search_complaints_async(train_number: Optional[str] = None, depot: Optional[str] = None,
+                                  status: Optional[str] = None, complain_type: Optional[str] = None,
+                                  date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                  cursor: Optional[str] = None,
+                                  limit: int = COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """One page of complaints matching every given filter, newest first
+
+    Returns {'complaints': [...], 'next_cursor': str or None}. Media files
+    for the whole page are fetched with one query.
+    """
+    limit = max(1, min(limit, COMPLAINT_SEARCH_MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether another page exists
+    query, params = build_search_query(train_number, depot, status, complain_type,
+                                       date_from, date_to, after, limit + 1)
+
+    async with async_database.get_async_db_connection() as conn:
+        complaints = await async_database.execute_query(conn, query, params, serialize=False)
+        has_more = len(complaints) > limit
+        complaints = complaints[:limit]
+
+        media_by_complaint = {}
+        if complaints:
+            media = await async_database.execute_query(
+                conn, SEARCH_MEDIA_QUERY, ([c['complain_id'] for c in complaints],), serialize=False
+            )
+            for item in media:
+                media_by_complaint.setdefault(item.pop('complain_id'), []).append(item)
+
+    for complaint in complaints:
+        complaint['rail_sathi_complain_media_files'] = media_by_complaint.get(complaint['complain_id'], [])
+
+    return {
+        'complaints': complaints,
+        'next_cursor': encode_cursor(complaints[-1]) if has_more else None,
+    }
@@ -1,11 +1,16 @@
 import os
+import time
 import logging
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.extensions
+from collections import deque
 from contextlib import contextmanager
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, date
 from dotenv import load_dotenv
+from query_stats import record_query, log_slow_query, QUERY_EXPLAIN_SLOW
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,18 +29,270 @@ DB_CONFIG = {
     'database': os.getenv('POSTGRES_DB', 'rail_sathi_db')
 }
 
-def get_db_connection():
-    """Get database connection"""
-    try:
+# Connection pool configuration
+DB_POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+    # Seconds to wait for a free connection before giving up
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    # Seconds after which a connection is closed and replaced
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+    # Idle seconds after which a connection is pinged before being handed out
+    'health_check_interval': float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+}
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the wait timeout"""
+
+
+class PooledConnection:
+    """Proxy around a psycopg2 connection that returns it to the pool on close()"""
+
+    def __init__(self, pool, connection, created_at):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_created_at', created_at)
+        object.__setattr__(self, '_released', False)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    @property
+    def closed(self):
+        return 1 if self._released else self._connection.closed
+
+    def close(self):
+        """Return the connection to the pool instead of closing it"""
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        self._pool.putconn(self._connection, self._created_at)
+
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of psycopg2 connections"""
+
+    def __init__(self, db_config: Dict, min_size: int, max_size: int, timeout: float,
+                 max_lifetime: float, health_check_interval: float):
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()  # (connection, created_at, last_used_at)
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._checked_out = 0
+        self._total_checkouts = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._exhaustion_events = 0
+        self._timeouts = 0
+        self._connections_created = 0
+        self._connections_discarded = 0
+
+    def _connect(self):
         connection = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
+            host=self.db_config['host'],
+            port=self.db_config['port'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            database=self.db_config['database']
         )
         connection.autocommit = False
+        with self._cond:
+            self._connections_created += 1
         return connection
+
+    def _discard(self, connection):
+        try:
+            if not connection.closed:
+                connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._connections_discarded += 1
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.max_lifetime > 0 and time.monotonic() - created_at > self.max_lifetime
+
+    def _is_healthy(self, connection) -> bool:
+        if connection.closed:
+            return False
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def warm(self):
+        """Open connections up to min_size"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                now = time.monotonic()
+                self._idle.append((connection, now, now))
+                self._cond.notify()
+
+    def getconn(self) -> PooledConnection:
+        """Check a connection out of the pool, waiting up to `timeout` seconds"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+        with self._cond:
+            counted_exhaustion = False
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not counted_exhaustion:
+                    self._exhaustion_events += 1
+                    counted_exhaustion = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s "
+                        f"(max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            if entry is not None:
+                connection, created_at, last_used_at = entry
+                stale = time.monotonic() - last_used_at > self.health_check_interval
+                if self._is_expired(created_at) or (stale and not self._is_healthy(connection)):
+                    self._discard(connection)
+                    entry = None
+            if entry is None:
+                connection = self._connect()
+                created_at = time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._checked_out += 1
+            self._total_checkouts += 1
+            self._total_wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+        return PooledConnection(self, connection, created_at)
+
+    def putconn(self, connection, created_at: float):
+        """Return a connection to the pool, resetting any open transaction"""
+        reusable = not connection.closed and not self._is_expired(created_at)
+        if reusable:
+            try:
+                status = connection.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            self._checked_out -= 1
+            if reusable and not self._closed:
+                self._idle.append((connection, created_at, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+
+        if not reusable or self._closed:
+            self._discard(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage metrics"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'max_size': self.max_size,
+                'total_checkouts': self._total_checkouts,
+                'total_wait_time': round(self._total_wait_time, 6),
+                'max_wait_time': round(self._max_wait_time, 6),
+                'exhaustion_events': self._exhaustion_events,
+                'timeouts': self._timeouts,
+                'connections_created': self._connections_created,
+                'connections_discarded': self._connections_discarded,
+            }
+
+    def close(self):
+        """Close all idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+    return _pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get connection pool metrics"""
+    return get_pool().stats()
+
+
+def close_pool():
+    """Close the connection pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_db_connection():
+    """Get a pooled database connection; close() returns it to the pool"""
+    try:
+        return get_pool().getconn()
     except Exception as e:
         logger.error(f"Database connection failed: {str(e)}")
         raise
@@ -57,6 +314,88 @@ def get_db_cursor():
         if connection:
             connection.close()
 
+
+class UnitOfWork:
+    """One pooled connection and transaction shared by everything a request calls
+
+    The connection is taken from the pool on first use. commit() ends the
+    transaction, returns the connection and runs the after-commit callbacks;
+    close() rolls back whatever was not committed.
+    """
+
+    def __init__(self):
+        self._connection = None
+        self._after_commit = []
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = get_db_connection()
+        return self._connection
+
+    def after_commit(self, callback):
+        """Run callback once the transaction has been committed"""
+        self._after_commit.append(callback)
+
+    def commit(self):
+        if self._connection is not None:
+            try:
+                self._connection.commit()
+            finally:
+                self._release()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {str(e)}")
+
+    def rollback(self):
+        self._after_commit = []
+        if self._connection is not None:
+            try:
+                self._connection.rollback()
+            finally:
+                self._release()
+
+    def close(self):
+        self.rollback()
+
+    def _release(self):
+        connection, self._connection = self._connection, None
+        connection.close()
+
+
+@contextmanager
+def unit_of_work(uow: Optional[UnitOfWork] = None):
+    """Use the caller's unit of work, or run a standalone one
+
+    A caller-supplied unit of work is yielded as is and the caller commits
+    it. Otherwise a new one is committed on success and rolled back on error.
+    """
+    if uow is not None:
+        yield uow
+        return
+    uow = UnitOfWork()
+    try:
+        yield uow
+        uow.commit()
+    finally:
+        uow.close()
+
+
+def get_unit_of_work():
+    """FastAPI dependency: a request-scoped unit of work
+
+    Dependency teardown runs after the response is sent, so endpoints must
+    commit() explicitly; teardown only rolls back and releases.
+    """
+    uow = UnitOfWork()
+    try:
+        yield uow
+    finally:
+        uow.close()
+
 def serialize_datetime(obj):
     """Convert datetime objects to strings for JSON serialization"""
     if isinstance(obj, (datetime, date)):
@@ -80,34 +419,70 @@ def serialize_rows(rows):
     
     return [serialize_row(row) for row in rows]
 
-def execute_query(connection, query: str, params: Tuple = None) -> List[Dict]:
-    """Execute a SELECT query and return results"""
+# Plans are taken inside a savepoint so a failing EXPLAIN cannot abort the caller's transaction
+EXPLAIN_SAVEPOINT = "rail_sathi_explain"
+
+def explain_query(connection, query: str, params: Tuple = None) -> str:
+    """Plain EXPLAIN of a statement on the caller's connection (does not run it)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        cursor.execute("EXPLAIN " + query, params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        return plan
+    except Exception as e:
+        cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        return f"EXPLAIN failed: {str(e)}"
+
+def _observe(connection, query: str, params, started: float, rows: Optional[int]):
+    """Record a finished statement; log it (and its plan) if it was slow"""
+    elapsed = time.perf_counter() - started
+    if record_query(query, elapsed, rows):
+        plan = explain_query(connection, query, params) if QUERY_EXPLAIN_SLOW else None
+        log_slow_query(query, params, elapsed, rows, plan)
+
+def _log_failure(kind: str, query: str, params, started: float, error: Exception):
+    record_query(query, time.perf_counter() - started, failed=True)
+    logger.error(f"{kind} execution failed: {str(error)}")
+    logger.error(f"Query: {query}")
+    logger.error(f"Params: {params}")
+
+def execute_query(connection, query: str, params: Tuple = None, serialize: bool = True) -> List[Dict]:
+    """Execute a SELECT query and return results
+
+    serialize=False keeps dates/datetimes as Python objects, for callers
+    that encode the rows themselves.
+    """
+    started = time.perf_counter()
     try:
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute(query, params)
         results = cursor.fetchall()
-        return serialize_rows(results)
     except Exception as e:
-        logger.error(f"Query execution failed: {str(e)}")
-        logger.error(f"Query: {query}")
-        logger.error(f"Params: {params}")
+        _log_failure("Query", query, params, started, e)
         raise
+    _observe(connection, query, params, started, len(results))
+    return serialize_rows(results) if serialize else [dict(row) for row in results]
 
-def execute_query_one(connection, query: str, params: Tuple = None) -> Optional[Dict]:
-    """Execute a SELECT query and return single result"""
+def execute_query_one(connection, query: str, params: Tuple = None, serialize: bool = True) -> Optional[Dict]:
+    """Execute a SELECT query and return single result (see execute_query)"""
+    started = time.perf_counter()
     try:
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute(query, params)
         result = cursor.fetchone()
-        return serialize_row(result)
     except Exception as e:
-        logger.error(f"Query execution failed: {str(e)}")
-        logger.error(f"Query: {query}")
-        logger.error(f"Params: {params}")
+        _log_failure("Query", query, params, started, e)
         raise
+    _observe(connection, query, params, started, 1 if result else 0)
+    if not serialize:
+        return dict(result) if result else None
+    return serialize_row(result)
 
 def execute_insert(connection, query: str, params: Tuple = None) -> int:
     """Execute an INSERT query and return last insert ID"""
+    started = time.perf_counter()
     try:
         cursor = connection.cursor()
         cursor.execute(query, params)
@@ -115,39 +490,39 @@ def execute_insert(connection, query: str, params: Tuple = None) -> int:
         # This assumes the query includes RETURNING id or similar
         if 'RETURNING' in query.upper():
             result = cursor.fetchone()
-            return result[0] if result else None
+            inserted = result[0] if result else None
         else:
             # Fallback for queries without RETURNING
-            return cursor.rowcount
+            inserted = cursor.rowcount
     except Exception as e:
-        logger.error(f"Insert execution failed: {str(e)}")
-        logger.error(f"Query: {query}")
-        logger.error(f"Params: {params}")
+        _log_failure("Insert", query, params, started, e)
         raise
+    _observe(connection, query, params, started, cursor.rowcount)
+    return inserted
 
 def execute_update(connection, query: str, params: Tuple = None) -> int:
     """Execute an UPDATE query and return affected rows"""
+    started = time.perf_counter()
     try:
         cursor = connection.cursor()
         cursor.execute(query, params)
-        return cursor.rowcount
     except Exception as e:
-        logger.error(f"Update execution failed: {str(e)}")
-        logger.error(f"Query: {query}")
-        logger.error(f"Params: {params}")
+        _log_failure("Update", query, params, started, e)
         raise
+    _observe(connection, query, params, started, cursor.rowcount)
+    return cursor.rowcount
 
 def execute_delete(connection, query: str, params: Tuple = None) -> int:
     """Execute a DELETE query and return affected rows"""
+    started = time.perf_counter()
     try:
         cursor = connection.cursor()
         cursor.execute(query, params)
-        return cursor.rowcount
     except Exception as e:
-        logger.error(f"Delete execution failed: {str(e)}")
-        logger.error(f"Query: {query}")
-        logger.error(f"Params: {params}")
+        _log_failure("Delete", query, params, started, e)
         raise
+    _observe(connection, query, params, started, cursor.rowcount)
+    return cursor.rowcount
 
 def test_connection():
     """Test database connection"""
@@ -170,7 +545,11 @@ def init_database():
     logger.info(f"Database Name: {DB_CONFIG['database']}")
     
     if test_connection():
-        logger.info("Database initialization successful")
+        try:
+            get_pool().warm()
+        except Exception as e:
+            logger.warning(f"Connection pool warm-up failed: {str(e)}")
+        logger.info(f"Database initialization successful (pool: {get_pool_stats()})")
         return True
     else:
         logger.error("Database initialization failed")
@@ -1,6 +1,6 @@
 import logging
-import json
 from database import get_db_connection, execute_query
+from recipient_cache import train_access_index, get_train_access_users
 from datetime import datetime
 from typing import Dict, List
 import pytz
@@ -120,21 +120,6 @@ def debug_user_lists(complain_details: Dict, verbose: bool = True):
         print("\n4. CHECKING TRAIN ACCESS USERS...")
         print("-" * 50)
         
-        assigned_users_query = """
-            SELECT u.email, u.id, u.first_name, u.last_name, ta.train_details
-            FROM user_onboarding_user u
-            JOIN trains_trainaccess ta ON ta.user_id = u.id
-            WHERE ta.train_details IS NOT NULL 
-            AND ta.train_details != '{}'
-            AND ta.train_details != 'null'
-        """
-        
-        conn = get_db_connection()
-        assigned_users_raw = execute_query(conn, assigned_users_query)
-        conn.close()
-        
-        print(f"Total users with train access: {len(assigned_users_raw) if assigned_users_raw else 0}")
-        
         # Get train number and complaint date for filtering
         train_no = str(complain_details.get('train_number', '')).strip()
         
@@ -156,64 +141,23 @@ def debug_user_lists(complain_details: Dict, verbose: bool = True):
         print(f"Parsed complaint date: {complaint_date}")
         print(f"Train number for filtering: {train_no}")
         
-        if complaint_date and train_no and assigned_users_raw:
+        if complaint_date and train_no:
             print(f"\nAnalyzing train access for train {train_no}...")
             
-            for user in assigned_users_raw:
-                user_id = user.get('id')
-                user_email = user.get('email')
-                user_name = f"{user.get('first_name', '')} {user.get('last_name', '')}"
-                
-                try:
-                    train_details_str = user.get('train_details', '{}')
-                    
-                    # Handle case where train_details might be a string or already parsed
-                    if isinstance(train_details_str, str):
-                        train_details = json.loads(train_details_str)
-                    else:
-                        train_details = train_details_str
-                    
-                    if verbose:
-                        print(f"\n  User ID: {user_id}, Email: {user_email}, Name: {user_name}")
-                        print(f"  Train details keys: {list(train_details.keys())}")
-                    
-                    # Check if the train number exists in train_details
-                    if train_no in train_details:
-                        if verbose:
-                            print(f"  ✓ User has access to train {train_no}")
-                        
-                        for access in train_details[train_no]:
-                            try:
-                                origin_date = datetime.strptime(access.get('origin_date', ''), "%Y-%m-%d").date()
-                                end_date_str = access.get('end_date', '')
-                                
-                                if verbose:
-                                    print(f"    Access period: {origin_date} to {end_date_str}")
-                                
-                                # Check if complaint date exactly matches origin_date
-                                is_valid = complaint_date == origin_date
-                                if verbose:
-                                    print(f"    Exact date match check (complaint_date == origin_date): {is_valid}")
-                                    print(f"    Complaint date: {complaint_date}, Origin date: {origin_date}")
-                                
-                                if is_valid:
-                                    assigned_users_list.append(user)
-                                    if verbose:
-                                        print(f"    ✓ USER ADDED TO NOTIFICATION LIST")
-                                    break  # Only need one match per user
-                                    
-                            except (ValueError, TypeError) as date_error:
-                                if verbose:
-                                    print(f"    ✗ Date parsing error: {date_error}")
-                                continue
-                    else:
-                        if verbose:
-                            print(f"  ✗ User does not have access to train {train_no}")
-                                
-                except (json.JSONDecodeError, TypeError) as json_error:
-                    if verbose:
-                        print(f"  ✗ JSON parsing error for user {user_id}: {json_error}")
-                    continue
+            if verbose:
+                for origin_date, end_date, user in train_access_index.get_periods(train_no):
+                    is_valid = origin_date <= complaint_date and (end_date is None or complaint_date <= end_date)
+                    print(f"\n  User ID: {user.get('id')}, Email: {user.get('email')}, "
+                          f"Name: {user.get('first_name', '')} {user.get('last_name', '')}")
+                    print(f"    Access period: {origin_date} to {end_date or 'ongoing'}")
+                    print(f"    {'✓ Covers' if is_valid else '✗ Does not cover'} complaint date {complaint_date}")
+            
+            # Same lookup the complaint email uses
+            assigned_users_list = get_train_access_users(train_no, complaint_date)
+            
+            access_stats = train_access_index.stats()
+            print(f"Train access index: {access_stats['periods']} periods across {access_stats['trains']} trains "
+                  f"(skipped {access_stats['skipped_entries']} malformed entries)")
         
         print(f"\nTrain access users matching criteria: {len(assigned_users_list)}")
         
@@ -0,0 +1,47 @@
+from decimal import Decimal
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(obj):
+    # Types orjson does not handle natively; matches jsonable_encoder
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode to JSON bytes; dates, datetimes and UUIDs are written as ISO strings"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ResponseEncoder:
+    """Validates trusted rows into a response type and encodes them in one pass
+
+    Rows should keep their native date/datetime values (execute_query with
+    serialize=False): validating those is a type check rather than a string
+    parse, and pydantic-core writes the JSON directly from the validated
+    models, skipping FastAPI's jsonable_encoder round trip.
+    """
+
+    def __init__(self, response_type):
+        self.adapter = TypeAdapter(response_type)
+
+    def encode(self, data: Any) -> bytes:
+        return self.adapter.dump_json(self.adapter.validate_python(data))
+
+    def response(self, data: Any, status_code: int = 200) -> Response:
+        return Response(self.encode(data), status_code=status_code, media_type=JSON_MEDIA_TYPE)
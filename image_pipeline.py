@@ -0,0 +1,132 @@
+import os
+import logging
+import tempfile
+from typing import Dict, List, Tuple
+from PIL import Image, ImageOps
+from upload_stream import UPLOAD_CHUNK_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Longest side of the stored image, in pixels
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 2048))
+# Output format for stored images and thumbnails: "jpeg" or "webp"
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 82))
+IMAGE_THUMBNAIL_QUALITY = int(os.getenv('IMAGE_THUMBNAIL_QUALITY', 75))
+# Extra variants as name:longest_side pairs, e.g. "thumbnail:320,medium:1024"
+IMAGE_VARIANTS = os.getenv('IMAGE_VARIANTS', 'thumbnail:320,medium:1024')
+
+IMAGE_FORMATS = {
+    'jpeg': {'pil_format': 'JPEG', 'content_type': 'image/jpeg', 'extension': 'jpg'},
+    'webp': {'pil_format': 'WEBP', 'content_type': 'image/webp', 'extension': 'webp'},
+}
+
+
+def parse_variants(spec: str) -> List[Tuple[str, int]]:
+    """Parse IMAGE_VARIANTS into (name, max_dimension) pairs, largest first"""
+    variants = []
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, size = item.partition(':')
+        variants.append((name.strip(), int(size)))
+    return sorted(variants, key=lambda v: v[1], reverse=True)
+
+
+def get_output_format(name: str = IMAGE_FORMAT) -> Dict[str, str]:
+    if name not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported IMAGE_FORMAT: {name}")
+    return IMAGE_FORMATS[name]
+
+
+def _prepare(image: Image.Image, output_format: Dict[str, str]) -> Image.Image:
+    """Convert to a mode the output format can encode"""
+    if output_format['pil_format'] == 'JPEG':
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Flatten transparency onto white instead of black
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+            return background
+        if image.mode != 'RGB':
+            return image.convert('RGB')
+        return image
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def _encode(image: Image.Image, output_format: Dict[str, str], quality: int):
+    """Encode image into a spooled temp file; the caller closes it"""
+    # Spills to disk if the encoded image is larger than one chunk
+    encoded = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+    options = {'quality': quality}
+    if output_format['pil_format'] == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=4)
+    image.save(encoded, format=output_format['pil_format'], **options)
+    size = encoded.tell()
+    encoded.seek(0)
+    return encoded, size
+
+
+def process_image(path: str, max_dimension: int = IMAGE_MAX_DIMENSION,
+                  format_name: str = IMAGE_FORMAT, quality: int = IMAGE_QUALITY,
+                  variants: str = IMAGE_VARIANTS) -> List[Dict]:
+    """Orient, resize and encode an image plus its smaller variants
+
+    Returns one dict per output, the full-size image first (name "original"),
+    each with an open `file`, `width`, `height`, `size`, `content_type` and
+    `extension`. Variants at least as large as the stored image are skipped.
+    """
+    output_format = get_output_format(format_name)
+    outputs = []
+    try:
+        with Image.open(path) as source:
+            # JPEG can decode straight at a reduced scale, which is much
+            # cheaper than decoding a full phone photo and shrinking it
+            source.draft('RGB', (max_dimension, max_dimension))
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            image = _prepare(image, output_format)
+
+            encoded, size = _encode(image, output_format, quality)
+            outputs.append({
+                'name': 'original', 'file': encoded, 'width': image.width, 'height': image.height,
+                'size': size, 'content_type': output_format['content_type'],
+                'extension': output_format['extension'],
+            })
+
+            # Each variant is downscaled from the previous, larger one
+            resized = image
+            for name, dimension in parse_variants(variants):
+                if dimension >= max(resized.size):
+                    continue
+                resized = resized.copy()
+                resized.thumbnail((dimension, dimension), Image.LANCZOS)
+                encoded, size = _encode(resized, output_format, IMAGE_THUMBNAIL_QUALITY)
+                outputs.append({
+                    'name': name, 'file': encoded, 'width': resized.width, 'height': resized.height,
+                    'size': size, 'content_type': output_format['content_type'],
+                    'extension': output_format['extension'],
+                })
+    except Exception:
+        close_outputs(outputs)
+        raise
+
+    logger.info(
+        f"Processed image {os.path.basename(path)}: "
+        + ", ".join(f"{o['name']} {o['width']}x{o['height']} {o['size']}B" for o in outputs)
+    )
+    return outputs
+
+
+def close_outputs(outputs: List[Dict]):
+    """Close the temp files returned by process_image"""
+    for output in outputs:
+        try:
+            output['file'].close()
+        except Exception:
+            pass
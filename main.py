@@ -1,16 +1,25 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fast_json import FastJSONResponse, ResponseEncoder
+from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, date, time
-import asyncio
-import threading
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, date
 import logging
 from services import (
-    create_complaint, get_complaint_by_id, get_complaints_by_date,
-    update_complaint, delete_complaint, delete_complaint_media,
-    upload_file_thread
+    create_complaint, get_complaint_by_id_async, get_complaints_by_date_async,
+    update_complaint, validate_complaint_access, delete_complaint_async, delete_complaint_media_async
+)
+from media_jobs import (
+    spool_uploads, discard_spooled, enqueue_media_jobs, get_media_jobs_async,
+    start_media_job_worker, stop_media_job_worker
+)
+from bulk_ingest import parse_bulk_body, ingest_complaints, BulkIngestError
+from complaint_export import stream_complaints, EXPORT_FORMATS, COMPLAINT_EXPORT_ITERSIZE
+from complaint_search import (
+    search_complaints_async, InvalidCursorError,
+    COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE, COMPLAINT_SEARCH_MAX_PAGE_SIZE
 )
 
 app = FastAPI(
@@ -19,17 +28,33 @@ app = FastAPI(
     version="1.0.0",
     openapi_url="/rs_microservice/openapi.json",  # Add the prefix here
     docs_url="/rs_microservice/docs",             # Add the prefix here
-    redoc_url="/rs_microservice/redoc"            # Add the prefix here (optional)
+    redoc_url="/rs_microservice/redoc",           # Add the prefix here (optional)
+    default_response_class=FastJSONResponse
 )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from database import get_db_connection
-from psycopg2.extras import RealDictCursor
+from database import init_database, close_pool, get_pool_stats, UnitOfWork, get_unit_of_work
+from async_database import init_async_pool, close_async_pool
+from train_cache import get_train_by_number, warm_train_cache, get_train_cache_stats
+from utils.email_utils import warm_email_templates
+from schema import ensure_schema, start_index_build
+from transcoder import shutdown_transcoder, get_transcoder_stats
+from recipient_cache import start_recipient_listener, stop_recipient_listener, get_recipient_cache_stats
+from utils.mail_sender import stop_mail_sender, get_mail_sender_stats
+from notification_outbox import start_notification_dispatcher, stop_notification_dispatcher, get_notification_stats
+from upload_stream import RequestSizeLimitMiddleware
+from query_stats import get_query_stats, reset_query_stats
+from metrics import (
+    MetricsMiddleware, register_stats, render_metrics,
+    start_event_loop_lag_monitor, stop_event_loop_lag_monitor
+)
 
 
+app.add_middleware(RequestSizeLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -38,6 +63,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency includes the other middlewares and 413 rejections
+app.add_middleware(MetricsMiddleware)
+
+register_stats('db_pool', get_pool_stats)
+register_stats('transcoder', get_transcoder_stats)
+register_stats('mail_sender', get_mail_sender_stats)
+
+@app.on_event("startup")
+async def startup():
+    await run_in_threadpool(init_database)
+    await run_in_threadpool(ensure_schema)
+    start_index_build()
+    await init_async_pool()
+    try:
+        await run_in_threadpool(warm_train_cache)
+    except Exception as e:
+        logger.warning(f"Train cache warm-up failed: {str(e)}")
+    try:
+        await run_in_threadpool(warm_email_templates)
+    except Exception as e:
+        logger.warning(f"Email template warm-up failed: {str(e)}")
+    start_media_job_worker()
+    start_recipient_listener()
+    start_notification_dispatcher()
+    start_event_loop_lag_monitor()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_event_loop_lag_monitor()
+    await run_in_threadpool(stop_media_job_worker)
+    await run_in_threadpool(stop_notification_dispatcher)
+    await run_in_threadpool(stop_recipient_listener)
+    await run_in_threadpool(stop_mail_sender)
+    shutdown_transcoder()
+    await close_async_pool()
+    close_pool()
+
 @app.get("/rs_microservice")
 async def root():
     return {"message": "Rail Sathi Microservice is running"}
@@ -47,11 +109,25 @@ class RailSathiComplainMediaResponse(BaseModel):
     id: int
     media_type: Optional[str]
     media_url: Optional[str]
+    variants: Optional[Dict[str, Any]] = None
     created_at: datetime
     updated_at: datetime
     created_by: Optional[str]
     updated_by: Optional[str]
 
+class RailSathiMediaJobResponse(BaseModel):
+    id: int
+    complain_id: int
+    media_type: str
+    original_filename: Optional[str]
+    status: str
+    attempts: int
+    media_id: Optional[int]
+    media_url: Optional[str]
+    last_error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
 # Separate the complaint data model
 class RailSathiComplainData(BaseModel):
     complain_id: int
@@ -76,6 +152,8 @@ class RailSathiComplainData(BaseModel):
     train_no: Optional[int]
     train_depot: Optional[str]
     rail_sathi_complain_media_files: List[RailSathiComplainMediaResponse]
+    # Only set on create/update: uploads still being processed in the background
+    media_jobs: Optional[List[RailSathiMediaJobResponse]] = None
 
 # Response wrapper that matches your actual API response structure
 class RailSathiComplainResponse(BaseModel):
@@ -105,23 +183,105 @@ class RailSathiComplainFlatResponse(BaseModel):
     updated_by: Optional[str]
     rail_sathi_complain_media_files: List[RailSathiComplainMediaResponse]
 
+class RailSathiComplainSearchResponse(BaseModel):
+    message: str
+    data: List[RailSathiComplainData]
+    # Pass as `cursor` to get the next page; null on the last page
+    next_cursor: Optional[str]
+
+class RailSathiBulkItemResult(BaseModel):
+    index: int
+    client_ref: Optional[str] = None
+    status: str
+    complain_id: Optional[int] = None
+    errors: Optional[List[str]] = None
+
+class RailSathiBulkIngestResponse(BaseModel):
+    message: str
+    created: int
+    invalid: int
+    results: List[RailSathiBulkItemResult]
+
+# Rows from the database are trusted: validate them once, straight from
+# their native types, and encode the JSON in the same pass
+complaint_response_encoder = ResponseEncoder(RailSathiComplainResponse)
+complaint_list_encoder = ResponseEncoder(List[RailSathiComplainResponse])
+media_job_list_encoder = ResponseEncoder(List[RailSathiMediaJobResponse])
+complaint_search_encoder = ResponseEncoder(RailSathiComplainSearchResponse)
+
 @app.get("/rs_microservice/complaint/get/{complain_id}", response_model=RailSathiComplainResponse)
 async def get_complaint(complain_id: int):
     """Get complaint by ID"""
     try:
-        complaint = get_complaint_by_id(complain_id)
+        complaint = await get_complaint_by_id_async(complain_id)
         if not complaint:
             raise HTTPException(status_code=404, detail="Complaint not found")
         
         # Wrap the complaint in the expected response format
-        return RailSathiComplainResponse(
-            message="Complaint retrieved successfully",
-            data=complaint
-        )
+        return complaint_response_encoder.response({
+            "message": "Complaint retrieved successfully",
+            "data": complaint
+        })
     except Exception as e:
         logger.error(f"Error getting complaint {complain_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/rs_microservice/complaint/search", response_model=RailSathiComplainSearchResponse)
+async def search_complaints_endpoint(
+    train_number: Optional[str] = None,
+    depot: Optional[str] = None,
+    complain_status: Optional[str] = None,
+    complain_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(COMPLAINT_SEARCH_DEFAULT_PAGE_SIZE, ge=1, le=COMPLAINT_SEARCH_MAX_PAGE_SIZE)
+):
+    """Search complaints by train, depot, status, type and submission date, newest first
+
+    Filters combine with AND. Pages are keyset-paginated: pass the returned
+    next_cursor back as `cursor` with the same filters.
+    """
+    try:
+        page = await search_complaints_async(
+            train_number=train_number, depot=depot, status=complain_status,
+            complain_type=complain_type, date_from=date_from, date_to=date_to,
+            cursor=cursor, limit=limit
+        )
+        return complaint_search_encoder.response({
+            "message": "Complaints retrieved successfully",
+            "data": page['complaints'],
+            "next_cursor": page['next_cursor']
+        })
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    except Exception as e:
+        logger.error(f"Error searching complaints: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/rs_microservice/complaint/export")
+def export_complaints_endpoint(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    train_number: Optional[str] = None,
+    depot: Optional[str] = None,
+    complain_status: Optional[str] = None,
+    complain_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    itersize: int = Query(COMPLAINT_EXPORT_ITERSIZE, ge=1, le=50000)
+):
+    """Stream every matching complaint with its media as NDJSON or CSV, oldest first
+
+    Takes the same filters as /complaint/search. Rows are read through a
+    server-side cursor `itersize` rows at a time and sent as they are read.
+    """
+    chunks = stream_complaints(
+        format, itersize, train_number=train_number, depot=depot, status=complain_status,
+        complain_type=complain_type, date_from=date_from, date_to=date_to
+    )
+    headers = {"Content-Disposition": f'attachment; filename="complaints.{format}"'}
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format], headers=headers)
+
 @app.get("/rs_microservice/complaint/get/date/{date_str}", response_model=List[RailSathiComplainResponse])
 async def get_complaints_by_date_endpoint(date_str: str, mobile_number: Optional[str] = None):
     """Get complaints by date and mobile number"""
@@ -135,17 +295,13 @@ async def get_complaints_by_date_endpoint(date_str: str, mobile_number: Optional
         if not mobile_number:
             raise HTTPException(status_code=400, detail="mobile_number parameter is required")
         
-        complaints = get_complaints_by_date(complaint_date, mobile_number)
+        complaints = await get_complaints_by_date_async(complaint_date, mobile_number)
         
         # Wrap each complaint in the expected response format
-        response_list = []
-        for complaint in complaints:
-            response_list.append(RailSathiComplainResponse(
-                message="Complaint retrieved successfully",
-                data=complaint
-            ))
-        
-        return response_list
+        return complaint_list_encoder.response([
+            {"message": "Complaint retrieved successfully", "data": complaint}
+            for complaint in complaints
+        ])
         
     except HTTPException:
         raise
@@ -170,9 +326,11 @@ async def create_complaint_endpoint_threaded(
     train_name: Optional[str] = Form(None),
     coach: Optional[str] = Form(None),
     berth_no: Optional[int] = Form(None),
-    rail_sathi_complain_media_files: List[UploadFile] = File(default=[])
+    rail_sathi_complain_media_files: List[UploadFile] = File(default=[]),
+    uow: UnitOfWork = Depends(get_unit_of_work)
 ):
     """Create new complaint with improved file handling"""
+    spooled_files = []
     try:
         logger.info(f"Creating complaint for user: {name}")
         logger.info(f"Number of files received: {len(rail_sathi_complain_media_files)}")
@@ -212,74 +370,62 @@ async def create_complaint_endpoint_threaded(
             "created_by": name
         }
         
+        # Stream uploads to the spool directory before writing anything
+        spooled_files = await spool_uploads(rail_sathi_complain_media_files)
+        
         # Create complaint
-        complaint = create_complaint(complaint_data)
+        complaint = await run_in_threadpool(create_complaint, complaint_data, uow)
         complain_id = complaint["complain_id"]
+        
+        # Queue spooled uploads for background processing, committed together
+        # with the complaint
+        media_jobs = []
+        if spooled_files:
+            logger.info(f"Queueing {len(spooled_files)} files")
+            media_jobs = await run_in_threadpool(enqueue_media_jobs, spooled_files, complain_id, name or '', uow)
+        await run_in_threadpool(uow.commit)
         logger.info(f"Complaint created with ID: {complain_id}")
         
-        # Handle file uploads if any files are provided
-        if rail_sathi_complain_media_files and len(rail_sathi_complain_media_files) > 0:
-            logger.info(f"Processing {len(rail_sathi_complain_media_files)} files")
-            
-            # Read all file contents first (before threading)
-            file_data_list = []
-            for file_obj in rail_sathi_complain_media_files:
-                if file_obj.filename:  # Check if file is actually uploaded
-                    file_content = await file_obj.read()
-                    file_data_list.append({
-                        'content': file_content,
-                        'filename': file_obj.filename,
-                        'content_type': file_obj.content_type
-                    })
-                    logger.info(f"Read file: {file_obj.filename}, size: {len(file_content)}")
-            
-            # Process files in threads
-            threads = []
-            for file_data in file_data_list:
-                # Create a mock file object for threading
-                class MockFile:
-                    def __init__(self, content, filename, content_type):
-                        self.content = content
-                        self.filename = filename
-                        self.content_type = content_type
-                    
-                    def read(self):
-                        return self.content
-                
-                mock_file = MockFile(file_data['content'], file_data['filename'], file_data['content_type'])
-                t = threading.Thread(
-                    target=upload_file_thread, 
-                    args=(mock_file, complain_id, name or ''),
-                    name=f"FileUpload-{complain_id}-{file_data['filename']}"
-                )
-                t.start()
-                threads.append(t)
-                logger.info(f"Started thread for file: {file_data['filename']}")
-            
-            # Wait for all threads to complete
-            for t in threads:
-                t.join()
-                logger.info(f"Thread completed: {t.name}")
-        
-        # Add a small delay to ensure database operations complete
-        await asyncio.sleep(1)
-        
-        # Get updated complaint with media files
-        updated_complaint = get_complaint_by_id(complain_id)
-        logger.info(f"Final complaint data retrieved with {len(updated_complaint.get('rail_sathi_complain_media_files', []))} media files")
-        
-        return {
+        # The insert returned the written row; uploads show up as media_jobs
+        # until the worker stores them
+        return complaint_response_encoder.response({
             "message": "Complaint created successfully",
-            "data": updated_complaint
-        }
+            "data": {**complaint, "media_jobs": media_jobs}
+        })
         
+    except HTTPException:
+        discard_spooled(spooled_files)
+        raise
     except Exception as e:
+        discard_spooled(spooled_files)
         logger.error(f"Error creating complaint: {str(e)}")
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/rs_microservice/complaint/bulk_add", response_model=RailSathiBulkIngestResponse)
+async def bulk_add_complaints_endpoint(request: Request, uow: UnitOfWork = Depends(get_unit_of_work)):
+    """Create many complaints from a JSON array or NDJSON body (no media)
+
+    Each item takes the same fields as /complaint/add plus an optional
+    client_ref. Valid items are committed together; invalid ones are
+    reported per item and skipped.
+    """
+    try:
+        items = parse_bulk_body(await request.body(), request.headers.get('content-type'))
+        result = await run_in_threadpool(ingest_complaints, items, uow)
+        await run_in_threadpool(uow.commit)
+        return {"message": f"{result['created']} complaint(s) created", **result}
+    except BulkIngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in bulk complaint ingest: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
 @app.patch("/rs_microservice/complaint/update/{complain_id}", response_model=RailSathiComplainResponse)
 async def update_complaint_endpoint(
     complain_id: int,
@@ -296,17 +442,17 @@ async def update_complaint_endpoint(
     train_name: Optional[str] = Form(None),
     coach: Optional[str] = Form(None),
     berth_no: Optional[int] = Form(None),
-    rail_sathi_complain_media_files: List[UploadFile] = File(default=[])
+    rail_sathi_complain_media_files: List[UploadFile] = File(default=[]),
+    uow: UnitOfWork = Depends(get_unit_of_work)
 ):
     """Update complaint (partial update)"""
+    spooled_files = []
     try:
         logger.info(f"Updating complaint {complain_id} for user: {name}")
         logger.info(f"Number of files received: {len(rail_sathi_complain_media_files)}")
         
-        # Check if complaint exists and validate permissions
-        existing_complaint = get_complaint_by_id(complain_id)
-        if not existing_complaint:
-            raise HTTPException(status_code=404, detail="Complaint not found")
+        # Existence is checked by the UPDATE itself, which returns no row
+        # for an unknown complaint
         
         # # Check permissions
         # if (existing_complaint["created_by"] != name or 
@@ -331,69 +477,33 @@ async def update_complaint_endpoint(
         if berth_no is not None: update_data["berth_no"] = berth_no
         update_data["updated_by"] = name
         
+        # Stream uploads to the spool directory before writing anything
+        spooled_files = await spool_uploads(rail_sathi_complain_media_files)
+        
         # Update complaint
-        updated_complaint = update_complaint(complain_id, update_data)
+        updated_complaint = await run_in_threadpool(update_complaint, complain_id, update_data, uow)
+        if not updated_complaint:
+            raise HTTPException(status_code=404, detail="Complaint not found")
+        
+        # Queue spooled uploads for background processing, committed together
+        # with the update
+        media_jobs = []
+        if spooled_files:
+            logger.info(f"Queueing {len(spooled_files)} files")
+            media_jobs = await run_in_threadpool(enqueue_media_jobs, spooled_files, complain_id, name or '', uow)
+        await run_in_threadpool(uow.commit)
         logger.info(f"Complaint {complain_id} updated successfully")
         
-        # Handle file uploads if any files are provided (similar to create endpoint)
-        if rail_sathi_complain_media_files and len(rail_sathi_complain_media_files) > 0:
-            logger.info(f"Processing {len(rail_sathi_complain_media_files)} files")
-            
-            # Read all file contents first (before threading)
-            file_data_list = []
-            for file_obj in rail_sathi_complain_media_files:
-                if file_obj.filename:  # Check if file is actually uploaded
-                    file_content = await file_obj.read()
-                    file_data_list.append({
-                        'content': file_content,
-                        'filename': file_obj.filename,
-                        'content_type': file_obj.content_type
-                    })
-                    logger.info(f"Read file: {file_obj.filename}, size: {len(file_content)}")
-            
-            # Process files in threads
-            threads = []
-            for file_data in file_data_list:
-                # Create a mock file object for threading
-                class MockFile:
-                    def __init__(self, content, filename, content_type):
-                        self.content = content
-                        self.filename = filename
-                        self.content_type = content_type
-                    
-                    def read(self):
-                        return self.content
-                
-                mock_file = MockFile(file_data['content'], file_data['filename'], file_data['content_type'])
-                t = threading.Thread(
-                    target=upload_file_thread, 
-                    args=(mock_file, complain_id, name or ''),
-                    name=f"FileUpload-{complain_id}-{file_data['filename']}"
-                )
-                t.start()
-                threads.append(t)
-                logger.info(f"Started thread for file: {file_data['filename']}")
-            
-            # Wait for all threads to complete
-            for t in threads:
-                t.join()
-                logger.info(f"Thread completed: {t.name}")
-        
-        # Add a small delay to ensure database operations complete
-        await asyncio.sleep(1)
-        
-        # Get final updated complaint with media files
-        final_complaint = get_complaint_by_id(complain_id)
-        logger.info(f"Final complaint data retrieved with {len(final_complaint.get('rail_sathi_complain_media_files', []))} media files")
-        
-        return {
+        return complaint_response_encoder.response({
             "message": "Complaint updated successfully",
-            "data": final_complaint
-        }
+            "data": {**updated_complaint, "media_jobs": media_jobs}
+        })
         
     except HTTPException:
+        discard_spooled(spooled_files)
         raise
     except Exception as e:
+        discard_spooled(spooled_files)
         logger.error(f"Error updating complaint {complain_id}: {str(e)}")
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
@@ -415,23 +525,24 @@ async def replace_complaint_endpoint(
     train_name: Optional[str] = Form(None),
     coach: Optional[str] = Form(None),
     berth_no: Optional[int] = Form(None),
-    rail_sathi_complain_media_files: List[UploadFile] = File(default=[])
+    rail_sathi_complain_media_files: List[UploadFile] = File(default=[]),
+    uow: UnitOfWork = Depends(get_unit_of_work)
 ):
     """Replace complaint (full update)"""
+    spooled_files = []
     try:
         logger.info(f"Replacing complaint {complain_id} for user: {name}")
         logger.info(f"Number of files received: {len(rail_sathi_complain_media_files)}")
         
-        # Check if complaint exists and validate permissions
-        existing_complaint = get_complaint_by_id(complain_id)
-        if not existing_complaint:
-            raise HTTPException(status_code=404, detail="Complaint not found")
+        # Stream uploads to the spool directory before taking the row lock
+        spooled_files = await spool_uploads(rail_sathi_complain_media_files)
         
-        # Check permissions
-        if (existing_complaint["created_by"] != name or 
-            existing_complaint["complain_status"] == "completed" or 
-            existing_complaint["mobile_number"] != mobile_number):
-            raise HTTPException(status_code=403, detail="Only user who created the complaint can update it.")
+        # Check if complaint exists and validate permissions; the row stays
+        # locked until the update commits
+        allowed, error = await run_in_threadpool(validate_complaint_access, complain_id, name, mobile_number, uow)
+        if not allowed:
+            status_code = 404 if error == "Complaint not found" else 403
+            raise HTTPException(status_code=status_code, detail=error)
         
         # Prepare full update data
         update_data = {
@@ -452,69 +563,29 @@ async def replace_complaint_endpoint(
         }
         
         # Update complaint
-        updated_complaint = update_complaint(complain_id, update_data)
+        updated_complaint = await run_in_threadpool(update_complaint, complain_id, update_data, uow)
+        if not updated_complaint:
+            raise HTTPException(status_code=404, detail="Complaint not found")
+        
+        # Queue spooled uploads for background processing, committed together
+        # with the update
+        media_jobs = []
+        if spooled_files:
+            logger.info(f"Queueing {len(spooled_files)} files")
+            media_jobs = await run_in_threadpool(enqueue_media_jobs, spooled_files, complain_id, name or '', uow)
+        await run_in_threadpool(uow.commit)
         logger.info(f"Complaint {complain_id} replaced successfully")
         
-        # Handle file uploads if any files are provided
-        if rail_sathi_complain_media_files and len(rail_sathi_complain_media_files) > 0:
-            logger.info(f"Processing {len(rail_sathi_complain_media_files)} files")
-            
-            # Read all file contents first (before threading)
-            file_data_list = []
-            for file_obj in rail_sathi_complain_media_files:
-                if file_obj.filename:  # Check if file is actually uploaded
-                    file_content = await file_obj.read()
-                    file_data_list.append({
-                        'content': file_content,
-                        'filename': file_obj.filename,
-                        'content_type': file_obj.content_type
-                    })
-                    logger.info(f"Read file: {file_obj.filename}, size: {len(file_content)}")
-            
-            # Process files in threads
-            threads = []
-            for file_data in file_data_list:
-                # Create a mock file object for threading
-                class MockFile:
-                    def __init__(self, content, filename, content_type):
-                        self.content = content
-                        self.filename = filename
-                        self.content_type = content_type
-                    
-                    def read(self):
-                        return self.content
-                
-                mock_file = MockFile(file_data['content'], file_data['filename'], file_data['content_type'])
-                t = threading.Thread(
-                    target=upload_file_thread, 
-                    args=(mock_file, complain_id, name or ''),
-                    name=f"FileUpload-{complain_id}-{file_data['filename']}"
-                )
-                t.start()
-                threads.append(t)
-                logger.info(f"Started thread for file: {file_data['filename']}")
-            
-            # Wait for all threads to complete
-            for t in threads:
-                t.join()
-                logger.info(f"Thread completed: {t.name}")
-        
-        # Add a small delay to ensure database operations complete
-        await asyncio.sleep(1)
-        
-        # Get final updated complaint with media files
-        final_complaint = get_complaint_by_id(complain_id)
-        logger.info(f"Final complaint data retrieved with {len(final_complaint.get('rail_sathi_complain_media_files', []))} media files")
-        
-        # Return properly formatted response (this was the missing part!)
-        return {
+        return complaint_response_encoder.response({
             "message": "Complaint replaced successfully",
-            "data": final_complaint
-        }
+            "data": {**updated_complaint, "media_jobs": media_jobs}
+        })
         
     except HTTPException:
+        discard_spooled(spooled_files)
         raise
     except Exception as e:
+        discard_spooled(spooled_files)
         logger.error(f"Error replacing complaint {complain_id}: {str(e)}")
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
@@ -531,7 +602,7 @@ async def delete_complaint_endpoint(
         logger.info(f"Deleting complaint {complain_id} for user: {name}")
         
         # Check if complaint exists and validate permissions
-        existing_complaint = get_complaint_by_id(complain_id)
+        existing_complaint = await get_complaint_by_id_async(complain_id)
         if not existing_complaint:
             raise HTTPException(status_code=404, detail="Complaint not found")
         
@@ -542,7 +613,7 @@ async def delete_complaint_endpoint(
             raise HTTPException(status_code=403, detail="Only user who created the complaint can delete it.")
         
         # Delete complaint
-        delete_complaint(complain_id)
+        await delete_complaint_async(complain_id)
         logger.info(f"Complaint {complain_id} deleted successfully")
         
         return {"message": "Complaint deleted successfully"}
@@ -568,7 +639,7 @@ async def delete_complaint_media_endpoint(
         logger.info(f"Media IDs to delete: {deleted_media_ids}")
         
         # Check if complaint exists and validate permissions
-        existing_complaint = get_complaint_by_id(complain_id)
+        existing_complaint = await get_complaint_by_id_async(complain_id)
         if not existing_complaint:
             raise HTTPException(status_code=404, detail="Complaint not found")
         
@@ -582,7 +653,7 @@ async def delete_complaint_media_endpoint(
             raise HTTPException(status_code=400, detail="No media IDs provided for deletion.")
         
         # Delete media files
-        deleted_count = delete_complaint_media(complain_id, deleted_media_ids)
+        deleted_count = await delete_complaint_media_async(complain_id, deleted_media_ids)
         
         if deleted_count == 0:
             raise HTTPException(status_code=400, detail="No matching media files found for deletion.")
@@ -599,71 +670,54 @@ async def delete_complaint_media_endpoint(
         logger.error(f"Full traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
-
-def make_json_serializable(data):
-    if isinstance(data, dict):
-        return {k: make_json_serializable(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [make_json_serializable(i) for i in data]
-    elif isinstance(data, (time, date, datetime)):
-        return data.isoformat()
-    else:
-        return data
+@app.get("/rs_microservice/media/status/{complain_id}", response_model=List[RailSathiMediaJobResponse])
+async def get_media_status_endpoint(complain_id: int):
+    """Poll processing status of media uploaded for a complaint"""
+    try:
+        return media_job_list_encoder.response(await get_media_jobs_async(complain_id))
+    except Exception as e:
+        logger.error(f"Error getting media status for complaint {complain_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/rs_microservice/train_details/{train_no}")
 def get_train_details(train_no: str):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    train_detail = get_train_by_number(train_no)
 
-    try:
-        cursor.execute("SELECT * FROM trains_traindetails WHERE train_no = %s", (train_no,))
-        train_detail = cursor.fetchone()
-
-        if not train_detail:
-            return JSONResponse(content={"error": "Train not found"}, status_code=404)
-
-        depot_code = train_detail.get('Depot')
-        cursor.execute("SELECT * FROM station_Depot WHERE depot_code = %s", (depot_code,))
-        depot = cursor.fetchone()
-
-        if depot:
-            division_code = depot.get("division_id")
-            cursor.execute("SELECT * FROM station_division WHERE division_id = %s", (division_code,))
-            division = cursor.fetchone()
-
-            zone_code = None
-            if division:
-                zone_id = division.get("zone_id")
-                cursor.execute("SELECT * FROM station_zone WHERE zone_id = %s", (zone_id,))
-                zone = cursor.fetchone()
-                zone_code = zone.get("zone_code") if zone else None
-
-            extra_info = {
-                "depot_code": depot.get("depot_code"),
-                "division_code": division.get("division_code") if division else None,
-                "zone_code": zone_code,
-            }
-        else:
-            extra_info = {
-                "depot_code": None,
-                "division_code": None,
-                "zone_code": None,
-            }
-
-        train_detail['extra_info'] = extra_info
-
-        # ✅ Convert to JSON-safe format before returning
-        safe_train_detail = make_json_serializable(train_detail)
-        return JSONResponse(content=safe_train_detail)
-
-    finally:
-        cursor.close()
-        conn.close()
+    if not train_detail:
+        return FastJSONResponse(content={"error": "Train not found"}, status_code=404)
+
+    # orjson writes the row's dates and datetimes as ISO strings
+    return FastJSONResponse(content=train_detail)
     
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pool": get_pool_stats(),
+        "train_cache": get_train_cache_stats(),
+        "recipient_cache": get_recipient_cache_stats(),
+        "mail_sender": get_mail_sender_stats(),
+        "notifications": get_notification_stats(),
+    }
+
+@app.get("/rs_microservice/query_stats")
+async def query_stats_endpoint(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_time", pattern="^(total_time|calls|max_time|slow|errors|rows)$"),
+    reset: bool = False
+):
+    """Statements run through the database helpers, grouped by normalized fingerprint"""
+    stats = get_query_stats(limit, order_by)
+    if reset:
+        reset_query_stats()
+    return stats
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
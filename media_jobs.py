@@ -0,0 +1,428 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
+from psycopg2.extras import RealDictCursor, execute_values
+from database import get_db_connection, execute_query, execute_query_one, UnitOfWork, unit_of_work
+import async_database
+from services import process_media, save_media_record, get_media_by_content_hash
+from upload_stream import stream_to_file, UploadTooLargeError, MAX_UPLOAD_BYTES
+from metrics import observe_upload, observe_media_job
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Uploaded files wait here until a worker picks them up. Point it at a
+# persistent volume so queued jobs survive a restart.
+MEDIA_SPOOL_DIR = os.getenv('MEDIA_SPOOL_DIR', '/tmp/rail_sathi_media_spool')
+# Jobs are only claimed by the host that spooled the file
+MEDIA_SPOOL_HOST = os.getenv('MEDIA_SPOOL_HOST', socket.gethostname())
+MEDIA_JOB_WORKERS = int(os.getenv('MEDIA_JOB_WORKERS', 2))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.getenv('MEDIA_JOB_MAX_ATTEMPTS', 5))
+# Seconds before the first retry; doubles on every further attempt
+MEDIA_JOB_RETRY_BACKOFF = float(os.getenv('MEDIA_JOB_RETRY_BACKOFF', 30))
+MEDIA_JOB_POLL_INTERVAL = float(os.getenv('MEDIA_JOB_POLL_INTERVAL', 2))
+# A claimed job whose worker died is picked up again after this many seconds
+MEDIA_JOB_LOCK_TIMEOUT = float(os.getenv('MEDIA_JOB_LOCK_TIMEOUT', 900))
+# Running jobs refresh their lock this often, so a long transcode or upload
+# never outlives it; several refreshes fit in one lock timeout
+MEDIA_JOB_HEARTBEAT_INTERVAL = MEDIA_JOB_LOCK_TIMEOUT / 3
+
+JOB_STATUS_PROCESSING = 'processing'
+JOB_STATUS_COMPLETED = 'completed'
+JOB_STATUS_FAILED = 'failed'
+
+MEDIA_JOB_COLUMNS = """
+    id, complain_id, media_type, original_filename, status, attempts,
+    media_id, media_url, last_error, created_at, updated_at
+"""
+
+CLAIM_JOB_QUERY = """
+    UPDATE rail_sathi_media_job
+    SET attempts = attempts + 1, locked_at = now(), updated_at = now()
+    WHERE id = (
+        SELECT id FROM rail_sathi_media_job
+        WHERE status = 'processing'
+          AND spool_host = %s
+          AND attempts < max_attempts
+          AND next_attempt_at <= now()
+          AND (locked_at IS NULL OR locked_at < now() - make_interval(secs => %s))
+        ORDER BY next_attempt_at, id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING *
+"""
+
+# Jobs whose worker died (OOM, pod kill, ...) during their last allowed
+# attempt: their lock expired but they may not be claimed again
+EXPIRE_EXHAUSTED_JOBS_QUERY = """
+    UPDATE rail_sathi_media_job
+    SET status = 'failed', locked_at = NULL, updated_at = now(),
+        last_error = 'Worker stopped during the last attempt (' || attempts || ' of ' || max_attempts || ')'
+    WHERE status = 'processing'
+      AND spool_host = %s
+      AND attempts >= max_attempts
+      AND locked_at < now() - make_interval(secs => %s)
+    RETURNING id, file_path, attempts
+"""
+
+
+def get_media_type(content_type: Optional[str]) -> Optional[str]:
+    """Map an upload content type to the media_type stored in the database"""
+    content_type = content_type or ''
+    if content_type.startswith("image"):
+        return "image"
+    if content_type.startswith("video"):
+        return "video"
+    return None
+
+
+def spool_upload(file_obj: UploadFile) -> Dict:
+    """Stream an upload into the spool directory, hashing it on the way"""
+    os.makedirs(MEDIA_SPOOL_DIR, exist_ok=True)
+    _, ext = os.path.splitext(file_obj.filename or '')
+    file_path = os.path.join(MEDIA_SPOOL_DIR, f"{uuid.uuid4().hex}{ext.lower()}")
+    file_obj.file.seek(0)
+    return stream_to_file(file_obj.file, file_path, MAX_UPLOAD_BYTES)
+
+
+async def spool_uploads(files: List[UploadFile]) -> List[Dict]:
+    """Spool every supported upload; raises 413 if any file is too large
+
+    Call this before writing anything to the database so an oversized
+    upload is rejected without leaving a half-created complaint behind.
+    """
+    spooled_files = []
+    seen_hashes = set()
+    for file_obj in files or []:
+        if not file_obj.filename:  # Check if file is actually uploaded
+            continue
+
+        media_type = get_media_type(file_obj.content_type)
+        if not media_type:
+            logger.warning(f"Unsupported media type for file: {file_obj.filename}, content_type: {file_obj.content_type}")
+            continue
+
+        start = time.perf_counter()
+        try:
+            spooled = await run_in_threadpool(spool_upload, file_obj)
+        except UploadTooLargeError as e:
+            discard_spooled(spooled_files)
+            raise HTTPException(status_code=413, detail=f"{file_obj.filename}: {str(e)}")
+        except Exception:
+            discard_spooled(spooled_files)
+            raise
+
+        observe_upload(media_type, spooled['file_size'], time.perf_counter() - start)
+
+        if spooled['content_hash'] in seen_hashes:
+            # The same file attached twice to one request is stored once
+            logger.info(f"Skipping duplicate file in request: {file_obj.filename}")
+            _remove_spool_file(spooled['file_path'])
+            continue
+        seen_hashes.add(spooled['content_hash'])
+
+        spooled.update({
+            'filename': file_obj.filename,
+            'content_type': file_obj.content_type,
+            'media_type': media_type,
+            'queued': False,
+        })
+        logger.info(f"Spooled file: {file_obj.filename}, size: {spooled['file_size']}, sha256: {spooled['content_hash']}")
+        spooled_files.append(spooled)
+    return spooled_files
+
+
+def discard_spooled(spooled_files: List[Dict]):
+    """Remove spooled files that never made it into the job queue"""
+    for spooled in spooled_files or []:
+        if not spooled.get('queued'):
+            _remove_spool_file(spooled['file_path'])
+
+
+def enqueue_media_jobs(spooled_files: List[Dict], complain_id: int, user: str,
+                       uow: Optional[UnitOfWork] = None) -> List[Dict]:
+    """Queue one processing job per spooled file in the caller's unit of work
+
+    All jobs go in with one INSERT in the same transaction as the complaint;
+    the files only count as queued, and the worker is only woken, once it
+    commits.
+    """
+    if not spooled_files:
+        return []
+    query = f"""
+        INSERT INTO rail_sathi_media_job
+        (complain_id, media_type, file_path, spool_host, original_filename,
+         content_type, file_size, content_hash, created_by, max_attempts)
+        VALUES %s
+        RETURNING {MEDIA_JOB_COLUMNS}
+    """
+    with unit_of_work(uow) as uow:
+        cursor = uow.connection.cursor(cursor_factory=RealDictCursor)
+        # RETURNING rows come back in VALUES order
+        jobs = execute_values(cursor, query, [
+            (complain_id, spooled['media_type'], spooled['file_path'], MEDIA_SPOOL_HOST,
+             spooled['filename'], spooled['content_type'], spooled['file_size'],
+             spooled['content_hash'], user, MEDIA_JOB_MAX_ATTEMPTS)
+            for spooled in spooled_files
+        ], page_size=len(spooled_files), fetch=True)
+
+        def mark_queued():
+            for spooled in spooled_files:
+                spooled['queued'] = True
+
+        uow.after_commit(mark_queued)
+        uow.after_commit(media_job_worker.wake)
+
+    jobs = [dict(job) for job in jobs]
+    for spooled, job in zip(spooled_files, jobs):
+        logger.info(f"Queued media job {job['id']} for complaint {complain_id}: {spooled['filename']}")
+    return jobs
+
+
+async def get_media_jobs_async(complain_id: int) -> List[Dict]:
+    """Get processing status of every media job for a complaint"""
+    async with async_database.get_async_db_connection() as conn:
+        query = f"""
+            SELECT {MEDIA_JOB_COLUMNS}
+            FROM rail_sathi_media_job
+            WHERE complain_id = %s
+            ORDER BY id
+        """
+        return await async_database.execute_query(conn, query, (complain_id,), serialize=False)
+
+
+def _remove_spool_file(file_path: str):
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except OSError as e:
+        logger.warning(f"Could not remove spooled file {file_path}: {e}")
+
+
+def claim_next_job() -> Optional[Dict]:
+    """Lock the next due job for this host, or return None
+
+    Jobs that used up their attempts without finishing are failed first.
+    """
+    conn = get_db_connection()
+    try:
+        expired = execute_query(conn, EXPIRE_EXHAUSTED_JOBS_QUERY, (MEDIA_SPOOL_HOST, MEDIA_JOB_LOCK_TIMEOUT))
+        job = execute_query_one(conn, CLAIM_JOB_QUERY, (MEDIA_SPOOL_HOST, MEDIA_JOB_LOCK_TIMEOUT))
+        conn.commit()
+    finally:
+        conn.close()
+    for expired_job in expired:
+        logger.error(f"Media job {expired_job['id']} failed permanently after {expired_job['attempts']} attempts: "
+                     f"worker stopped during the last attempt")
+        _remove_spool_file(expired_job['file_path'])
+    return job
+
+
+def touch_jobs(job_ids: List[int]):
+    """Refresh the lock of jobs that are still being processed"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE rail_sathi_media_job
+            SET locked_at = now()
+            WHERE id = ANY(%s) AND status = 'processing' AND locked_at IS NOT NULL
+        """, (job_ids,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _finish_job(job_id: int, status: str, last_error: str = None, retry_delay: float = None):
+    conn = get_db_connection()
+    try:
+        next_attempt_at = datetime.now() + timedelta(seconds=retry_delay or 0)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE rail_sathi_media_job
+            SET status = %s, last_error = %s, next_attempt_at = %s,
+                locked_at = NULL, updated_at = now()
+            WHERE id = %s
+        """, (status, last_error, next_attempt_at, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def process_media_job(job: Dict) -> str:
+    """Process, upload and record one claimed media job
+
+    Returns the outcome: 'completed', 'reused', 'failed' or 'retry'.
+    """
+    job_id = job['id']
+    complain_id = job['complain_id']
+    file_path = job['file_path']
+    try:
+        conn = get_db_connection()
+        try:
+            complaint = execute_query_one(
+                conn, "SELECT complain_id FROM rail_sathi_railsathicomplain WHERE complain_id = %s", (complain_id,)
+            )
+        finally:
+            conn.close()
+        if not complaint:
+            logger.warning(f"Media job {job_id}: complaint {complain_id} no longer exists")
+            _finish_job(job_id, JOB_STATUS_FAILED, "Complaint no longer exists")
+            _remove_spool_file(file_path)
+            return 'failed'
+        if not os.path.exists(file_path):
+            logger.error(f"Media job {job_id}: spooled file {file_path} is missing")
+            _finish_job(job_id, JOB_STATUS_FAILED, "Spooled file is missing")
+            return 'failed'
+
+        content_hash = job.get('content_hash')
+        existing = get_media_by_content_hash(content_hash, job['media_type'], complain_id) if content_hash else None
+        if existing:
+            # Same bytes were stored before: reuse that object instead of
+            # re-encoding and re-uploading it
+            result = {'url': existing['media_url'], 'variants': existing.get('variants')}
+            logger.info(f"Media job {job_id}: reusing media {existing['id']} with the same content hash")
+        else:
+            _, ext = os.path.splitext(job.get('original_filename') or file_path)
+            ext = ext.lstrip('.').lower()
+            result = process_media(file_path, ext, complain_id, job['media_type'])
+        uploaded_url = result['url']
+        if not uploaded_url:
+            raise RuntimeError("Media upload returned no URL")
+
+        # Record the media row and complete the job atomically so a retry
+        # can never create a duplicate media row
+        conn = get_db_connection()
+        try:
+            if existing and existing['complain_id'] == complain_id:
+                # Resubmitted to the same complaint: it already has this file
+                media_id = existing['id']
+            else:
+                media_id = save_media_record(
+                    complain_id, job['media_type'], uploaded_url, job.get('created_by') or '',
+                    conn=conn, variants=result['variants'], content_hash=content_hash
+                )
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE rail_sathi_media_job
+                SET status = %s, media_id = %s, media_url = %s, last_error = NULL,
+                    locked_at = NULL, updated_at = now()
+                WHERE id = %s
+            """, (JOB_STATUS_COMPLETED, media_id, uploaded_url, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        _remove_spool_file(file_path)
+        logger.info(f"Media job {job_id} completed for complaint {complain_id}: {uploaded_url}")
+        return 'reused' if existing else 'completed'
+
+    except Exception as e:
+        attempts = job.get('attempts') or 1
+        if attempts >= (job.get('max_attempts') or MEDIA_JOB_MAX_ATTEMPTS):
+            logger.error(f"Media job {job_id} failed permanently after {attempts} attempts: {e}")
+            _finish_job(job_id, JOB_STATUS_FAILED, repr(e))
+            _remove_spool_file(file_path)
+            return 'failed'
+        else:
+            delay = MEDIA_JOB_RETRY_BACKOFF * (2 ** (attempts - 1))
+            logger.warning(f"Media job {job_id} attempt {attempts} failed, retrying in {delay}s: {e}")
+            _finish_job(job_id, JOB_STATUS_PROCESSING, repr(e), retry_delay=delay)
+            return 'retry'
+
+
+class MediaJobWorker:
+    """Fixed-size pool of threads draining rail_sathi_media_job"""
+
+    def __init__(self, workers: int = MEDIA_JOB_WORKERS):
+        self.workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        # Ids of the jobs being processed right now, kept locked by _heartbeat
+        self._active = set()
+        self._active_lock = threading.Lock()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"MediaJobWorker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="MediaJobHeartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+        logger.info(f"Started {self.workers} media job workers on host {MEDIA_SPOOL_HOST}")
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Signal that new jobs were queued"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                logger.error(f"Failed to claim media job: {e}")
+                job = None
+            if job:
+                start = time.perf_counter()
+                with self._active_lock:
+                    self._active.add(job['id'])
+                try:
+                    outcome = process_media_job(job)
+                    observe_media_job(job.get('media_type'), time.perf_counter() - start, outcome)
+                except Exception as e:
+                    # The job stays locked and is claimed again after MEDIA_JOB_LOCK_TIMEOUT
+                    logger.error(f"Failed to process media job {job.get('id')}: {e}")
+                finally:
+                    with self._active_lock:
+                        self._active.discard(job['id'])
+                continue
+            self._wake.wait(MEDIA_JOB_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _heartbeat(self):
+        while not self._stop.wait(MEDIA_JOB_HEARTBEAT_INTERVAL):
+            with self._active_lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                touch_jobs(job_ids)
+            except Exception as e:
+                logger.error(f"Failed to refresh media job locks: {e}")
+
+
+media_job_worker = MediaJobWorker()
+
+
+def start_media_job_worker():
+    """Start the background media job workers"""
+    media_job_worker.start()
+
+
+def stop_media_job_worker():
+    """Stop the background media job workers"""
+    media_job_worker.stop()
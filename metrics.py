@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Any
+from prometheus_client import Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from query_stats import begin_request_db_timing, end_request_db_timing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between event-loop lag samples
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv('EVENT_LOOP_LAG_INTERVAL', 0.5))
+
+# Label for requests that matched no route, so unknown paths cannot blow up cardinality
+UNMATCHED_ROUTE = '<unmatched>'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (16 * 1024, 128 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2,
+                25 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2)
+
+REQUEST_DURATION = Histogram(
+    'rail_sathi_http_request_duration_seconds',
+    'Time from receiving a request to sending the last byte of its response',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'rail_sathi_http_requests_in_progress', 'Requests being handled', ['method']
+)
+REQUEST_DB_TIME = Histogram(
+    'rail_sathi_http_request_db_seconds',
+    'Time spent in database statements per request',
+    ['method', 'route'], buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    'rail_sathi_http_request_db_queries',
+    'Database statements run per request',
+    ['method', 'route'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+EVENT_LOOP_LAG = Histogram(
+    'rail_sathi_event_loop_lag_seconds',
+    'How late the event loop woke a sleeping task',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+UPLOAD_BYTES = Histogram(
+    'rail_sathi_upload_bytes', 'Size of accepted media uploads', ['media_type'], buckets=SIZE_BUCKETS
+)
+UPLOAD_SPOOL_DURATION = Histogram(
+    'rail_sathi_upload_spool_seconds',
+    'Time to copy and hash one upload into the spool directory',
+    ['media_type'], buckets=LATENCY_BUCKETS
+)
+MEDIA_JOB_DURATION = Histogram(
+    'rail_sathi_media_job_seconds',
+    'Time to process (transcode, resize) and store one spooled upload',
+    ['media_type', 'outcome'], buckets=LATENCY_BUCKETS
+)
+EMAIL_SEND_DURATION = Histogram(
+    'rail_sathi_email_send_seconds',
+    'Time to hand one message to the SMTP server, retries included',
+    ['outcome'], buckets=LATENCY_BUCKETS
+)
+
+# Fields of each component's stats() exported as gauges at scrape time
+STATS_GAUGES = {
+    'db_pool': ('database connection pool', ['size', 'idle', 'checked_out', 'max_size']),
+    'transcoder': ('video transcode queue', ['pending', 'workers', 'capacity']),
+    'mail_sender': ('SMTP sender', ['pending', 'in_use', 'idle']),
+}
+
+
+class StatsCollector:
+    """Reads the components' own stats() on every scrape
+
+    Keeps one source of truth for values such as the transcode queue depth
+    instead of mirroring every change into a gauge.
+    """
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self):
+        for name, stats_fn in list(self.sources.items()):
+            description, fields = STATS_GAUGES[name]
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logger.warning(f"Failed to read {name} stats for metrics: {e}")
+                continue
+            for field in fields:
+                if field in stats:
+                    yield GaugeMetricFamily(f'rail_sathi_{name}_{field}', f'{field} of the {description}',
+                                            value=stats[field])
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(name: str, stats_fn: Callable[[], Dict[str, Any]]):
+    """Export the STATS_GAUGES fields of `name` from stats_fn()"""
+    stats_collector.sources[name] = stats_fn
+
+
+def observe_upload(media_type: str, size: int, elapsed: float):
+    UPLOAD_BYTES.labels(media_type).observe(size)
+    UPLOAD_SPOOL_DURATION.labels(media_type).observe(elapsed)
+
+
+def observe_media_job(media_type: str, elapsed: float, outcome: str):
+    MEDIA_JOB_DURATION.labels(media_type or 'unknown', outcome).observe(elapsed)
+
+
+def observe_email(elapsed: float, outcome: str):
+    EMAIL_SEND_DURATION.labels(outcome).observe(elapsed)
+
+
+def render_metrics():
+    """Exposition body and content type for the /metrics endpoint"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight count and DB time per route
+
+    Routes are labelled with their path template (/complaint/get/{complain_id}),
+    not the raw path. Streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        in_progress.inc()
+        db_timing = begin_request_db_timing()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            db_time, db_queries = end_request_db_timing(db_timing)
+            in_progress.dec()
+            route = scope.get('route')
+            route = getattr(route, 'path', None) or UNMATCHED_ROUTE
+            REQUEST_DURATION.labels(method, route, str(status)).observe(elapsed)
+            REQUEST_DB_TIME.labels(method, route).observe(db_time)
+            REQUEST_DB_QUERIES.labels(method, route).observe(db_queries)
+
+
+class EventLoopLagMonitor:
+    """Background task measuring how late the loop runs a timed wake-up
+
+    Lag here means some coroutine blocked the loop (sync I/O or CPU work)
+    and every other request on this worker waited for it.
+    """
+
+    def __init__(self, interval: float = EVENT_LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+event_loop_lag_monitor = EventLoopLagMonitor()
+
+
+def start_event_loop_lag_monitor():
+    """Start sampling event-loop lag; call from the running loop"""
+    event_loop_lag_monitor.start()
+
+
+async def stop_event_loop_lag_monitor():
+    await event_loop_lag_monitor.stop()
@@ -0,0 +1,403 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import wait as wait_futures
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any
+from psycopg2.extras import Json, execute_values
+from database import get_db_connection, execute_query
+from utils.email_utils import (
+    EMAIL_SENDER, get_complaint_recipients, build_complaint_subject,
+    render_complaint_email, build_digest_email
+)
+from utils.mail_sender import mail_sender, build_message
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How notifications are coalesced: "train", "depot" or "none" (one email per complaint)
+NOTIFICATION_DIGEST_MODE = os.getenv('NOTIFICATION_DIGEST_MODE', 'train')
+# Seconds a notification waits for more complaints on the same train/depot
+# before the group goes out as one digest; 0 sends as soon as it is seen
+NOTIFICATION_COALESCE_WINDOW = float(os.getenv('NOTIFICATION_COALESCE_WINDOW', 0))
+# Digest groups claimed per dispatcher round
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 20))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+# Seconds before the first retry; doubles on every further attempt
+NOTIFICATION_RETRY_BACKOFF = float(os.getenv('NOTIFICATION_RETRY_BACKOFF', 30))
+NOTIFICATION_POLL_INTERVAL = float(os.getenv('NOTIFICATION_POLL_INTERVAL', 2))
+# A claimed batch whose dispatcher died is picked up again after this many seconds
+NOTIFICATION_LOCK_TIMEOUT = float(os.getenv('NOTIFICATION_LOCK_TIMEOUT', 300))
+# How long a dispatch round waits for its emails. Sends still running then
+# are recorded when they finish, their notifications kept locked meanwhile
+# (refreshed every NOTIFICATION_LOCK_REFRESH), so no other dispatcher
+# re-sends them.
+NOTIFICATION_SEND_DEADLINE = NOTIFICATION_LOCK_TIMEOUT / 2
+NOTIFICATION_LOCK_REFRESH = NOTIFICATION_LOCK_TIMEOUT / 3
+
+EVENT_COMPLAINT_CREATED = 'complaint_created'
+
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# Claims every due notification of up to N digest groups. A group is due
+# once its oldest notification has waited out the coalescing window.
+CLAIM_BATCH_QUERY = """
+    WITH due_groups AS (
+        SELECT digest_key
+        FROM rail_sathi_notification_outbox
+        WHERE status = 'pending'
+          AND next_attempt_at <= now()
+          AND (locked_at IS NULL OR locked_at < now() - make_interval(secs => %(lock_timeout)s))
+        GROUP BY digest_key
+        HAVING min(created_at) <= now() - make_interval(secs => %(window)s)
+        ORDER BY min(created_at)
+        LIMIT %(batch_size)s
+    ), claimed AS (
+        SELECT o.id
+        FROM rail_sathi_notification_outbox o
+        JOIN due_groups g ON g.digest_key = o.digest_key
+        WHERE o.status = 'pending'
+          AND o.next_attempt_at <= now()
+          AND (o.locked_at IS NULL OR o.locked_at < now() - make_interval(secs => %(lock_timeout)s))
+        FOR UPDATE OF o SKIP LOCKED
+    )
+    UPDATE rail_sathi_notification_outbox o
+    SET attempts = o.attempts + 1, locked_at = now(), updated_at = now()
+    FROM claimed
+    WHERE o.id = claimed.id
+    RETURNING o.id, o.event_type, o.complain_id, o.digest_key, o.payload, o.attempts, o.delivered_to, o.created_at
+"""
+
+
+def get_digest_key(complain_id: int, train_no: Optional[str], depot: Optional[str],
+                   mode: str = NOTIFICATION_DIGEST_MODE) -> str:
+    """Notifications with the same key may be sent as one digest"""
+    if mode == 'train' and train_no:
+        return f"train:{train_no}"
+    if mode == 'depot' and depot:
+        return f"depot:{depot}"
+    return f"complaint:{complain_id}"
+
+
+def enqueue_notification(cursor, event_type: str, complain_id: int, payload: Dict[str, Any],
+                         train_no: Optional[str] = None, depot: Optional[str] = None) -> int:
+    """Add a notification to the outbox using the caller's cursor
+
+    Call it inside the transaction that writes the complaint, so the
+    notification exists if and only if the complaint does.
+    """
+    cursor.execute("""
+        INSERT INTO rail_sathi_notification_outbox (event_type, complain_id, digest_key, payload)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    """, (event_type, complain_id, get_digest_key(complain_id, train_no, depot), Json(payload)))
+    return cursor.fetchone()[0]
+
+
+def enqueue_notifications(cursor, event_type: str, notifications: List[Dict[str, Any]]) -> int:
+    """Add many notifications in one statement using the caller's cursor
+
+    Each item has complain_id, payload and optionally train_no and depot;
+    same transaction rules as enqueue_notification.
+    """
+    if not notifications:
+        return 0
+    execute_values(cursor, """
+        INSERT INTO rail_sathi_notification_outbox (event_type, complain_id, digest_key, payload)
+        VALUES %s
+    """, [
+        (event_type, n['complain_id'], get_digest_key(n['complain_id'], n.get('train_no'), n.get('depot')),
+         Json(n['payload']))
+        for n in notifications
+    ])
+    return len(notifications)
+
+
+def claim_batch() -> List[Dict[str, Any]]:
+    """Lock the next due digest groups, or return an empty list"""
+    conn = get_db_connection()
+    try:
+        events = execute_query(conn, CLAIM_BATCH_QUERY, {
+            'lock_timeout': NOTIFICATION_LOCK_TIMEOUT,
+            'window': NOTIFICATION_COALESCE_WINDOW,
+            'batch_size': NOTIFICATION_BATCH_SIZE,
+        })
+        conn.commit()
+        return events or []
+    finally:
+        conn.close()
+
+
+def _refresh_locks(event_ids: List[int]):
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE rail_sathi_notification_outbox
+            SET locked_at = now()
+            WHERE id = ANY(%s) AND status = 'pending' AND locked_at IS NOT NULL
+        """, (event_ids,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _mark_sent(event_ids: List[int]):
+    if not event_ids:
+        return
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE rail_sathi_notification_outbox
+            SET status = 'sent', sent_at = now(), last_error = NULL, locked_at = NULL, updated_at = now()
+            WHERE id = ANY(%s)
+        """, (event_ids,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _mark_failed(events: List[Dict[str, Any]], error: str, delivered: Optional[Dict[int, List[str]]] = None):
+    """Schedule a retry (or give up) and remember who already got each notification"""
+    delivered = delivered or {}
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for event in events:
+            attempts = event['attempts']
+            if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                logger.error(f"Notification {event['id']} failed permanently after {attempts} attempts: {error}")
+                status, next_attempt_at = STATUS_FAILED, datetime.now()
+            else:
+                delay = NOTIFICATION_RETRY_BACKOFF * (2 ** (attempts - 1))
+                logger.warning(f"Notification {event['id']} attempt {attempts} failed, retrying in {delay}s: {error}")
+                status, next_attempt_at = STATUS_PENDING, datetime.now() + timedelta(seconds=delay)
+            delivered_to = sorted(set(event.get('delivered_to') or []) | set(delivered.get(event['id'], [])))
+            cursor.execute("""
+                UPDATE rail_sathi_notification_outbox
+                SET status = %s, last_error = %s, next_attempt_at = %s, delivered_to = %s,
+                    locked_at = NULL, updated_at = now()
+                WHERE id = %s
+            """, (status, error, next_attempt_at, delivered_to, event['id']))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _group_by_recipients(events: List[Dict[str, Any]]):
+    """Split a digest group into (events, recipients) pairs
+
+    Recipients differ per complaint (war room users per depot, assigned
+    users per train), so every recipient gets exactly the complaints they
+    would have been sent individually, in one email. Recipients an earlier
+    attempt already reached are left out.
+    """
+    events_by_recipient = {}
+    for event in events:
+        delivered_to = set(event.get('delivered_to') or [])
+        for email in get_complaint_recipients(event['payload']):
+            if email not in delivered_to:
+                events_by_recipient.setdefault(email, []).append(event['id'])
+
+    recipients_by_events = {}
+    for email, event_ids in events_by_recipient.items():
+        recipients_by_events.setdefault(tuple(event_ids), []).append(email)
+
+    events_by_id = {event['id']: event for event in events}
+    return [([events_by_id[i] for i in event_ids], recipients)
+            for event_ids, recipients in recipients_by_events.items()]
+
+
+class NotificationDispatcher:
+    """Background thread draining rail_sathi_notification_outbox in batches"""
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.sent_notifications = 0
+        self.emails = 0
+        self.digests = 0
+        self.failed_notifications = 0
+        # Dispatched batches with emails still being sent; dispatcher thread only
+        self._inflight = []
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="NotificationDispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Notification dispatcher started (digest mode: {NOTIFICATION_DIGEST_MODE}, "
+                    f"window: {NOTIFICATION_COALESCE_WINDOW}s)")
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._inflight:
+            # Record what the last sends did before the mail sender stops
+            wait_futures([future for batch in self._inflight for *_, future in batch['pending']], timeout)
+            try:
+                self._settle()
+            except Exception as e:
+                logger.error(f"Failed to record notification outcomes: {e}")
+
+    def wake(self):
+        """Signal that new notifications were queued"""
+        self._wake.set()
+
+    def dispatch(self, events: List[Dict[str, Any]]):
+        """Send one claimed batch and record the outcome of every notification
+
+        Waits up to NOTIFICATION_SEND_DEADLINE for the whole batch. A send
+        still running then is neither failed nor retried: the batch is
+        recorded once it finishes.
+        """
+        groups = {}
+        for event in events:
+            groups.setdefault(event['digest_key'], []).append(event)
+
+        pending = []
+        failed = {}
+        for digest_key, group in groups.items():
+            try:
+                parts = _group_by_recipients(group)
+            except Exception as e:
+                for event in group:
+                    failed[event['id']] = f"Recipient resolution failed: {e!r}"
+                continue
+
+            for part_events, recipients in parts:
+                try:
+                    payloads = [event['payload'] for event in part_events]
+                    if len(payloads) == 1:
+                        subject = build_complaint_subject(payloads[0])
+                        body, html = render_complaint_email(payloads[0])
+                    else:
+                        subject, body, html = build_digest_email(payloads)
+                    # First recipient as TO and the rest as CC, as before
+                    message = build_message(subject, body, recipients[:1], recipients[1:],
+                                            html=html, from_=EMAIL_SENDER)
+                    future = mail_sender.submit(message)
+                    future.add_done_callback(lambda _future: self._wake.set())
+                    pending.append((part_events, recipients, future))
+                except Exception as e:
+                    for event in part_events:
+                        failed[event['id']] = repr(e)
+
+        self._inflight.append({'events': events, 'pending': pending, 'failed': failed,
+                               'delivered': {}, 'refreshed_at': time.monotonic()})
+        wait_futures([future for *_, future in pending], NOTIFICATION_SEND_DEADLINE)
+        self._settle()
+
+    def _settle(self):
+        """Record batches whose sends all finished; keep the others locked"""
+        inflight, self._inflight = self._inflight, []
+        for batch in inflight:
+            running = []
+            for part_events, recipients, future in batch['pending']:
+                if not future.done():
+                    running.append((part_events, recipients, future))
+                    continue
+                try:
+                    future.result()
+                    logger.info(f"Sent notification for complaints {[e['complain_id'] for e in part_events]} "
+                                f"to {len(recipients)} recipients")
+                    for event in part_events:
+                        batch['delivered'].setdefault(event['id'], []).extend(recipients)
+                    with self._stats_lock:
+                        self.emails += 1
+                        if len(part_events) > 1:
+                            self.digests += 1
+                except Exception as e:
+                    for event in part_events:
+                        batch['failed'][event['id']] = repr(e)
+            batch['pending'] = running
+            if running:
+                self._inflight.append(batch)
+                continue
+            try:
+                self._record(batch)
+            except Exception as e:
+                # Left locked; claimed again once the lock times out
+                logger.error(f"Failed to record notification outcomes: {e}")
+
+        stale = [batch for batch in self._inflight
+                 if time.monotonic() - batch['refreshed_at'] >= NOTIFICATION_LOCK_REFRESH]
+        if stale:
+            _refresh_locks([event['id'] for batch in stale for event in batch['events']])
+            for batch in stale:
+                batch['refreshed_at'] = time.monotonic()
+
+    def _record(self, batch: Dict[str, Any]):
+        events, failed = batch['events'], batch['failed']
+        # A notification with no recipients at all is done as well
+        sent_ids = [event['id'] for event in events if event['id'] not in failed]
+        _mark_sent(sent_ids)
+        if failed:
+            _mark_failed([event for event in events if event['id'] in failed],
+                         "; ".join(sorted(set(failed.values())))[:2000], batch['delivered'])
+        with self._stats_lock:
+            self.sent_notifications += len(sent_ids)
+            self.failed_notifications += len(failed)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._inflight:
+                try:
+                    self._settle()
+                except Exception as e:
+                    logger.error(f"Failed to record notification outcomes: {e}")
+            try:
+                events = claim_batch()
+            except Exception as e:
+                logger.error(f"Failed to claim notifications: {e}")
+                events = []
+            if events:
+                try:
+                    self.dispatch(events)
+                except Exception as e:
+                    logger.error(f"Failed to dispatch notifications: {e}")
+                continue
+            self._wake.wait(NOTIFICATION_POLL_INTERVAL)
+            self._wake.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Dispatch counters"""
+        with self._stats_lock:
+            return {
+                'sent_notifications': self.sent_notifications,
+                'failed_notifications': self.failed_notifications,
+                'inflight_batches': len(self._inflight),
+                'emails': self.emails,
+                'digests': self.digests,
+                'digest_mode': NOTIFICATION_DIGEST_MODE,
+                'coalesce_window': NOTIFICATION_COALESCE_WINDOW,
+            }
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+def start_notification_dispatcher():
+    """Start the background notification dispatcher"""
+    notification_dispatcher.start()
+
+
+def stop_notification_dispatcher():
+    """Stop the background notification dispatcher"""
+    notification_dispatcher.stop()
+
+
+def get_notification_stats() -> Dict[str, Any]:
+    """Get notification dispatcher metrics"""
+    return notification_dispatcher.stats()
@@ -0,0 +1,173 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Any, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Statements slower than this (milliseconds) are logged with their parameters
+QUERY_SLOW_THRESHOLD_MS = float(os.getenv('QUERY_SLOW_THRESHOLD_MS', 500))
+# Also log the plan (plain EXPLAIN, the statement is not run again) of slow statements
+QUERY_EXPLAIN_SLOW = os.getenv('QUERY_EXPLAIN_SLOW', 'false').lower() == 'true'
+# Distinct fingerprints tracked; anything beyond is counted under OTHER_FINGERPRINT
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv('QUERY_STATS_MAX_FINGERPRINTS', 500))
+# Longest parameter repr written to the slow-query log
+QUERY_LOG_PARAMS_MAX_LENGTH = 2000
+
+OTHER_FINGERPRINT = '<other>'
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s')
+_NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+_VALUES_RE = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(query: str) -> str:
+    """Normalize a statement so calls that differ only in values group together
+
+    Literals and placeholders become `?`, lists of them (IN lists, VALUES
+    rows) collapse to one, and comments and whitespace are dropped.
+    """
+    normalized = _COMMENT_RE.sub(' ', query)
+    normalized = _STRING_RE.sub('?', normalized)
+    normalized = _PLACEHOLDER_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _SPACE_RE.sub(' ', normalized).strip()
+    normalized = _LIST_RE.sub('?', normalized)
+    normalized = _VALUES_RE.sub('(?)', normalized)
+    return normalized
+
+
+def fingerprint_id(fingerprint_text: str) -> str:
+    """Short stable id for a fingerprint, for logs and dashboards"""
+    return hashlib.md5(fingerprint_text.encode()).hexdigest()[:12]
+
+
+class QueryStats:
+    """Per-fingerprint call counts, wall time and rows, aggregated in process"""
+
+    def __init__(self, max_fingerprints: int = QUERY_STATS_MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+
+    def record(self, query: str, elapsed: float, rows: Optional[int] = None, failed: bool = False):
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    key = OTHER_FINGERPRINT
+                    entry = self._stats.get(key)
+                if entry is None:
+                    entry = self._stats[key] = {
+                        'calls': 0, 'errors': 0, 'slow': 0, 'total_time': 0.0,
+                        'max_time': 0.0, 'rows': 0,
+                    }
+            entry['calls'] += 1
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            if rows is not None and rows > 0:
+                entry['rows'] += rows
+            if failed:
+                entry['errors'] += 1
+            elif elapsed * 1000 >= QUERY_SLOW_THRESHOLD_MS:
+                entry['slow'] += 1
+
+    def snapshot(self, limit: int = 20, order_by: str = 'total_time') -> Dict[str, Any]:
+        """Top fingerprints by total_time, calls, max_time, slow or errors"""
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._stats.items()]
+        total_time = sum(entry['total_time'] for _, entry in items)
+        items.sort(key=lambda item: item[1].get(order_by, 0), reverse=True)
+        queries = []
+        for key, entry in items[:limit]:
+            entry.update(
+                id=fingerprint_id(key),
+                fingerprint=key,
+                total_time=round(entry['total_time'], 6),
+                max_time=round(entry['max_time'], 6),
+                mean_time=round(entry['total_time'] / entry['calls'], 6) if entry['calls'] else 0,
+                share=round(entry['total_time'] / total_time, 4) if total_time else 0,
+            )
+            queries.append(entry)
+        return {
+            'since': self.started_at,
+            'fingerprints': len(items),
+            'total_calls': sum(entry['calls'] for _, entry in items),
+            'total_time': round(total_time, 6),
+            'slow_threshold_ms': QUERY_SLOW_THRESHOLD_MS,
+            'queries': queries,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+# [seconds, statements] of the request being handled. A mutable list rather
+# than a value so statements run in worker threads (which get a copy of the
+# context) still add to the request's totals.
+_request_db_time: ContextVar[Optional[List]] = ContextVar('request_db_time', default=None)
+
+
+def begin_request_db_timing():
+    """Start accumulating DB time for the current request; returns a token"""
+    return _request_db_time.set([0.0, 0])
+
+
+def end_request_db_timing(token) -> Tuple[float, int]:
+    """Stop accumulating; returns (seconds, statements) since begin"""
+    totals = _request_db_time.get() or [0.0, 0]
+    _request_db_time.reset(token)
+    return totals[0], totals[1]
+
+
+def record_query(query: str, elapsed: float, rows: Optional[int] = None, failed: bool = False) -> bool:
+    """Add one statement to the stats; returns True if it was slow"""
+    try:
+        query_stats.record(query, elapsed, rows, failed)
+        totals = _request_db_time.get()
+        if totals is not None:
+            totals[0] += elapsed
+            totals[1] += 1
+    except Exception as e:
+        logger.warning(f"Failed to record query stats: {e}")
+    return not failed and elapsed * 1000 >= QUERY_SLOW_THRESHOLD_MS
+
+
+def log_slow_query(query: str, params, elapsed: float, rows: Optional[int] = None, plan: Optional[str] = None):
+    key = fingerprint(query)
+    params_repr = repr(params)
+    if len(params_repr) > QUERY_LOG_PARAMS_MAX_LENGTH:
+        params_repr = params_repr[:QUERY_LOG_PARAMS_MAX_LENGTH] + '...'
+    message = (f"Slow query {fingerprint_id(key)} took {elapsed * 1000:.1f}ms, rows: {rows}\n"
+               f"Query: {key}\nParams: {params_repr}")
+    if plan:
+        message += f"\nPlan:\n{plan}"
+    logger.warning(message)
+
+
+def get_query_stats(limit: int = 20, order_by: str = 'total_time') -> Dict[str, Any]:
+    """Get the aggregated per-fingerprint query stats"""
+    return query_stats.snapshot(limit, order_by)
+
+
+def reset_query_stats():
+    """Start aggregating from zero"""
+    query_stats.reset()
@@ -0,0 +1,436 @@
+import os
+import json
+import time
+import bisect
+import select
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Any, Tuple
+import psycopg2
+from cachetools import TTLCache
+from database import DB_CONFIG, get_db_connection, execute_query
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds before recipients are reloaded even without a change signal
+RECIPIENT_CACHE_TTL = float(os.getenv('RECIPIENT_CACHE_TTL', 300))
+# Number of depots whose resolved recipients are kept
+RECIPIENT_CACHE_MAX_DEPOTS = int(os.getenv('RECIPIENT_CACHE_MAX_DEPOTS', 1000))
+
+# NOTIFY channel fired by triggers on the user and access tables (see schema.py)
+RECIPIENT_CHANGE_CHANNEL = 'rail_sathi_recipients_changed'
+
+WAR_ROOM_ROLE = 'war room user'
+S2_ADMIN_ROLE = 's2 admin'
+RAILWAY_ADMIN_ROLE = 'railway admin'
+RECIPIENT_ROLES = [WAR_ROOM_ROLE, S2_ADMIN_ROLE, RAILWAY_ADMIN_ROLE]
+
+ROLE_USERS_QUERY = """
+    SELECT u.*, ut.name AS role_name
+    FROM user_onboarding_user u
+    JOIN user_onboarding_roles ut ON u.user_type_id = ut.id
+    WHERE ut.name = ANY(%s)
+    ORDER BY u.id
+"""
+
+TRAIN_ACCESS_QUERY = """
+    SELECT u.email, u.id, u.first_name, u.last_name, ta.train_details
+    FROM user_onboarding_user u
+    JOIN trains_trainaccess ta ON ta.user_id = u.id
+    WHERE ta.train_details IS NOT NULL
+    AND ta.train_details != '{}'
+    AND ta.train_details != 'null'
+    ORDER BY ta.id
+"""
+
+
+class RecipientCache:
+    """Notification recipients per role and per depot, reloaded on change or TTL"""
+
+    def __init__(self, ttl: float = RECIPIENT_CACHE_TTL, max_depots: int = RECIPIENT_CACHE_MAX_DEPOTS):
+        self.ttl = ttl
+        self.max_depots = max_depots
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._role_users: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._depots = TTLCache(maxsize=max_depots, ttl=ttl)
+        self._generation = 0
+        self.loaded_at = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        # One load at a time; concurrent callers wait for it instead of
+        # all hitting the database
+        with self._load_lock:
+            with self._lock:
+                if self._role_users is not None and time.time() - self.loaded_at < self.ttl:
+                    return self._role_users
+                generation = self._generation
+
+            conn = get_db_connection()
+            try:
+                rows = execute_query(conn, ROLE_USERS_QUERY, (RECIPIENT_ROLES,))
+            finally:
+                conn.close()
+
+            role_users = {role: [] for role in RECIPIENT_ROLES}
+            for row in rows or []:
+                role_users[row.pop('role_name')].append(row)
+
+            with self._lock:
+                self.loads += 1
+                # An invalidation during the query means the result may be stale
+                if generation == self._generation:
+                    self._role_users = role_users
+                    self._depots.clear()
+                    self.loaded_at = time.time()
+            return role_users
+
+    def _get_role_users(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            if self._role_users is not None and time.time() - self.loaded_at < self.ttl:
+                return self._role_users
+        return self._load()
+
+    def get_role_users(self, role: str) -> List[Dict[str, Any]]:
+        """Users holding a recipient role"""
+        return list(self._get_role_users().get(role, []))
+
+    def get_depot_recipients(self, depot: str) -> Dict[str, List[Dict[str, Any]]]:
+        """War room users of a depot plus the s2 and railway admins
+
+        Matches war room users whose `depo` contains the depot name, like the
+        previous `depo LIKE '%depot%'` query did.
+        """
+        depot = depot or ''
+        with self._lock:
+            recipients = self._depots.get(depot)
+            if recipients is not None and self._role_users is not None \
+                    and time.time() - self.loaded_at < self.ttl:
+                self.hits += 1
+                return recipients
+            self.misses += 1
+
+        role_users = self._get_role_users()
+        recipients = {
+            'war_room_users': [u for u in role_users[WAR_ROOM_ROLE] if u.get('depo') is not None and depot in u['depo']],
+            's2_admin_users': role_users[S2_ADMIN_ROLE],
+            'railway_admin_users': role_users[RAILWAY_ADMIN_ROLE],
+        }
+        with self._lock:
+            if self._role_users is role_users:
+                self._depots[depot] = recipients
+        return recipients
+
+    def invalidate(self):
+        """Drop everything; the next lookup reloads"""
+        with self._lock:
+            self._generation += 1
+            self._role_users = None
+            self._depots.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'invalidations': self.invalidations,
+                'depots': len(self._depots),
+                'users': sum(len(users) for users in (self._role_users or {}).values()),
+                'ttl': self.ttl,
+                'loaded_at': self.loaded_at,
+            }
+
+
+# (origin_date, end_date, user); end_date None means "ongoing"
+AccessPeriod = Tuple[date, Optional[date], Dict[str, Any]]
+
+
+class _IntervalTree:
+    """Static centered interval tree over closed access periods
+
+    Each node keeps the periods containing its center date, sorted by
+    origin_date and by end_date; a point lookup walks one root-to-leaf path
+    and only reads periods that contain the date, so it costs
+    O(log n + matches) however much history a train has.
+    """
+
+    __slots__ = ('center', 'by_origin', 'by_end', 'left', 'right')
+
+    def __init__(self, periods: List[AccessPeriod]):
+        # Median endpoint keeps the tree balanced
+        endpoints = sorted(d for origin_date, end_date, _ in periods for d in (origin_date, end_date))
+        self.center = endpoints[len(endpoints) // 2]
+        left, right, here = [], [], []
+        for period in periods:
+            if period[1] < self.center:
+                left.append(period)
+            elif period[0] > self.center:
+                right.append(period)
+            else:
+                here.append(period)
+        self.by_origin = sorted(here, key=lambda p: p[0])
+        self.by_end = sorted(here, key=lambda p: p[1], reverse=True)
+        self.left = _IntervalTree(left) if left else None
+        self.right = _IntervalTree(right) if right else None
+
+    def containing(self, on_date: date) -> List[AccessPeriod]:
+        """Periods with origin_date <= on_date <= end_date"""
+        found = []
+        node = self
+        while node is not None:
+            if on_date < node.center:
+                for period in node.by_origin:
+                    if period[0] > on_date:
+                        break
+                    found.append(period)
+                node = node.left
+            elif on_date > node.center:
+                for period in node.by_end:
+                    if period[1] < on_date:
+                        break
+                    found.append(period)
+                node = node.right
+            else:
+                found.extend(node.by_origin)
+                break
+        return found
+
+
+class _TrainPeriods:
+    """Access periods of one train, indexed for point-in-time lookups"""
+
+    __slots__ = ('periods', 'ongoing_origins', 'ongoing', 'closed')
+
+    def __init__(self, periods: List[AccessPeriod]):
+        self.periods = sorted(periods, key=lambda p: p[0])
+        # Ongoing periods contain every date from their origin on: a bisect
+        # on origin_date finds exactly the matching ones
+        self.ongoing = [p for p in self.periods if p[1] is None]
+        self.ongoing_origins = [p[0] for p in self.ongoing]
+        closed = [p for p in self.periods if p[1] is not None]
+        self.closed = _IntervalTree(closed) if closed else None
+
+    def containing(self, on_date: date) -> List[AccessPeriod]:
+        found = self.ongoing[:bisect.bisect_right(self.ongoing_origins, on_date)]
+        if self.closed is not None:
+            found += self.closed.containing(on_date)
+            # Same order as before the index: by origin_date
+            found.sort(key=lambda p: p[0])
+        return found
+
+
+class TrainAccessIndex:
+    """In-memory interval index of trains_trainaccess: train_no -> access periods
+
+    The train_details JSON of every user is parsed once per load into
+    (origin_date, end_date, user) periods per train, held in an interval
+    index (_TrainPeriods), so finding who is assigned to a train on a date
+    only touches the periods containing it instead of every user's JSON.
+    An end_date of None means "ongoing".
+    """
+
+    def __init__(self, ttl: float = RECIPIENT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._periods: Optional[Dict[str, _TrainPeriods]] = None
+        self._generation = 0
+        self.loaded_at = None
+        self.loads = 0
+        self.invalidations = 0
+        self.skipped_entries = 0
+
+    def _build(self, rows: List[Dict[str, Any]]):
+        periods_by_train = {}
+        skipped = 0
+        for row in rows or []:
+            train_details = row.pop('train_details')
+            try:
+                if isinstance(train_details, str):
+                    train_details = json.loads(train_details)
+                accesses_by_train = dict(train_details or {})
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Skipping train access for user {row.get('id')}: {e}")
+                skipped += 1
+                continue
+            for train_no, accesses in accesses_by_train.items():
+                for access in accesses or []:
+                    # Same tolerance as before: a malformed period is skipped on its own
+                    try:
+                        origin_date = datetime.strptime(access.get('origin_date', ''), "%Y-%m-%d").date()
+                        end_date_str = access.get('end_date', '')
+                        end_date = None if end_date_str == 'ongoing' else datetime.strptime(end_date_str, "%Y-%m-%d").date()
+                    except (ValueError, TypeError, AttributeError):
+                        skipped += 1
+                        continue
+                    periods_by_train.setdefault(str(train_no).strip(), []).append((origin_date, end_date, row))
+
+        index = {train_no: _TrainPeriods(periods) for train_no, periods in periods_by_train.items()}
+        return index, skipped
+
+    def _get_periods(self):
+        with self._lock:
+            if self._periods is not None and time.time() - self.loaded_at < self.ttl:
+                return self._periods
+        with self._load_lock:
+            with self._lock:
+                if self._periods is not None and time.time() - self.loaded_at < self.ttl:
+                    return self._periods
+                generation = self._generation
+
+            conn = get_db_connection()
+            try:
+                rows = execute_query(conn, TRAIN_ACCESS_QUERY)
+            finally:
+                conn.close()
+            index, skipped = self._build(rows)
+
+            with self._lock:
+                self.loads += 1
+                self.skipped_entries = skipped
+                if generation == self._generation:
+                    self._periods = index
+                    self.loaded_at = time.time()
+            logger.info(f"Train access index built for {len(index)} trains from {len(rows or [])} users")
+            return index
+
+    def get_users(self, train_no: str, on_date: date) -> List[Dict[str, Any]]:
+        """Users assigned to train_no on on_date, each user once"""
+        entry = self._get_periods().get(str(train_no).strip())
+        if not entry:
+            return []
+        users = {}
+        for _, _, user in entry.containing(on_date):
+            users.setdefault(user['id'], user)
+        return list(users.values())
+
+    def get_periods(self, train_no: str) -> List[AccessPeriod]:
+        """Every access period recorded for train_no, by origin_date"""
+        entry = self._get_periods().get(str(train_no).strip())
+        return list(entry.periods) if entry else []
+
+    def invalidate(self):
+        """Drop the index; the next lookup rebuilds it"""
+        with self._lock:
+            self._generation += 1
+            self._periods = None
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'invalidations': self.invalidations,
+                'trains': len(self._periods or {}),
+                'periods': sum(len(entry.periods) for entry in (self._periods or {}).values()),
+                'skipped_entries': self.skipped_entries,
+                'ttl': self.ttl,
+                'loaded_at': self.loaded_at,
+            }
+
+
+class RecipientChangeListener:
+    """Background thread that LISTENs for recipient changes and invalidates the caches"""
+
+    def __init__(self, caches: List[Any], channel: str = RECIPIENT_CHANGE_CHANNEL):
+        self.caches = caches
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RecipientChangeListener", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _invalidate(self):
+        for cache in self.caches:
+            cache.invalidate()
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            conn = None
+            try:
+                # A dedicated connection: LISTEN is tied to the session, so it
+                # cannot come from the shared pool
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                # Anything changed while we were not listening is unknown
+                self._invalidate()
+                logger.info(f"Listening for recipient changes on {self.channel}")
+                backoff = 1
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        tables = {n.payload for n in conn.notifies}
+                        conn.notifies.clear()
+                        logger.info(f"Recipients changed ({', '.join(sorted(tables))}), invalidating cache")
+                        self._invalidate()
+            except Exception as e:
+                logger.warning(f"Recipient change listener error, retrying in {backoff}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+recipient_cache = RecipientCache()
+train_access_index = TrainAccessIndex()
+recipient_change_listener = RecipientChangeListener([recipient_cache, train_access_index])
+
+
+def get_depot_recipients(depot: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Get war room users for a depot plus s2 and railway admins"""
+    return recipient_cache.get_depot_recipients(depot)
+
+
+def get_train_access_users(train_no: str, on_date: date) -> List[Dict[str, Any]]:
+    """Get users assigned to a train on a date"""
+    return train_access_index.get_users(train_no, on_date)
+
+
+def invalidate_recipient_cache():
+    """Invalidate all cached recipients and the train access index"""
+    recipient_cache.invalidate()
+    train_access_index.invalidate()
+
+
+def get_recipient_cache_stats() -> Dict[str, Any]:
+    """Get recipient cache and train access index metrics"""
+    return {**recipient_cache.stats(), 'train_access': train_access_index.stats()}
+
+
+def start_recipient_listener():
+    """Start invalidating the recipient cache on database change signals"""
+    recipient_change_listener.start()
+
+
+def stop_recipient_listener():
+    """Stop the recipient change listener"""
+    recipient_change_listener.stop()
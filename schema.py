@@ -0,0 +1,216 @@
+import logging
+import threading
+import psycopg2
+from database import DB_CONFIG, get_db_connection
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tables, columns and indexes owned by this service. Every statement must be
+# idempotent: they run on every startup.
+SCHEMA_STATEMENTS = [
+    # Durable queue of uploaded media waiting to be processed (see media_jobs.py)
+    """
+    CREATE TABLE IF NOT EXISTS rail_sathi_media_job (
+        id BIGSERIAL PRIMARY KEY,
+        complain_id INTEGER NOT NULL,
+        media_type VARCHAR(10) NOT NULL,
+        file_path TEXT NOT NULL,
+        spool_host VARCHAR(255) NOT NULL,
+        original_filename TEXT,
+        content_type VARCHAR(255),
+        file_size BIGINT,
+        created_by VARCHAR(255),
+        status VARCHAR(20) NOT NULL DEFAULT 'processing',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+        locked_at TIMESTAMP,
+        media_id INTEGER,
+        media_url TEXT,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS rail_sathi_media_job_pending_idx
+    ON rail_sathi_media_job (spool_host, next_attempt_at)
+    WHERE status = 'processing'
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS rail_sathi_media_job_complain_idx
+    ON rail_sathi_media_job (complain_id)
+    """,
+    # SHA-256 of the upload, computed while it is streamed to the spool
+    """
+    ALTER TABLE rail_sathi_media_job ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)
+    """,
+    # Resized copies of an image (thumbnail, medium, ...) with their URLs and sizes
+    """
+    ALTER TABLE rail_sathi_railsathicomplainmedia ADD COLUMN IF NOT EXISTS variants JSONB
+    """,
+    # SHA-256 of the uploaded file, so a resubmitted file reuses the stored object
+    """
+    ALTER TABLE rail_sathi_railsathicomplainmedia ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS rail_sathi_complainmedia_content_hash_idx
+    ON rail_sathi_railsathicomplainmedia (content_hash, media_type)
+    WHERE content_hash IS NOT NULL
+    """,
+    # Transactional outbox of complaint notifications (see notification_outbox.py)
+    """
+    CREATE TABLE IF NOT EXISTS rail_sathi_notification_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        event_type VARCHAR(50) NOT NULL,
+        complain_id INTEGER,
+        digest_key VARCHAR(255) NOT NULL,
+        payload JSONB NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+        locked_at TIMESTAMP,
+        sent_at TIMESTAMP,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS rail_sathi_notification_outbox_pending_idx
+    ON rail_sathi_notification_outbox (digest_key, created_at)
+    WHERE status = 'pending'
+    """,
+    # Recipients a notification already reached, so a retry after a partial
+    # failure only goes to the ones that did not get it
+    """
+    ALTER TABLE rail_sathi_notification_outbox ADD COLUMN IF NOT EXISTS delivered_to TEXT[] NOT NULL DEFAULT '{}'
+    """,
+    # Change signal for the recipient cache (see recipient_cache.py). The
+    # user and access tables belong to the main application, so triggers are
+    # only added where the tables exist and we are allowed to; otherwise the
+    # cache falls back to its TTL.
+    """
+    CREATE OR REPLACE FUNCTION rail_sathi_notify_recipients_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('rail_sathi_recipients_changed', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$
+    DECLARE
+        table_name TEXT;
+    BEGIN
+        FOREACH table_name IN ARRAY ARRAY['user_onboarding_user', 'user_onboarding_roles', 'trains_trainaccess'] LOOP
+            IF to_regclass(table_name) IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgname = 'rail_sathi_recipients_changed' AND tgrelid = to_regclass(table_name)
+            ) THEN
+                BEGIN
+                    EXECUTE format(
+                        'CREATE TRIGGER rail_sathi_recipients_changed '
+                        'AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+                        'FOR EACH STATEMENT EXECUTE FUNCTION rail_sathi_notify_recipients_changed()',
+                        table_name
+                    );
+                EXCEPTION WHEN insufficient_privilege THEN
+                    RAISE WARNING 'Cannot add recipient change trigger on %', table_name;
+                END;
+            END IF;
+        END LOOP;
+    END
+    $$
+    """,
+]
+
+
+# Keyset pagination indexes for complaint search (see complaint_search.py),
+# as (name, leading columns). The complaint table belongs to the main
+# application and is written constantly, so these are built with CREATE
+# INDEX CONCURRENTLY outside the schema transaction; a missing privilege
+# leaves search working, just without the index.
+COMPLAINT_SEARCH_INDEXES = [
+    ('rail_sathi_complain_created_idx', ''),
+    ('rail_sathi_complain_train_number_created_idx', 'train_number, '),
+    ('rail_sathi_complain_train_id_created_idx', 'train_id, '),
+    ('rail_sathi_complain_status_created_idx', 'complain_status, '),
+    ('rail_sathi_complain_type_created_idx', 'complain_type, '),
+]
+
+
+def ensure_schema() -> bool:
+    """Apply SCHEMA_STATEMENTS in a single transaction"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        # Serialize concurrent startups of several workers/pods
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('rail_sathi_schema'))")
+        for statement in SCHEMA_STATEMENTS:
+            cursor.execute(statement)
+        conn.commit()
+        logger.info("Service schema is up to date")
+        return True
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Failed to apply service schema: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+
+def ensure_indexes() -> bool:
+    """Build missing COMPLAINT_SEARCH_INDEXES without blocking writes
+
+    An index left invalid by an interrupted concurrent build is dropped and
+    built again. Only one process builds at a time; the others skip.
+    """
+    # A dedicated autocommit connection: CREATE INDEX CONCURRENTLY cannot run
+    # in a transaction block, and a build may take a pool slot for minutes
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('rail_sathi_schema_indexes'))")
+        if not cursor.fetchone()[0]:
+            logger.info("Complaint search indexes are being built by another process")
+            return False
+        ok = True
+        for name, columns in COMPLAINT_SEARCH_INDEXES:
+            try:
+                cursor.execute("""
+                    SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)
+                """, (name,))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    continue
+                if row:
+                    logger.warning(f"Rebuilding invalid index {name}")
+                    cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+                logger.info(f"Building index {name}")
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+                    f'ON rail_sathi_railsathicomplain ({columns}created_at DESC, complain_id DESC)'
+                )
+            except psycopg2.errors.InsufficientPrivilege:
+                logger.warning(f"Cannot create index {name}")
+                ok = False
+            except Exception as e:
+                logger.error(f"Failed to build index {name}: {str(e)}")
+                ok = False
+        return ok
+    except Exception as e:
+        logger.error(f"Failed to build complaint search indexes: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+
+def start_index_build() -> threading.Thread:
+    """Run ensure_indexes in the background so startup does not wait for it"""
+    thread = threading.Thread(target=ensure_indexes, name="SchemaIndexBuild", daemon=True)
+    thread.start()
+    return thread
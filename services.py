@@ -1,17 +1,19 @@
 import os
-import io
 import logging
 import uuid
-import threading
 import re
+import pytz
 from datetime import datetime, date
 from typing import List, Dict, Optional, Any
-from google.cloud import storage
-from PIL import Image
-from moviepy.editor import VideoFileClip
 from urllib.parse import unquote
-from database import get_db_connection, execute_query, execute_query_one
-from utils.email_utils import send_plain_mail, send_passenger_complain_email
+from database import get_db_connection, execute_query, execute_query_one, UnitOfWork, unit_of_work
+import async_database
+from train_cache import get_train_by_id, get_train_by_number
+from transcoder import transcode_video
+from psycopg2.extras import Json
+from image_pipeline import process_image, close_outputs
+from storage_backend import get_storage_backend, get_gcs_backend, GCS_BUCKET_NAME, PROJECT_ID
+from notification_outbox import enqueue_notification, notification_dispatcher, EVENT_COMPLAINT_CREATED
 from dotenv import load_dotenv
 from fastapi import FastAPI, Form, File, UploadFile, HTTPException
 import asyncio
@@ -22,17 +24,11 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Configuration from environment
-GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', 'sanchalak-media-bucket1')
-PROJECT_ID = os.getenv('PROJECT_ID', 'sanchalak-423912')
-
 
 def get_gcs_client():
-    """Get authenticated GCS client using environment variables"""
+    """Get the shared, authenticated GCS client (created once per process)"""
     try:
-        # storage.Client() will automatically use GOOGLE_APPLICATION_CREDENTIALS from .env
-        client = storage.Client(project=PROJECT_ID)
-        return client
+        return get_gcs_backend().client
     except Exception as e:
         print(f"Failed to create GCS client: {e}")
         raise
@@ -50,78 +46,84 @@ def sanitize_timestamp(raw_timestamp):
     decoded = unquote(raw_timestamp)
     return get_valid_filename(decoded).replace(":", "_")
 
-def process_media_file_upload(file_content, file_format, complain_id, media_type):
-    """Process and upload media file to Google Cloud Storage"""
+def process_media(file_path, file_format, complain_id, media_type) -> Dict[str, Any]:
+    """Process a media file on disk and upload it to the configured storage backend
+
+    Returns the URL of the stored file and, for images, its variants as
+    {name: {url, width, height, size, content_type}}.
+    """
     try:
         created_at = datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f")
         unique_id = str(uuid.uuid4())[:5]
-        full_file_name = f"rail_sathi_complain_{complain_id}_{sanitize_timestamp(created_at)}_{unique_id}.{file_format}"
+        base_name = f"rail_sathi_complain_{complain_id}_{sanitize_timestamp(created_at)}_{unique_id}"
+        full_file_name = f"{base_name}.{file_format}"
 
-        # Use the authenticated client
-        client = get_gcs_client()
-        bucket = client.bucket(GCS_BUCKET_NAME)
-        blob = None
+        storage_backend = get_storage_backend()
+        url = None
+        variants = None
 
         if media_type == "image":
-            file_stream = io.BytesIO(file_content)
-            original_image = Image.open(file_stream)
-            if original_image.mode == 'RGBA':
-                original_image = original_image.convert('RGB')
-            new_file = io.BytesIO()
-            original_image.save(new_file, format='JPEG')
-            new_file.seek(0)
-            key = f"rail_sathi_complain_images/{full_file_name}"
-            blob = bucket.blob(key)
-            blob.upload_from_file(new_file, content_type='image/jpeg')
-            print(f"rail_sathi_complain_images Image uploaded: {full_file_name}")
+            outputs = process_image(file_path)
+            try:
+                variants = {}
+                for output in outputs:
+                    suffix = '' if output['name'] == 'original' else f"_{output['name']}"
+                    key = f"rail_sathi_complain_images/{base_name}{suffix}.{output['extension']}"
+                    variants[output['name']] = {
+                        'url': storage_backend.upload_file(output['file'], key, output['content_type']),
+                        'width': output['width'],
+                        'height': output['height'],
+                        'size': output['size'],
+                        'content_type': output['content_type'],
+                    }
+                url = variants['original']['url']
+            finally:
+                close_outputs(outputs)
+            print(f"rail_sathi_complain_images Image uploaded: {base_name} ({', '.join(variants)})")
 
         elif media_type == "video":
+            temp_dir = "/tmp/rail_sathi_temp"
+            os.makedirs(temp_dir, exist_ok=True)
+            
+            compressed_file_path = os.path.join(temp_dir, f"compressed_{full_file_name}.mp4")
             try:
-                temp_dir = "/tmp/rail_sathi_temp"
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                temp_file_path = os.path.join(temp_dir, full_file_name)
-                compressed_file_path = os.path.join(temp_dir, f"compressed_{full_file_name}")
-                
-                with open(temp_file_path, 'wb') as temp_file:
-                    temp_file.write(file_content)
-                
-                clip = VideoFileClip(temp_file_path)
-                target_bitrate = '5000k'
-                try:
-                    clip.write_videofile(compressed_file_path, codec='libx264', bitrate=target_bitrate)
-                    clip.close()
-                except Exception as e:
-                    print(f"Error compressing video: {e}")
+                # Runs in the transcoder process pool; raises on failure,
+                # queue back-pressure or timeout so the media job is retried
+                result = transcode_video(file_path, compressed_file_path)
                 
                 key = f"rail_sathi_complain_videos/{full_file_name}"
-                blob = bucket.blob(key)
-                with open(compressed_file_path, 'rb') as temp_file:
-                    blob.upload_from_file(temp_file, content_type='video/mp4')
+                url = storage_backend.upload_path(result['output_path'], key, 'video/mp4')
                 print(f"rail_sathi_complain_videos Video uploaded: {full_file_name}")
-            except Exception as e:
-                print(f'Error while storing video: {repr(e)}')
             finally:
                 if os.path.exists(compressed_file_path):
                     os.remove(compressed_file_path)
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
 
-        if blob:
-            try:
-                url = blob.public_url
-                print(f"Uploaded file URL: {url}")
-                return url
-            except Exception as e:
-                print(f"Failed to get public URL: {e}")
-                return None
+        if url:
+            print(f"Uploaded file URL: {url}")
         else:
-            print("Upload failed (blob is None)")
-            return None
+            print("Upload failed (no URL returned)")
+        return {'url': url, 'variants': variants}
     except Exception as e:
         print(f"Error processing media file: {e}")
         raise e
 
+def process_media_file(file_path, file_format, complain_id, media_type):
+    """Process a media file on disk and return the URL of the uploaded file"""
+    return process_media(file_path, file_format, complain_id, media_type)['url']
+
+def process_media_file_upload(file_content, file_format, complain_id, media_type):
+    """Process and upload in-memory media file content to Google Cloud Storage"""
+    temp_dir = "/tmp/rail_sathi_temp"
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_file_path = os.path.join(temp_dir, f"upload_{uuid.uuid4().hex}.{file_format}")
+    try:
+        with open(temp_file_path, 'wb') as temp_file:
+            temp_file.write(file_content)
+        return process_media_file(temp_file_path, file_format, complain_id, media_type)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
 def upload_file_thread(file_obj, complain_id, user):
     """Upload file in a separate thread with improved error handling"""
     try:
@@ -190,6 +192,56 @@ def upload_file_thread(file_obj, complain_id, user):
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
 
+def save_media_record(complain_id: int, media_type: str, media_url: str, user: str, conn=None,
+                      variants: Optional[Dict[str, Any]] = None, content_hash: Optional[str] = None) -> int:
+    """Insert a rail_sathi_railsathicomplainmedia row and return its id
+
+    When a connection is passed the caller owns the transaction.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        query = """
+            INSERT INTO rail_sathi_railsathicomplainmedia 
+            (complain_id, media_type, media_url, variants, content_hash, created_by, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """
+        now = datetime.now()
+        cursor = conn.cursor()
+        cursor.execute(query, (
+            complain_id, media_type, media_url, Json(variants) if variants else None,
+            content_hash, user, now, now
+        ))
+        media_id = cursor.fetchone()[0]
+        if own_conn:
+            conn.commit()
+        logger.info(f"Media record {media_id} created successfully for complaint {complain_id}")
+        return media_id
+    except Exception:
+        if own_conn:
+            conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_media_by_content_hash(content_hash: str, media_type: str, complain_id: Optional[int] = None) -> Optional[Dict]:
+    """Find an already stored media file with the same content, preferring complain_id's own"""
+    conn = get_db_connection()
+    try:
+        query = """
+            SELECT id, complain_id, media_url, variants
+            FROM rail_sathi_railsathicomplainmedia
+            WHERE content_hash = %s AND media_type = %s AND media_url IS NOT NULL
+            ORDER BY (complain_id = %s) DESC, id
+            LIMIT 1
+        """
+        return execute_query_one(conn, query, (content_hash, media_type, complain_id))
+    finally:
+        conn.close()
+
 async def upload_file_async(file_obj: UploadFile, complain_id: int, user: str):
     """Async version of file upload"""
     try:
@@ -263,8 +315,7 @@ def test_gcs_connection():
         print(f"Bucket Name: {GCS_BUCKET_NAME}")
         print(f"Credentials Path: {os.getenv('GOOGLE_APPLICATION_CREDENTIALS')}")
         
-        client = get_gcs_client()
-        bucket = client.bucket(GCS_BUCKET_NAME)
+        bucket = get_gcs_backend().bucket
         bucket.reload()  # This will fail if no access
         
         print(f"✓ Successfully connected to bucket: {GCS_BUCKET_NAME}")
@@ -275,215 +326,201 @@ def test_gcs_connection():
         print(f"✗ Failed to connect to GCS bucket: {e}")
         return False
     
-def validate_and_process_train_data(complaint_data):
+# Complaint row plus its media files aggregated into a JSON array, so a
+# single round trip returns everything the API needs. {source} is the
+# complaint table, or a CTE of rows returned by an INSERT/UPDATE.
+COMPLAINT_SELECT_TEMPLATE = """
+    SELECT c.*, t.train_no, t.train_name, t."Depot" as train_depot,
+           COALESCE(m.media_files, '[]'::json) AS rail_sathi_complain_media_files
+    FROM {source} c
+    LEFT JOIN trains_traindetails t ON c.train_id = t.id
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+                   'id', cm.id,
+                   'media_type', cm.media_type,
+                   'media_url', cm.media_url,
+                   'variants', cm.variants,
+                   'created_at', cm.created_at,
+                   'updated_at', cm.updated_at,
+                   'created_by', cm.created_by,
+                   'updated_by', cm.updated_by
+               ) ORDER BY cm.id) AS media_files
+        FROM rail_sathi_railsathicomplainmedia cm
+        WHERE cm.complain_id = c.complain_id
+    ) m ON TRUE
+"""
+
+COMPLAINT_SELECT_QUERY = COMPLAINT_SELECT_TEMPLATE.format(source='rail_sathi_railsathicomplain')
+
+
+def complaint_write_query(write_query: str) -> str:
+    """Wrap an INSERT/UPDATE ... RETURNING * so it returns the full complaint
+
+    The written row comes back from the same statement, with train details
+    and media files joined in, instead of being read again afterwards.
+    """
+    return f"WITH written AS ({write_query}) " + COMPLAINT_SELECT_TEMPLATE.format(source='written')
+
+def validate_and_process_train_data(complaint_data, conn=None):
     """Validate and process train data"""
-    conn = get_db_connection()
-    try:
-        if complaint_data.get('train_id'):
-            # Get train details by ID
-            query = "SELECT * FROM trains_traindetails WHERE id = %s"
-            train = execute_query_one(conn, query, (complaint_data['train_id'],))
-            if train:
-                complaint_data['train_number'] = train['train_no']
-                complaint_data['train_name'] = train['train_name']
-        elif complaint_data.get('train_number'):
-            # Get train details by number
-            query = "SELECT * FROM trains_traindetails WHERE train_no = %s"
-            train = execute_query_one(conn, query, (complaint_data['train_number'],))
-            if train:
-                complaint_data['train_id'] = train['id']
-                complaint_data['train_name'] = train['train_name']
-        
-        return complaint_data
-    finally:
-        conn.close()
+    if complaint_data.get('train_id'):
+        # Get train details by ID
+        train = get_train_by_id(complaint_data['train_id'], conn)
+        if train:
+            complaint_data['train_number'] = train['train_no']
+            complaint_data['train_name'] = train['train_name']
+    elif complaint_data.get('train_number'):
+        # Get train details by number
+        train = get_train_by_number(complaint_data['train_number'], conn)
+        if train:
+            complaint_data['train_id'] = train['id']
+            complaint_data['train_name'] = train['train_name']
+    
+    return complaint_data
 
-def create_complaint(complaint_data):
-    """Create a new complaint"""
-    conn = get_db_connection()
-    try:
-        # Validate and process train data
-        complaint_data = validate_and_process_train_data(complaint_data)
+# Columns written when a complaint is created, in insert order
+COMPLAINT_INSERT_COLUMNS = (
+    'pnr_number', 'is_pnr_validated', 'name', 'mobile_number', 'complain_type',
+    'complain_description', 'complain_date', 'complain_status', 'train_id',
+    'train_number', 'train_name', 'coach', 'berth_no', 'created_by', 'created_at', 'updated_at'
+)
 
-        # Handle date_of_journey - use current date if not provided or invalid
-        date_of_journey_str = complaint_data.get('date_of_journey')
-        if date_of_journey_str:
-            try:
-                date_of_journey = datetime.strptime(date_of_journey_str, "%Y-%m-%d")
-            except (ValueError, TypeError):
-                # If date format is invalid, use current date
-                date_of_journey = datetime.now()
-        else:
-            # If date is None or empty, use current date
+def prepare_complaint(complaint_data, conn=None):
+    """Resolve train data and dates of a new complaint
+
+    Returns (complaint_data, insert values in COMPLAINT_INSERT_COLUMNS order,
+    date_of_journey).
+    """
+    # Validate and process train data
+    complaint_data = validate_and_process_train_data(complaint_data, conn)
+
+    # Handle date_of_journey - use current date if not provided or invalid
+    date_of_journey_str = complaint_data.get('date_of_journey')
+    if date_of_journey_str:
+        try:
+            date_of_journey = datetime.strptime(date_of_journey_str, "%Y-%m-%d")
+        except (ValueError, TypeError):
+            # If date format is invalid, use current date
             date_of_journey = datetime.now()
+    else:
+        # If date is None or empty, use current date
+        date_of_journey = datetime.now()
 
-        # Handle complain_date
-        complain_date = complaint_data.get('complain_date')
-        if isinstance(complain_date, str):
-            try:
-                complain_date = datetime.strptime(complain_date, '%Y-%m-%d').date()
-            except ValueError:
-                complain_date = date.today()
-        elif complain_date is None:
+    # Handle complain_date
+    complain_date = complaint_data.get('complain_date')
+    if isinstance(complain_date, str):
+        try:
+            complain_date = datetime.strptime(complain_date, '%Y-%m-%d').date()
+        except ValueError:
             complain_date = date.today()
-            
+    elif complain_date is None:
+        complain_date = date.today()
+
+    now = datetime.now()
+    values = (
+        complaint_data.get('pnr_number'),
+        complaint_data.get('is_pnr_validated', 'not-attempted'),
+        complaint_data.get('name'),
+        complaint_data.get('mobile_number'),
+        complaint_data.get('complain_type'),
+        complaint_data.get('complain_description'),
+        complain_date,
+        complaint_data.get('complain_status', 'pending'),
+        complaint_data.get('train_id'),
+        complaint_data.get('train_number'),
+        complaint_data.get('train_name'),
+        complaint_data.get('coach'),
+        complaint_data.get('berth_no'),
+        complaint_data.get('created_by'),
+        now,
+        now
+    )
+    return complaint_data, values, date_of_journey
+
+def complaint_notification_details(complaint_data, complain_id: int, train_depo: str, date_of_journey: datetime):
+    """Payload of the complaint-created notification"""
+    return {
+        'train_no': complaint_data.get('train_number', ''),
+        'train_name': complaint_data.get('train_name', ''),
+        'user_phone_number': complaint_data.get('mobile_number', ''),
+        'passenger_name': complaint_data.get('name', ''),
+        'pnr': complaint_data.get('pnr_number', ''),
+        'berth': complaint_data.get('berth_no', ''),
+        'coach': complaint_data.get('coach', ''),
+        'complain_id': complain_id,
+        'description': complaint_data.get('complain_description', ''),
+        'train_depo': train_depo,
+        'date_of_journey': date_of_journey.strftime("%d %b %Y"),
+        'submitted_at': datetime.now(pytz.timezone('Asia/Kolkata')).strftime("%d %b %Y, %H:%M"),
+    }
+
+def create_complaint(complaint_data, uow: Optional[UnitOfWork] = None):
+    """Create a new complaint
+
+    Train lookup, insert and notification share the unit of work's
+    connection; pass a request's unit of work to commit it with the rest.
+    """
+    with unit_of_work(uow) as uow:
+        conn = uow.connection
+        complaint_data, values, date_of_journey = prepare_complaint(complaint_data, conn)
         
-        # Insert complaint - PostgreSQL version with RETURNING clause
-        query = """
+        # Insert complaint; RETURNING hands back the full row in one round trip
+        query = f"""
             INSERT INTO rail_sathi_railsathicomplain 
-            (pnr_number, is_pnr_validated, name, mobile_number, complain_type, 
-             complain_description, complain_date, complain_status, train_id, 
-             train_number, train_name, coach, berth_no, created_by, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING complain_id
+            ({', '.join(COMPLAINT_INSERT_COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(COMPLAINT_INSERT_COLUMNS))})
+            RETURNING *
         """
-        now = datetime.now()
-        cursor = conn.cursor()
-        cursor.execute(query, (
-            complaint_data.get('pnr_number'),
-            complaint_data.get('is_pnr_validated', 'not-attempted'),
-            complaint_data.get('name'),
-            complaint_data.get('mobile_number'),
-            complaint_data.get('complain_type'),
-            complaint_data.get('complain_description'),
-            complain_date,
-            complaint_data.get('complain_status', 'pending'),
-            complaint_data.get('train_id'),
-            complaint_data.get('train_number'),
-            complaint_data.get('train_name'),
-            complaint_data.get('coach'),
-            complaint_data.get('berth_no'),
-            complaint_data.get('created_by'),
-            now,
-            now
-        ))
-        
-        complain_id = cursor.fetchone()[0]
-        conn.commit()
-        
-        # Get the created complaint
-        complaint = get_complaint_by_id(complain_id)
+        complaint = execute_query_one(conn, complaint_write_query(query), values, serialize=False)
         
-        # Send email in separate thread
-        def _send_email(complaint_data, complaint_id):
-            try:
-                logger.info(f"Email thread started for complaint {complaint_id}")
-                
-                train_depo = ''
-                if complaint_data.get('train_id'):
-                    train_query = "SELECT * FROM trains_traindetails WHERE id = %s"
-                    train_conn = get_db_connection()
-                    train = execute_query_one(train_conn, train_query, (complaint_data['train_id'],))
-                    train_conn.close()
-                    if train:
-                        train_depo = train.get('Depot', '')
-                elif complaint_data.get('train_number'):
-                    train_query = "SELECT * FROM trains_traindetails WHERE train_no = %s"
-                    train_conn = get_db_connection()
-                    train = execute_query_one(train_conn, train_query, (complaint_data['train_number'],))
-                    train_conn.close()
-                    if train:
-                        train_depo = train.get('Depot', '')
-                
-                details = {
-                    'train_no': complaint_data.get('train_number', ''),
-                    'train_name': complaint_data.get('train_name', ''),
-                    'user_phone_number': complaint_data.get('mobile_number', ''),
-                    'passenger_name': complaint_data.get('name', ''),
-                    'pnr': complaint_data.get('pnr_number', ''),
-                    'berth': complaint_data.get('berth_no', ''),
-                    'coach': complaint_data.get('coach', ''),
-                    'complain_id': complaint_id,
-                    'description': complaint_data.get('complain_description', ''),
-                    'train_depo': train_depo,
-                    'date_of_journey': date_of_journey.strftime("%d %b %Y"),
-                }
-                
-                logger.info(f"Sending email for complaint {complaint_id} to war room users")
-                send_passenger_complain_email(details)
-                logger.info(f"Email sent successfully for complaint {complaint_id}")
-            except Exception as e:
-                logger.error(f"Email thread failure for complaint {complaint_id}: {str(e)}")
+        complain_id = complaint['complain_id']
+        train_depo = complaint.get('train_depot') or ''
+        details = complaint_notification_details(complaint_data, complain_id, train_depo, date_of_journey)
         
-        try:
-            email_thread = threading.Thread(
-                target=_send_email,
-                args=(complaint_data, complain_id),
-                name=f"EmailThread-{complain_id}"
-            )
-            email_thread.daemon = True
-            logger.info(f"Starting email thread for complaint {complain_id}")
-            email_thread.start()
-            logger.info(f"Email thread started with name {email_thread.name}")
-        except Exception as e:
-            logger.error(f"Failed to create email thread: {str(e)}")
+        # The notification is written in the complaint's transaction and sent
+        # by the outbox dispatcher, so it survives a restart
+        enqueue_notification(
+            conn.cursor(), EVENT_COMPLAINT_CREATED, complain_id, details,
+            train_no=complaint_data.get('train_number'), depot=train_depo
+        )
+        uow.after_commit(notification_dispatcher.wake)
         
         return complaint
-    finally:
-        conn.close()
 
-def get_complaint_by_id(complain_id: int):
+def get_complaint_by_id(complain_id: int, uow: Optional[UnitOfWork] = None):
     """Get complaint by ID with media files"""
-    conn = get_db_connection()
-    try:
-        # Get complaint
-        query = """
-            SELECT c.*, t.train_no, t.train_name, t."Depot" as train_depot
-            FROM rail_sathi_railsathicomplain c
-            LEFT JOIN trains_traindetails t ON c.train_id = t.id
-            WHERE c.complain_id = %s
-        """
-        complaint = execute_query_one(conn, query, (complain_id,))
-        
-        if not complaint:
-            return None
-        
-        # Get media files
-        media_query = """
-            SELECT id, media_type, media_url, created_at, updated_at, created_by, updated_by
-            FROM rail_sathi_railsathicomplainmedia
-            WHERE complain_id = %s
-        """
-        media_files = execute_query(conn, media_query, (complain_id,))
-        
-        # Format response
-        complaint['rail_sathi_complain_media_files'] = media_files or []
-        return complaint
-    finally:
-        conn.close()
+    with unit_of_work(uow) as uow:
+        query = COMPLAINT_SELECT_QUERY + " WHERE c.complain_id = %s"
+        return execute_query_one(uow.connection, query, (complain_id,), serialize=False)
+
+async def get_complaint_by_id_async(complain_id: int):
+    """Async version of get_complaint_by_id"""
+    async with async_database.get_async_db_connection() as conn:
+        query = COMPLAINT_SELECT_QUERY + " WHERE c.complain_id = %s"
+        return await async_database.execute_query_one(conn, query, (complain_id,), serialize=False)
 
 def get_complaints_by_date(complain_date: date, mobile_number: str):
     """Get complaints by date and mobile number"""
     conn = get_db_connection()
     try:
-        query = """
-            SELECT c.*, t.train_no, t.train_name, t."Depot" as train_depot
-            FROM rail_sathi_railsathicomplain c
-            LEFT JOIN trains_traindetails t ON c.train_id = t.id
-            WHERE c.complain_date = %s AND c.mobile_number = %s
-        """
-        complaints = execute_query(conn, query, (complain_date, mobile_number))
-        
-        # Get media files for each complaint
-        for complaint in complaints:
-            media_query = """
-                SELECT id, media_type, media_url, created_at, updated_at, created_by, updated_by
-                FROM rail_sathi_railsathicomplainmedia
-                WHERE complain_id = %s
-            """
-            media_files = execute_query(conn, media_query, (complaint['complain_id'],))
-            complaint['rail_sathi_complain_media_files'] = media_files or []
-        
-        return complaints
+        query = COMPLAINT_SELECT_QUERY + " WHERE c.complain_date = %s AND c.mobile_number = %s"
+        return execute_query(conn, query, (complain_date, mobile_number), serialize=False)
     finally:
         conn.close()
 
-def update_complaint(complain_id: int, update_data: dict):
+async def get_complaints_by_date_async(complain_date: date, mobile_number: str):
+    """Async version of get_complaints_by_date"""
+    async with async_database.get_async_db_connection() as conn:
+        query = COMPLAINT_SELECT_QUERY + " WHERE c.complain_date = %s AND c.mobile_number = %s"
+        return await async_database.execute_query(conn, query, (complain_date, mobile_number), serialize=False)
+
+def update_complaint(complain_id: int, update_data: dict, uow: Optional[UnitOfWork] = None):
     """Update complaint"""
-    conn = get_db_connection()
-    try:
+    with unit_of_work(uow) as uow:
+        conn = uow.connection
+
         # Validate and process train data
-        update_data = validate_and_process_train_data(update_data)
+        update_data = validate_and_process_train_data(update_data, conn)
         
         # Parse complain_date if it's a string
         if 'complain_date' in update_data and isinstance(update_data['complain_date'], str):
@@ -509,7 +546,8 @@ def update_complaint(complain_id: int, update_data: dict):
                 values.append(update_data[field])
         
         if not update_fields:
-            return get_complaint_by_id(complain_id)
+            return execute_query_one(conn, COMPLAINT_SELECT_QUERY + " WHERE c.complain_id = %s", (complain_id,),
+                                     serialize=False)
         
         # Add updated_at
         update_fields.append("updated_at = %s")
@@ -520,15 +558,11 @@ def update_complaint(complain_id: int, update_data: dict):
             UPDATE rail_sathi_railsathicomplain 
             SET {', '.join(update_fields)}
             WHERE complain_id = %s
+            RETURNING *
         """
         
-        cursor = conn.cursor()
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        
-        return get_complaint_by_id(complain_id)
-    finally:
-        conn.close()
+        # None if the complaint does not exist
+        return execute_query_one(conn, complaint_write_query(query), tuple(values), serialize=False)
 
 def delete_complaint(complain_id: int):
     """Delete complaint and its media files"""
@@ -569,16 +603,42 @@ def delete_complaint_media(complain_id: int, media_ids: List[int]):
     finally:
         conn.close()
 
-def validate_complaint_access(complain_id: int, user_name: str, mobile_number: str):
-    """Validate if user can access/modify the complaint"""
-    conn = get_db_connection()
-    try:
+async def delete_complaint_async(complain_id: int):
+    """Async version of delete_complaint"""
+    async with async_database.get_async_db_connection() as conn:
+        await async_database.execute_delete(
+            conn, "DELETE FROM rail_sathi_railsathicomplainmedia WHERE complain_id = %s", (complain_id,)
+        )
+        return await async_database.execute_delete(
+            conn, "DELETE FROM rail_sathi_railsathicomplain WHERE complain_id = %s", (complain_id,)
+        )
+
+async def delete_complaint_media_async(complain_id: int, media_ids: List[int]):
+    """Async version of delete_complaint_media"""
+    if not media_ids:
+        return 0
+    async with async_database.get_async_db_connection() as conn:
+        query = """
+            DELETE FROM rail_sathi_railsathicomplainmedia 
+            WHERE complain_id = %s AND id = ANY(%s)
+        """
+        return await async_database.execute_delete(conn, query, (complain_id, media_ids))
+
+def validate_complaint_access(complain_id: int, user_name: str, mobile_number: str,
+                              uow: Optional[UnitOfWork] = None):
+    """Validate if user can access/modify the complaint
+
+    The complaint row stays locked until the unit of work ends, so a caller
+    updating it in the same unit of work acts on what was checked.
+    """
+    with unit_of_work(uow) as uow:
         query = """
             SELECT created_by, mobile_number, complain_status 
             FROM rail_sathi_railsathicomplain 
             WHERE complain_id = %s
+            FOR UPDATE
         """
-        complaint = execute_query_one(conn, query, (complain_id,))
+        complaint = execute_query_one(uow.connection, query, (complain_id,))
         
         if not complaint:
             return False, "Complaint not found"
@@ -588,6 +648,4 @@ def validate_complaint_access(complain_id: int, user_name: str, mobile_number: s
             complaint['complain_status'] == "completed"):
             return False, "Only user who created the complaint can update it."
         
-        return True, None
-    finally:
-        conn.close()
\ No newline at end of file
+        return True, None
\ No newline at end of file
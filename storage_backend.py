@@ -0,0 +1,195 @@
+import os
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+from urllib.parse import quote
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Which backend stores processed media: "gcs" or "local"
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'gcs')
+
+GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME', 'sanchalak-media-bucket1')
+PROJECT_ID = os.getenv('PROJECT_ID', 'sanchalak-423912')
+# Files larger than one chunk go through a resumable upload in chunks of
+# this size; must be a multiple of 256 KiB
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv('GCS_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+# Connections kept open to storage.googleapis.com by the shared session
+GCS_HTTP_POOL_SIZE = int(os.getenv('GCS_HTTP_POOL_SIZE', 20))
+# Retry/backoff for uploads (seconds)
+GCS_RETRY_INITIAL_DELAY = float(os.getenv('GCS_RETRY_INITIAL_DELAY', 1))
+GCS_RETRY_MAX_DELAY = float(os.getenv('GCS_RETRY_MAX_DELAY', 32))
+GCS_RETRY_TIMEOUT = float(os.getenv('GCS_RETRY_TIMEOUT', 300))
+GCS_REQUEST_TIMEOUT = float(os.getenv('GCS_REQUEST_TIMEOUT', 120))
+
+LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', '/tmp/rail_sathi_storage')
+LOCAL_STORAGE_BASE_URL = os.getenv('LOCAL_STORAGE_BASE_URL', f"file://{LOCAL_STORAGE_DIR}")
+
+
+def _file_size(file_obj: BinaryIO) -> Optional[int]:
+    try:
+        return os.fstat(file_obj.fileno()).st_size - file_obj.tell()
+    except (AttributeError, OSError, ValueError):
+        try:
+            position = file_obj.tell()
+            file_obj.seek(0, os.SEEK_END)
+            size = file_obj.tell() - position
+            file_obj.seek(position)
+            return size
+        except (AttributeError, OSError, ValueError):
+            return None
+
+
+class StorageBackend(ABC):
+    """Where processed complaint media is stored"""
+
+    @abstractmethod
+    def upload_file(self, file_obj: BinaryIO, key: str, content_type: str) -> str:
+        """Store file_obj under key and return its public URL"""
+
+    def upload_path(self, path: str, key: str, content_type: str) -> str:
+        """Store the file at path under key and return its public URL"""
+        with open(path, 'rb') as file_obj:
+            return self.upload_file(file_obj, key, content_type)
+
+    @abstractmethod
+    def public_url(self, key: str) -> str:
+        """Public URL of the object stored under key"""
+
+
+class GCSStorageBackend(StorageBackend):
+    """Google Cloud Storage backend sharing one client and HTTP session per process"""
+
+    def __init__(self, bucket_name: str = GCS_BUCKET_NAME, project_id: str = PROJECT_ID,
+                 chunk_size: int = GCS_UPLOAD_CHUNK_SIZE, pool_size: int = GCS_HTTP_POOL_SIZE):
+        self.bucket_name = bucket_name
+        self.project_id = project_id
+        self.chunk_size = chunk_size
+        self.pool_size = pool_size
+        self._client = None
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def _ensure_client(self):
+        """Lazily build the storage.Client and bucket; safe to call from any thread"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import google.auth
+                    from google.auth.transport.requests import AuthorizedSession
+                    from google.cloud import storage
+                    from requests.adapters import HTTPAdapter
+
+                    # storage.Client uses GOOGLE_APPLICATION_CREDENTIALS from .env
+                    credentials, _ = google.auth.default(
+                        scopes=["https://www.googleapis.com/auth/devstorage.read_write"]
+                    )
+                    session = AuthorizedSession(credentials)
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    self._client = storage.Client(project=self.project_id, credentials=credentials, _http=session)
+                    self._bucket = self._client.bucket(self.bucket_name)
+                    logger.info(f"GCS client created for bucket {self.bucket_name}")
+        return self._client
+
+    @property
+    def client(self):
+        return self._ensure_client()
+
+    @property
+    def bucket(self):
+        self._ensure_client()
+        return self._bucket
+
+    @property
+    def retry(self):
+        from google.cloud.storage.retry import DEFAULT_RETRY
+        return DEFAULT_RETRY.with_delay(
+            initial=GCS_RETRY_INITIAL_DELAY, maximum=GCS_RETRY_MAX_DELAY, multiplier=2.0
+        ).with_timeout(GCS_RETRY_TIMEOUT)
+
+    def upload_file(self, file_obj: BinaryIO, key: str, content_type: str) -> str:
+        blob = self.bucket.blob(key)
+        size = _file_size(file_obj)
+        if size is None or size > self.chunk_size:
+            # Resumable upload: only one chunk is buffered and a failed chunk
+            # is resent instead of the whole file
+            blob.chunk_size = self.chunk_size
+        blob.upload_from_file(
+            file_obj, size=size, content_type=content_type,
+            retry=self.retry, timeout=GCS_REQUEST_TIMEOUT
+        )
+        return blob.public_url
+
+    def public_url(self, key: str) -> str:
+        return self.bucket.blob(key).public_url
+
+
+class LocalStorageBackend(StorageBackend):
+    """Filesystem backend for tests, benchmarks and local development"""
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def upload_file(self, file_obj: BinaryIO, key: str, content_type: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as dest:
+            shutil.copyfileobj(file_obj, dest, 1024 * 1024)
+        return self.public_url(key)
+
+    def public_url(self, key: str) -> str:
+        return f"{self.base_url}/{quote(key)}"
+
+
+_storage_backend: Optional[StorageBackend] = None
+_gcs_backend: Optional[GCSStorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def get_gcs_backend() -> GCSStorageBackend:
+    """Get the process-wide GCS backend, whichever backend stores media"""
+    global _gcs_backend
+    if _gcs_backend is None:
+        with _storage_lock:
+            if _gcs_backend is None:
+                _gcs_backend = GCSStorageBackend()
+    return _gcs_backend
+
+
+def get_storage_backend() -> StorageBackend:
+    """Get the process-wide storage backend selected by STORAGE_BACKEND"""
+    global _storage_backend
+    if _storage_backend is None:
+        backend = get_gcs_backend() if STORAGE_BACKEND == 'gcs' else None
+        with _storage_lock:
+            if _storage_backend is None:
+                if STORAGE_BACKEND == 'local':
+                    _storage_backend = LocalStorageBackend()
+                elif backend is not None:
+                    _storage_backend = backend
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+                logger.info(f"Using {type(_storage_backend).__name__} for media storage")
+    return _storage_backend
+
+
+def set_storage_backend(backend: StorageBackend):
+    """Replace the process-wide storage backend (e.g. in tests)"""
+    global _storage_backend
+    with _storage_lock:
+        _storage_backend = backend
@@ -0,0 +1,180 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Any
+from cachetools import TTLCache
+from database import get_db_connection
+from psycopg2.extras import RealDictCursor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Maximum number of trains kept in memory and how long (seconds) an entry lives
+TRAIN_CACHE_MAX_SIZE = int(os.getenv('TRAIN_CACHE_MAX_SIZE', 10000))
+TRAIN_CACHE_TTL = float(os.getenv('TRAIN_CACHE_TTL', 3600))
+
+DEPOT_HIERARCHY_QUERY = """
+    SELECT d.depot_code, dv.division_code, z.zone_code
+    FROM station_Depot d
+    LEFT JOIN station_division dv ON dv.division_id = d.division_id
+    LEFT JOIN station_zone z ON z.zone_id = dv.zone_id
+"""
+
+
+def _empty_extra_info() -> Dict[str, Optional[str]]:
+    return {"depot_code": None, "division_code": None, "zone_code": None}
+
+
+class TrainReferenceCache:
+    """Bounded TTL cache of trains_traindetails rows with their depot/division/zone codes"""
+
+    def __init__(self, max_size: int = TRAIN_CACHE_MAX_SIZE, ttl: float = TRAIN_CACHE_TTL):
+        # Every train is stored under both its train_no and its id
+        self._cache = TTLCache(maxsize=max_size * 2, ttl=ttl)
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.warmed_at = None
+
+    def _store(self, train: Dict[str, Any]):
+        with self._lock:
+            self._cache[('train_no', str(train['train_no']))] = train
+            self._cache[('id', train['id'])] = train
+
+    def _lookup(self, key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            train = self._cache.get(key)
+            if train is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return train
+
+    def _load(self, column: str, value, conn=None) -> Optional[Dict[str, Any]]:
+        # A caller's connection is borrowed, not released
+        own_conn = conn is None
+        if own_conn:
+            conn = get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(f"SELECT * FROM trains_traindetails WHERE {column} = %s", (value,))
+            train = cursor.fetchone()
+            if not train:
+                return None
+            train = dict(train)
+
+            cursor.execute(DEPOT_HIERARCHY_QUERY + " WHERE d.depot_code = %s LIMIT 1", (train.get('Depot'),))
+            hierarchy = cursor.fetchone()
+            train['extra_info'] = dict(hierarchy) if hierarchy else _empty_extra_info()
+        finally:
+            if own_conn:
+                conn.close()
+
+        with self._lock:
+            self.loads += 1
+        self._store(train)
+        return train
+
+    def get_by_train_no(self, train_no, conn=None) -> Optional[Dict[str, Any]]:
+        """Get a copy of the train row (with extra_info) by train number"""
+        if train_no is None:
+            return None
+        train = self._lookup(('train_no', str(train_no)))
+        if train is None:
+            train = self._load('train_no', str(train_no), conn)
+        return dict(train) if train else None
+
+    def get_by_id(self, train_id, conn=None) -> Optional[Dict[str, Any]]:
+        """Get a copy of the train row (with extra_info) by train id"""
+        if train_id is None:
+            return None
+        train = self._lookup(('id', int(train_id)))
+        if train is None:
+            train = self._load('id', int(train_id), conn)
+        return dict(train) if train else None
+
+    def warm(self) -> int:
+        """Bulk-load trains and the depot hierarchy in two queries"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(DEPOT_HIERARCHY_QUERY)
+            hierarchy_by_depot = {}
+            for row in cursor.fetchall():
+                hierarchy_by_depot.setdefault(row['depot_code'], dict(row))
+
+            cursor.execute("SELECT * FROM trains_traindetails ORDER BY id LIMIT %s", (self.max_size,))
+            trains = cursor.fetchall()
+        finally:
+            conn.close()
+
+        for row in trains:
+            train = dict(row)
+            train['extra_info'] = dict(hierarchy_by_depot.get(train.get('Depot')) or _empty_extra_info())
+            self._store(train)
+
+        self.warmed_at = time.time()
+        logger.info(f"Train cache warmed with {len(trains)} trains")
+        return len(trains)
+
+    def invalidate(self, train_no=None, train_id=None):
+        """Drop one train (by number or id), or everything when no key is given"""
+        with self._lock:
+            if train_no is None and train_id is None:
+                self._cache.clear()
+                return
+            train = None
+            if train_no is not None:
+                train = self._cache.get(('train_no', str(train_no)))
+            if train is None and train_id is not None:
+                train = self._cache.get(('id', int(train_id)))
+            if train is None:
+                return
+            self._cache.pop(('train_no', str(train['train_no'])), None)
+            self._cache.pop(('id', train['id']), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'size': len(self._cache) // 2,
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'warmed_at': self.warmed_at,
+            }
+
+
+train_cache = TrainReferenceCache()
+
+
+def get_train_by_number(train_no, conn=None) -> Optional[Dict[str, Any]]:
+    """Get train details (with depot/division/zone extra_info) by train number"""
+    return train_cache.get_by_train_no(train_no, conn)
+
+
+def get_train_by_id(train_id, conn=None) -> Optional[Dict[str, Any]]:
+    """Get train details (with depot/division/zone extra_info) by train id"""
+    return train_cache.get_by_id(train_id, conn)
+
+
+def warm_train_cache() -> int:
+    """Preload the train cache"""
+    return train_cache.warm()
+
+
+def invalidate_train_cache(train_no=None, train_id=None):
+    """Invalidate one train or the whole cache"""
+    train_cache.invalidate(train_no=train_no, train_id=train_id)
+
+
+def get_train_cache_stats() -> Dict[str, Any]:
+    """Get train cache metrics"""
+    return train_cache.stats()
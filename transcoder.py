@@ -0,0 +1,279 @@
+import os
+import re
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Any
+import imageio_ffmpeg
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of videos transcoded in parallel (each in its own process)
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Jobs allowed to wait for a free worker before submitters are pushed back
+TRANSCODE_QUEUE_SIZE = int(os.getenv('TRANSCODE_QUEUE_SIZE', 4))
+# Seconds a submitter waits for a queue slot before giving up
+TRANSCODE_SUBMIT_TIMEOUT = float(os.getenv('TRANSCODE_SUBMIT_TIMEOUT', 30))
+# Seconds a single ffmpeg run may take before it is killed
+TRANSCODE_TIMEOUT = float(os.getenv('TRANSCODE_TIMEOUT', 600))
+# ffmpeg threads per job, so one job cannot take every core
+TRANSCODE_FFMPEG_THREADS = int(os.getenv('TRANSCODE_FFMPEG_THREADS', 2))
+# Largest output resolution (short side, in pixels)
+TRANSCODE_MAX_RESOLUTION = int(os.getenv('TRANSCODE_MAX_RESOLUTION', 1080))
+
+# Ordered from smallest to largest; the short side of the input picks the preset
+VIDEO_PRESETS = [
+    {'name': '360p', 'resolution': 360, 'video_bitrate': 800, 'audio_bitrate': 96},
+    {'name': '480p', 'resolution': 480, 'video_bitrate': 1200, 'audio_bitrate': 96},
+    {'name': '720p', 'resolution': 720, 'video_bitrate': 2500, 'audio_bitrate': 128},
+    {'name': '1080p', 'resolution': 1080, 'video_bitrate': 5000, 'audio_bitrate': 128},
+]
+
+# An input within this factor of the preset bitrate is not worth re-encoding
+SKIP_BITRATE_TOLERANCE = 1.15
+
+
+class TranscodeError(Exception):
+    """Raised when a video cannot be transcoded"""
+
+
+class TranscodeQueueFullError(TranscodeError):
+    """Raised when the transcode queue stays full for TRANSCODE_SUBMIT_TIMEOUT"""
+
+
+class TranscodeTimeoutError(TranscodeError):
+    """Raised when a transcode job exceeds TRANSCODE_TIMEOUT"""
+
+
+def probe_video(path: str) -> Dict[str, Any]:
+    """Read codec, size, bitrate and duration from `ffmpeg -i` output"""
+    result = subprocess.run(
+        [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-i', path],
+        capture_output=True, text=True, timeout=60
+    )
+    output = result.stderr
+    info = {'video_codec': None, 'pix_fmt': None, 'width': None, 'height': None,
+            'bitrate': None, 'duration': None, 'audio_codec': None}
+
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    bitrate = re.search(r"bitrate: (\d+) kb/s", output)
+    if bitrate:
+        info['bitrate'] = int(bitrate.group(1))
+
+    video = re.search(r"Stream #.*?Video: (\w+)[^,]*, (\w+)[^,]*?,.*?(\d{2,5})x(\d{2,5})", output)
+    if video:
+        info['video_codec'] = video.group(1)
+        info['pix_fmt'] = video.group(2)
+        info['width'] = int(video.group(3))
+        info['height'] = int(video.group(4))
+    audio = re.search(r"Stream #.*?Audio: (\w+)", output)
+    if audio:
+        info['audio_codec'] = audio.group(1)
+
+    if not info['video_codec']:
+        raise TranscodeError(f"No video stream found in {os.path.basename(path)}")
+    return info
+
+
+def choose_preset(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the smallest preset that holds the input resolution, capped at TRANSCODE_MAX_RESOLUTION"""
+    allowed = [p for p in VIDEO_PRESETS if p['resolution'] <= TRANSCODE_MAX_RESOLUTION] or VIDEO_PRESETS[:1]
+    short_side = min(info['width'], info['height'])
+    for preset in allowed:
+        if short_side <= preset['resolution']:
+            return preset
+    return allowed[-1]
+
+
+def needs_transcode(info: Dict[str, Any], preset: Dict[str, Any], input_path: str) -> bool:
+    """False when the input is already a web-playable mp4 within the preset limits"""
+    if not input_path.lower().endswith('.mp4'):
+        return True
+    if info['video_codec'] != 'h264' or info['pix_fmt'] != 'yuv420p':
+        return True
+    if info['audio_codec'] not in (None, 'aac'):
+        return True
+    if min(info['width'], info['height']) > preset['resolution']:
+        return True
+    total_bitrate = preset['video_bitrate'] + preset['audio_bitrate']
+    return info['bitrate'] is None or info['bitrate'] > total_bitrate * SKIP_BITRATE_TOLERANCE
+
+
+def _transcode_in_worker(input_path: str, output_path: str, timeout: float) -> Dict[str, Any]:
+    """Runs inside a pool process: probe, pick a preset and run ffmpeg"""
+    info = probe_video(input_path)
+    preset = choose_preset(info)
+
+    if not needs_transcode(info, preset, input_path):
+        return {'output_path': input_path, 'preset': preset['name'], 'skipped': True, 'input': info}
+
+    scale = ''
+    if min(info['width'], info['height']) > preset['resolution']:
+        # Scale the short side down and keep the aspect ratio (even dimensions for x264).
+        # Decided on the frame ffmpeg sees after autorotation, as the probed size
+        # ignores a rotate tag / display matrix.
+        resolution = preset['resolution']
+        scale = f"scale='if(lte(iw,ih),{resolution},-2)':'if(lte(iw,ih),-2,{resolution})'"
+
+    command = [
+        imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', input_path,
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-b:v', f"{preset['video_bitrate']}k",
+        '-maxrate', f"{int(preset['video_bitrate'] * 1.2)}k",
+        '-bufsize', f"{preset['video_bitrate'] * 2}k",
+    ]
+    if scale:
+        command += ['-vf', scale]
+    command += [
+        '-c:a', 'aac', '-b:a', f"{preset['audio_bitrate']}k",
+        '-movflags', '+faststart',
+        '-threads', str(TRANSCODE_FFMPEG_THREADS),
+        output_path
+    ]
+
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise TranscodeTimeoutError(f"Transcode exceeded {timeout}s")
+    if result.returncode != 0:
+        raise TranscodeError(f"ffmpeg exited with {result.returncode}: {result.stderr[-500:]}")
+
+    return {'output_path': output_path, 'preset': preset['name'], 'skipped': False, 'input': info}
+
+
+class Transcoder:
+    """Process pool with a bounded submission queue for video transcoding"""
+
+    def __init__(self, workers: int = TRANSCODE_WORKERS, queue_size: int = TRANSCODE_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._skipped = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # spawn: forking a process that runs threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._stats_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def transcode(self, input_path: str, output_path: str,
+                  submit_timeout: float = TRANSCODE_SUBMIT_TIMEOUT,
+                  timeout: float = TRANSCODE_TIMEOUT) -> Dict[str, Any]:
+        """Transcode input_path to output_path, blocking until done
+
+        Returns a dict with the path to upload (the input itself when no
+        re-encoding was needed), the chosen preset and the probed input.
+        """
+        if not self._slots.acquire(timeout=submit_timeout):
+            with self._stats_lock:
+                self._rejected += 1
+            raise TranscodeQueueFullError(
+                f"Transcode queue full ({self.workers} running, {self.queue_size} waiting)"
+            )
+        with self._stats_lock:
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(_transcode_in_worker, input_path, output_path, timeout)
+        except Exception:
+            self._release()
+            raise
+        # The slot is freed when the worker finishes, even if we stop waiting
+        future.add_done_callback(self._release)
+
+        try:
+            # Leave time for queueing and probing on top of the ffmpeg timeout;
+            # media jobs waiting here keep their lock through the worker heartbeat
+            result = future.result(timeout=timeout * 2)
+        except (FutureTimeoutError, TranscodeTimeoutError):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise TranscodeTimeoutError(f"Transcode of {os.path.basename(input_path)} timed out")
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool next time
+            with self._stats_lock:
+                self._failed += 1
+            with self._executor_lock:
+                self._executor = None
+            raise
+        except Exception:
+            with self._stats_lock:
+                self._failed += 1
+            raise
+
+        with self._stats_lock:
+            if result['skipped']:
+                self._skipped += 1
+            else:
+                self._completed += 1
+        logger.info(
+            f"Transcoded {os.path.basename(input_path)} with preset {result['preset']}"
+            f"{' (skipped, already within target)' if result['skipped'] else ''}"
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and outcome counters"""
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'capacity': self.workers + self.queue_size,
+                'pending': self._pending,
+                'completed': self._completed,
+                'skipped': self._skipped,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+transcoder = Transcoder()
+
+
+def transcode_video(input_path: str, output_path: str) -> Dict[str, Any]:
+    """Transcode a video through the shared process pool"""
+    return transcoder.transcode(input_path, output_path)
+
+
+def get_transcoder_stats() -> Dict[str, Any]:
+    """Get transcoder queue metrics"""
+    return transcoder.stats()
+
+
+def shutdown_transcoder():
+    """Stop the transcoder process pool"""
+    transcoder.shutdown()
@@ -1,19 +1,60 @@
 import logging
-import asyncio
-from fastapi_mail import FastMail, MessageSchema
 from mail_config import conf
-from jinja2 import Template
-from typing import Dict, List
+from markupsafe import escape
+from typing import Dict, List, Optional, Tuple
 import os
 from database import get_db_connection, execute_query  # Fixed import
+from train_cache import get_train_by_number
+from recipient_cache import get_depot_recipients, get_train_access_users
+from utils.mail_sender import mail_sender, build_message
+from utils.template_registry import template_registry
 from datetime import datetime
 import pytz
-import json
 
 EMAIL_SENDER = conf.MAIL_FROM
 
-def send_plain_mail(subject: str, message: str, from_: str, to: List[str], cc: List[str] = None):
-    """Send plain text email with CC support"""
+# templates/<name>.txt, plus templates/<name>.html when present
+COMPLAINT_EMAIL_TEMPLATE = "complaint_creation_email_template"
+
+# Used if the template file is missing
+template_registry.register_fallback(f"{COMPLAINT_EMAIL_TEMPLATE}.txt", """
+            Passenger Complaint Submitted
+
+            A new passenger complaint has been received.
+
+            Complaint ID   : {{ complain_id }}
+            Submitted At  : {{ created_at }}
+
+            Passenger Info:
+            ---------------
+            Name           : {{ passenger_name }}
+            Phone Number   : {{ user_phone_number }}
+
+            Travel Details:
+            ---------------
+            Train Number   : {{ train_no }}
+            Train Name     : {{ train_name }}
+            Coach          : {{ coach }}
+            Berth Number   : {{ berth }}
+            PNR            : {{ pnr }}
+
+            Complaint Details:
+            ------------------
+            Description    : {{ description }}
+
+            Train Depot    : {{ train_depo }}
+            
+            Please take necessary action at the earliest.
+
+            This is an automated notification. Please do not reply to this email.
+
+            Regards,  
+            Team RailSathi
+        """)
+
+def send_plain_mail(subject: str, message: str, from_: str, to: List[str], cc: List[str] = None,
+                    html: Optional[str] = None):
+    """Send plain text email with CC support, optionally with an HTML alternative"""
     try:
         # Filter valid emails
         valid_emails = [email for email in to if email and not email.startswith("noemail")]
@@ -23,23 +64,9 @@ def send_plain_mail(subject: str, message: str, from_: str, to: List[str], cc: L
             logging.info("All emails were skipped - no valid recipients.")
             return True
 
-        # Create email message
-        email = MessageSchema(
-            subject=subject,
-            recipients=valid_emails,  # This should be a list, not a string
-            cc=valid_cc_emails if valid_cc_emails else None,  # Add CC support
-            body=message,
-            subtype="plain"
-        )
-
-        # Send email using FastMail
-        fm = FastMail(conf)
-        
-        # Use asyncio to run the async send_message method
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(fm.send_message(email))
-        loop.close()
+        # Sent over a pooled SMTP connection by the shared mail sender loop
+        email = build_message(subject, message, valid_emails, valid_cc_emails, html=html, from_=from_)
+        mail_sender.send(email)
         
         cc_info = f" with CC to: {', '.join(valid_cc_emails)}" if valid_cc_emails else ""
         logging.info(f"Email sent successfully to: {', '.join(valid_emails)}{cc_info}")
@@ -50,222 +77,150 @@ def send_plain_mail(subject: str, message: str, from_: str, to: List[str], cc: L
         return False
 
 
-def send_passenger_complain_email(complain_details: Dict):
-    """Send complaint email to war room users with CC to other users"""
-    war_room_user_in_depot = []
-    s2_admin_users = []
-    railway_admin_users = []
+def _parse_complaint_date(complain_details: Dict):
+    """Date of the complaint from created_at (string or datetime object)
+
+    Notification payloads carry no created_at; their submitted_at, then
+    date_of_journey, is used instead.
+    """
+    created_at_raw = complain_details.get('created_at', '')
+    try:
+        if isinstance(created_at_raw, datetime):
+            return created_at_raw.date()
+        elif isinstance(created_at_raw, str) and len(created_at_raw) >= 10:
+            return datetime.strptime(created_at_raw[:10], "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        pass
+    for key, date_format in (('submitted_at', "%d %b %Y, %H:%M"), ('date_of_journey', "%d %b %Y")):
+        try:
+            return datetime.strptime(complain_details.get(key) or '', date_format).date()
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def get_complaint_recipients(complain_details: Dict) -> List[str]:
+    """Unique, valid email addresses to notify about a complaint
+
+    War room users of the train's depot, s2 admins, railway admins and the
+    users assigned to the train on the complaint date.
+    """
     assigned_users_list = []
-    
-    train_depo = complain_details.get('train_depot', '')
+
+    # Step 1: Get Depot for the train number
     train_no = str(complain_details.get('train_no', '')).strip()
-    complaint_date = complain_details.get('created_at', '') 
+    train = get_train_by_number(train_no)
+    train_depot_name = train['Depot'] if train else ''
+
+    # Steps 2-3: war room users of the depot, s2 admins and railway admins
+    recipients = get_depot_recipients(train_depot_name)
+    war_room_user_in_depot = recipients['war_room_users']
+    s2_admin_users = recipients['s2_admin_users']
+    railway_admin_users = recipients['railway_admin_users']
+
+    # Get train number and complaint date for filtering (payloads carry train_no)
+    train_no = str(complain_details.get('train_number') or train_no).strip()
+    complaint_date = _parse_complaint_date(complain_details)
+
+    if complaint_date and train_no:
+        # Users whose access period for this train covers the complaint date
+        assigned_users_list = get_train_access_users(train_no, complaint_date)
+
+    # Combine all users and collect unique emails
+    all_users_to_mail = war_room_user_in_depot + s2_admin_users + railway_admin_users + assigned_users_list
+    all_emails = []
+    for user in all_users_to_mail:
+        email = user.get('email', '')
+        if email and not email.startswith("noemail") and '@' in email:
+            all_emails.append(email)
+
+    # Remove duplicates while preserving order
+    return list(dict.fromkeys(all_emails))
+
+
+def _subject_prefix() -> str:
+    env = os.getenv('ENV')
+    if env == 'UAT':
+        return "UAT | "
+    elif env == 'PROD':
+        return ""
+    return "LOCAL | "
+
+
+def build_complaint_subject(complain_details: Dict) -> str:
+    """Subject line of the new-complaint email"""
     journey_start_date = complain_details.get('date_of_journey', '')
+    return f"{_subject_prefix()}New Passenger Complaint Submitted - for Train: {complain_details['train_no']}(Commencement Date: {journey_start_date})"
 
+
+def _complaint_context(complain_details: Dict) -> Dict:
     ist = pytz.timezone('Asia/Kolkata')
-    complaint_created_at = datetime.now(ist).strftime("%d %b %Y, %H:%M")
+    # Queued notifications carry the time the complaint was submitted
+    complaint_created_at = complain_details.get('submitted_at') or datetime.now(ist).strftime("%d %b %Y, %H:%M")
+    pnr_value = complain_details.get('pnr', 'PNR not provided by passenger')
+
+    return {
+        "user_phone_number": complain_details.get('user_phone_number', ''),
+        "passenger_name": complain_details.get('passenger_name', ''),
+        "train_no": complain_details.get('train_no', ''),
+        "train_name": complain_details.get('train_name', ''),
+        "pnr": pnr_value,
+        "berth": complain_details.get('berth', ''),
+        "coach": complain_details.get('coach', ''),
+        "complain_id": complain_details.get('complain_id', ''),
+        "created_at": complaint_created_at,
+        "description": complain_details.get('description', ''),
+        "train_depo": complain_details.get('train_depo', ''),
+        "complaint_date": _parse_complaint_date(complain_details),
+        "start_date_of_journey": complain_details.get('date_of_journey', ''),
+        'site_name': 'RailSathi',
+    }
+
+
+def render_complaint_email(complain_details: Dict) -> Tuple[str, Optional[str]]:
+    """Render the plain-text and (if a template exists) HTML body of the new-complaint email"""
+    return template_registry.render_variants(COMPLAINT_EMAIL_TEMPLATE, _complaint_context(complain_details))
+
+
+def warm_email_templates():
+    """Compile the notification templates so the first email does not pay for it"""
+    template_registry.warm([f"{COMPLAINT_EMAIL_TEMPLATE}.txt", f"{COMPLAINT_EMAIL_TEMPLATE}.html"])
 
-    
-    try:
-        # Step 1: Get Depot for the train number
-        get_depot_query = f"""
-            SELECT "Depot" FROM trains_traindetails 
-            WHERE train_no = '{train_no}' LIMIT 1
-        """
-        conn = get_db_connection()
-        depot_result = execute_query(conn, get_depot_query)
-        conn.close()
-
-        train_depot_name = depot_result[0]['Depot'] if depot_result else ''
-
-        # Step 2: Fetch war room users whose `depo` matches the train depot
-        war_room_user_query = f"""
-            SELECT u.* 
-            FROM user_onboarding_user u 
-            JOIN user_onboarding_roles ut ON u.user_type_id = ut.id 
-            WHERE ut.name = 'war room user' AND u.depo LIKE '%%{train_depot_name}%%'
-        """
-        conn = get_db_connection()
-        war_room_user_in_depot = execute_query(conn, war_room_user_query)
-        conn.close()  
-            
-        s2_admin_query = """
-            SELECT u.* 
-            FROM user_onboarding_user u 
-            JOIN user_onboarding_roles ut ON u.user_type_id = ut.id 
-            WHERE ut.name = 's2 admin'
-        """
-        conn = get_db_connection()
-        s2_admin_users = execute_query(conn, s2_admin_query)
-        
-        railway_admin_query = """
-            SELECT u.* 
-            FROM user_onboarding_user u 
-            JOIN user_onboarding_roles ut ON u.user_type_id = ut.id 
-            WHERE ut.name = 'railway admin'
-        """
-        railway_admin_users = execute_query(conn, railway_admin_query)
-        
-        # Updated query to get train access users with better filtering
-        assigned_users_query = """
-            SELECT u.email, u.id, u.first_name, u.last_name, ta.train_details
-            FROM user_onboarding_user u
-            JOIN trains_trainaccess ta ON ta.user_id = u.id
-            WHERE ta.train_details IS NOT NULL 
-            AND ta.train_details != '{}'
-            AND ta.train_details != 'null'
-        """
-        conn = get_db_connection()
-        assigned_users_raw = execute_query(conn, assigned_users_query)
-        conn.close()
-        
-        # Get train number and complaint date for filtering
-        train_no = str(complain_details.get('train_number', '')).strip()
-        
-        # Handle created_at whether it's a string or datetime object
-        created_at_raw = complain_details.get('created_at', '')
-        try:
-            if isinstance(created_at_raw, datetime):
-                complaint_date = created_at_raw.date()
-            elif isinstance(created_at_raw, str):
-                if len(created_at_raw) >= 10:
-                    complaint_date = datetime.strptime(created_at_raw, "%Y-%m-%d").date()
-                else:
-                    complaint_date = None
-            else:
-                complaint_date = None
-        except (ValueError, TypeError):
-            complaint_date = None
-            
 
-        if complaint_date and train_no:
-            for user in assigned_users_raw:
-                try:
-                    train_details_str = user.get('train_details', '{}')
-                    
-                    # Handle case where train_details might be a string or already parsed
-                    if isinstance(train_details_str, str):
-                        train_details = json.loads(train_details_str)
-                    else:
-                        train_details = train_details_str
-                    
-                    # Check if the train number exists in train_details
-                    if train_no in train_details:
-                        for access in train_details[train_no]:
-                            try:
-                                origin_date = datetime.strptime(access.get('origin_date', ''), "%Y-%m-%d").date()
-                                end_date_str = access.get('end_date', '')
-                                
-                                # Check if complaint date falls within the valid range
-                                if end_date_str == 'ongoing':
-                                    is_valid = complaint_date >= origin_date
-                                else:
-                                    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-                                    is_valid = origin_date <= complaint_date <= end_date
-                                
-                                if is_valid:
-                                    assigned_users_list.append(user)
-                                    break  # Only need one match per user
-                                    
-                            except (ValueError, TypeError) as date_error:
-                                logging.warning(f"Date parsing error for user {user.get('id')}: {date_error}")
-                                continue
-                                
-                except (json.JSONDecodeError, TypeError) as json_error:
-                    logging.warning(f"JSON parsing error for user {user.get('id')}: {json_error}")
-                    continue
-
-        # Combine all users and collect unique emails
-        all_users_to_mail = war_room_user_in_depot + s2_admin_users + railway_admin_users + assigned_users_list
-     
+def build_digest_email(complaints: List[Dict]) -> Tuple[str, str, Optional[str]]:
+    """Subject, text body and HTML body (if available) of one email covering several complaints"""
+    train_nos = list(dict.fromkeys(str(c.get('train_no', '')) for c in complaints))
+    depots = list(dict.fromkeys(c.get('train_depo', '') for c in complaints if c.get('train_depo')))
+    if len(train_nos) == 1:
+        scope = f"Train: {train_nos[0]}"
+    else:
+        scope = f"Depot: {', '.join(depots)}" if depots else f"Trains: {', '.join(train_nos)}"
+    subject = f"{_subject_prefix()}{len(complaints)} New Passenger Complaints Submitted - for {scope}"
+
+    rendered = [render_complaint_email(c) for c in complaints]
+    header = f"{len(complaints)} new passenger complaints were received for {scope}."
+    separator = "\n" + "=" * 60 + "\n"
+    text = header + "\n" + separator + separator.join(t for t, _ in rendered)
+    html = None
+    if all(h for _, h in rendered):
+        html = f"<p>{escape(header)}</p><hr>" + "<hr>".join(h for _, h in rendered)
+    return subject, text, html
+
+
+def send_passenger_complain_email(complain_details: Dict):
+    """Send complaint email to war room users with CC to other users"""
+    train_depo = complain_details.get('train_depot', '')
+    train_no = str(complain_details.get('train_no', '')).strip()
+
+    try:
+        unique_emails = get_complaint_recipients(complain_details)
     except Exception as e:
         logging.error(f"Error fetching users: {e}")
+        return {"status": "error", "message": str(e)}
 
     try:
-        env = os.getenv('ENV')
-        # Prepare email content
-        if env == 'UAT':
-            subject = f"UAT | New Passenger Complaint Submitted - for Train: {complain_details['train_no']}(Commencement Date: {journey_start_date})"
-        elif env == 'PROD':
-            subject = f"New Passenger Complaint Submitted - for Train: {complain_details['train_no']}(Commencement Date: {journey_start_date})"
-        else:
-            subject = f"LOCAL | New Passenger Complaint Submitted - for Train: {complain_details['train_no']}(Commencement Date: {journey_start_date})"
-            
-        pnr_value = complain_details.get('pnr', 'PNR not provided by passenger')
-
-        
-        context = {
-            "user_phone_number": complain_details.get('user_phone_number', ''),
-            "passenger_name": complain_details.get('passenger_name', ''),
-            "train_no": complain_details.get('train_no', ''),
-            "train_name": complain_details.get('train_name', ''),
-            "pnr": pnr_value,
-            "berth": complain_details.get('berth', ''),
-            "coach": complain_details.get('coach', ''),
-            "complain_id": complain_details.get('complain_id', ''),
-            "created_at": complaint_created_at,
-            "description": complain_details.get('description', ''),
-            "train_depo": complain_details.get('train_depo', ''),
-            "complaint_date": complaint_date,
-            "start_date_of_journey": journey_start_date,
-            'site_name': 'RailSathi',
-        }
-
-        # Load and render template
-        template_path = os.path.join("templates", "complaint_creation_email_template.txt")
-        
-        if not os.path.exists(template_path):
-            # Fallback to inline template if file doesn't exist
-            template_content = """
-                Passenger Complaint Submitted
-
-                A new passenger complaint has been received.
-
-                Complaint ID   : {{ complain_id }}
-                Submitted At  : {{ created_at }}
-
-                Passenger Info:
-                ---------------
-                Name           : {{ passenger_name }}
-                Phone Number   : {{ user_phone_number }}
-
-                Travel Details:
-                ---------------
-                Train Number   : {{ train_no }}
-                Train Name     : {{ train_name }}
-                Coach          : {{ coach }}
-                Berth Number   : {{ berth }}
-                PNR            : {{ pnr }}
-
-                Complaint Details:
-                ------------------
-                Description    : {{ description }}
-
-                Train Depot    : {{ train_depo }}
-                
-                Please take necessary action at the earliest.
-
-                This is an automated notification. Please do not reply to this email.
-
-                Regards,  
-                Team RailSathi
-            """
-        else:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        
-        template = Template(template_content)
-        message = template.render(context)
-
-        # Collect all unique email addresses
-        all_emails = []
-        for user in all_users_to_mail:
-            email = user.get('email', '')
-            if email and not email.startswith("noemail") and '@' in email:
-                all_emails.append(email)
-        
-        # Remove duplicates while preserving order
-        unique_emails = list(dict.fromkeys(all_emails))
+        subject = build_complaint_subject(complain_details)
+        message, html = render_complaint_email(complain_details)
         
         if not unique_emails:
             logging.info(f"No users found for depot {train_depo} and train {train_no} in complaint {complain_details['complain_id']}")
@@ -276,7 +231,7 @@ def send_passenger_complain_email(complain_details: Dict):
         cc_recipients = unique_emails[1:] if len(unique_emails) > 1 else []
         
         try:
-            success = send_plain_mail(subject, message, EMAIL_SENDER, primary_recipient, cc_recipients)
+            success = send_plain_mail(subject, message, EMAIL_SENDER, primary_recipient, cc_recipients, html=html)
             if success:
                 logging.info(f"Email sent for complaint {complain_details['complain_id']} to {len(unique_emails)} recipients")
                 logging.info(f"Primary recipient: {primary_recipient[0]}")
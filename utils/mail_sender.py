@@ -0,0 +1,265 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+from typing import Dict, List, Optional, Any
+import aiosmtplib
+from mail_config import conf
+from metrics import observe_email
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Authenticated SMTP connections kept open, which also caps concurrent sends
+MAIL_POOL_SIZE = int(os.getenv('MAIL_POOL_SIZE', 4))
+# Idle connections older than this (seconds) are closed instead of reused;
+# keep it below the server's idle timeout
+MAIL_CONNECTION_MAX_IDLE = float(os.getenv('MAIL_CONNECTION_MAX_IDLE', 60))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 4))
+# Seconds before the first retry; doubles on every further attempt
+MAIL_RETRY_BACKOFF = float(os.getenv('MAIL_RETRY_BACKOFF', 2))
+# Seconds a caller of send() waits for the message to go out, retries included
+MAIL_SEND_TIMEOUT = float(os.getenv('MAIL_SEND_TIMEOUT', 120))
+
+# Failures worth retrying: dropped connections, timeouts and 4xx replies
+TRANSIENT_SMTP_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= r.code < 500 for r in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    return isinstance(error, TRANSIENT_SMTP_ERRORS)
+
+
+def build_message(subject: str, body: str, to: List[str], cc: List[str] = None,
+                  html: Optional[str] = None, from_: Optional[str] = None) -> EmailMessage:
+    """Build a plain-text (optionally multipart HTML) message"""
+    message = EmailMessage()
+    message['From'] = formataddr((conf.MAIL_FROM_NAME or '', from_ or conf.MAIL_FROM))
+    message['To'] = ', '.join(to)
+    if cc:
+        message['Cc'] = ', '.join(cc)
+    message['Subject'] = subject
+    message['Message-ID'] = make_msgid(domain=(from_ or conf.MAIL_FROM).split('@')[-1])
+    message.set_content(body)
+    if html:
+        message.add_alternative(html, subtype='html')
+    return message
+
+
+class SMTPConnectionPool:
+    """Pool of connected, authenticated aiosmtplib clients
+
+    Must only be used from the mail sender's event loop.
+    """
+
+    def __init__(self, size: int = MAIL_POOL_SIZE, max_idle: float = MAIL_CONNECTION_MAX_IDLE):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle: List[tuple] = []
+        self._slots = asyncio.Semaphore(size)
+        self.in_use = 0
+        self.opened = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            use_tls=conf.MAIL_SSL_TLS,
+            start_tls=conf.MAIL_STARTTLS,
+            validate_certs=conf.VALIDATE_CERTS,
+            timeout=conf.TIMEOUT,
+            local_hostname=conf.LOCAL_HOSTNAME,
+        )
+        await client.connect()
+        try:
+            if conf.USE_CREDENTIALS:
+                await client.login(conf.MAIL_USERNAME, conf.MAIL_PASSWORD.get_secret_value())
+        except Exception:
+            client.close()
+            raise
+        self.opened += 1
+        logger.info(f"Opened SMTP connection to {conf.MAIL_SERVER}:{conf.MAIL_PORT}")
+        return client
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        """Wait for a free slot and return a ready connection"""
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                client, idle_since = self._idle.pop()
+                if client.is_connected and time.monotonic() - idle_since < self.max_idle:
+                    self.in_use += 1
+                    return client
+                await self._close(client)
+            client = await self._connect()
+            self.in_use += 1
+            return client
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def release(self, client: aiosmtplib.SMTP, discard: bool = False):
+        """Return a connection; discard it if it may be in a bad state"""
+        self.in_use -= 1
+        try:
+            if discard or not client.is_connected:
+                await self._close(client)
+            else:
+                self._idle.append((client, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    async def _close(self, client: aiosmtplib.SMTP):
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+    async def close(self):
+        while self._idle:
+            client, _ = self._idle.pop()
+            await self._close(client)
+
+
+class MailSender:
+    """Sends mail from one background event loop over pooled SMTP connections"""
+
+    def __init__(self, pool_size: int = MAIL_POOL_SIZE, max_attempts: int = MAIL_MAX_ATTEMPTS,
+                 retry_backoff: float = MAIL_RETRY_BACKOFF):
+        self.pool_size = pool_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[SMTPConnectionPool] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.pending = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            ready = threading.Event()
+            self._loop = asyncio.new_event_loop()
+
+            def run():
+                asyncio.set_event_loop(self._loop)
+                self._pool = SMTPConnectionPool(self.pool_size)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="MailSender", daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"Mail sender started with {self.pool_size} SMTP connections")
+
+    def stop(self, timeout: float = 10):
+        with self._lock:
+            if not self._thread:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._pool.close(), self._loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Error closing SMTP connections: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop.close()
+            self._thread = None
+            self._loop = None
+
+    async def _send(self, message: EmailMessage):
+        attempt = 0
+        while True:
+            attempt += 1
+            client = None
+            discard = False
+            try:
+                # Connect, TLS and login failures are retried like send failures
+                client = await self._pool.acquire()
+                await client.send_message(message)
+                return
+            except Exception as e:
+                # A failed transaction can leave the session mid-command
+                discard = True
+                if attempt >= self.max_attempts or not _is_transient(e):
+                    raise
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                with self._stats_lock:
+                    self.retries += 1
+                logger.warning(f"Sending '{message['Subject']}' failed (attempt {attempt}), retrying in {delay}s: {e!r}")
+            finally:
+                if client is not None:
+                    await self._pool.release(client, discard=discard)
+            await asyncio.sleep(delay)
+
+    async def _send_counted(self, message: EmailMessage):
+        start = time.perf_counter()
+        try:
+            await self._send(message)
+            with self._stats_lock:
+                self.sent += 1
+            observe_email(time.perf_counter() - start, 'sent')
+        except Exception:
+            with self._stats_lock:
+                self.failed += 1
+            observe_email(time.perf_counter() - start, 'failed')
+            raise
+        finally:
+            with self._stats_lock:
+                self.pending -= 1
+
+    def submit(self, message: EmailMessage):
+        """Queue a message; returns a concurrent.futures.Future"""
+        self.start()
+        with self._stats_lock:
+            self.pending += 1
+        return asyncio.run_coroutine_threadsafe(self._send_counted(message), self._loop)
+
+    def send(self, message: EmailMessage, timeout: float = MAIL_SEND_TIMEOUT):
+        """Send a message, blocking until it is accepted; raises on failure"""
+        self.submit(message).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Delivery counters and connection usage"""
+        with self._stats_lock:
+            stats = {
+                'sent': self.sent,
+                'failed': self.failed,
+                'retries': self.retries,
+                'pending': self.pending,
+                'pool_size': self.pool_size,
+            }
+        if self._pool:
+            stats.update(in_use=self._pool.in_use, idle=len(self._pool._idle), opened=self._pool.opened)
+        return stats
+
+
+mail_sender = MailSender()
+
+
+def get_mail_sender_stats() -> Dict[str, Any]:
+    """Get mail sender metrics"""
+    return mail_sender.stats()
+
+
+def stop_mail_sender():
+    """Close pooled SMTP connections and stop the mail loop"""
+    mail_sender.stop()
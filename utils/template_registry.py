@@ -0,0 +1,76 @@
+import os
+import logging
+import tempfile
+from typing import Dict, Optional, Tuple, Any, Iterable
+from jinja2 import (
+    Environment, ChoiceLoader, FileSystemLoader, DictLoader, FileSystemBytecodeCache,
+    TemplateNotFound, select_autoescape
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same folder fastapi-mail is configured with in mail_config.py
+TEMPLATE_FOLDER = os.getenv('TEMPLATE_FOLDER', os.path.join(os.getcwd(), 'templates'))
+# Re-read a template when its file's mtime changes (one stat per render)
+TEMPLATE_AUTO_RELOAD = os.getenv('TEMPLATE_AUTO_RELOAD', 'true').lower() == 'true'
+# Compiled templates are cached here so a restart skips parsing/compiling
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv(
+    'TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'rail_sathi_template_cache')
+)
+
+
+class TemplateRegistry:
+    """Compiled jinja2 templates from TEMPLATE_FOLDER with in-code fallbacks
+
+    `<name>.txt` is the plain-text variant of a template and `<name>.html`
+    its optional HTML variant; HTML is autoescaped, text is not.
+    """
+
+    def __init__(self, folder: str = TEMPLATE_FOLDER, auto_reload: bool = TEMPLATE_AUTO_RELOAD,
+                 bytecode_cache_dir: Optional[str] = TEMPLATE_BYTECODE_CACHE_DIR):
+        self.folder = folder
+        self._fallbacks: Dict[str, str] = {}
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            try:
+                os.makedirs(bytecode_cache_dir, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+            except OSError as e:
+                logger.warning(f"Template bytecode cache disabled: {e}")
+        self.env = Environment(
+            # Files win over fallbacks; DictLoader sees fallbacks registered later
+            loader=ChoiceLoader([FileSystemLoader(folder), DictLoader(self._fallbacks)]),
+            autoescape=select_autoescape(['html', 'htm', 'xml'], default_for_string=False, default=False),
+            auto_reload=auto_reload,
+            bytecode_cache=bytecode_cache,
+        )
+
+    def register_fallback(self, name: str, source: str):
+        """Template source used when `name` is missing from the folder"""
+        self._fallbacks[name] = source
+
+    def render(self, name: str, context: Dict[str, Any]) -> str:
+        """Render a template by file name"""
+        return self.env.get_template(name).render(context)
+
+    def render_variants(self, base_name: str, context: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """Render the text variant and, if one exists, the HTML variant"""
+        text = self.render(f"{base_name}.txt", context)
+        try:
+            html = self.render(f"{base_name}.html", context)
+        except TemplateNotFound:
+            html = None
+        return text, html
+
+    def warm(self, names: Iterable[str]):
+        """Compile templates ahead of the first render"""
+        for name in names:
+            try:
+                self.env.get_template(name)
+            except TemplateNotFound:
+                pass
+
+
+template_registry = TemplateRegistry()